@@ -1,12 +1,16 @@
 from dataclasses import dataclass
-from typing import List, Dict, Callable, Tuple
-from collections import defaultdict
+from typing import List, Dict, Callable, Tuple, Optional, Union
 import networkx as nx
-import weakref
+import time
 from priority_queue import PriorityQueue
 
-from algorithms.inner_types import NodeId, EdgeId, Cost, EdgeLabel, EdgeStatus, EdgeLabelIdx
-from algorithms.utils import osm_to_pointll
+from algorithms.inner_types import NodeId, Cost, EdgeLabelIdx, EdgeLocation, SearchBudget, BudgetExceeded
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.label_store import EdgeLabelStore, EdgeStatusStore
+from algorithms.workspace import SearchWorkspace
+from algorithms.relaxation import Heuristic, Point, great_circle_heuristic, landmark_heuristic, relax, \
+    search_point, seed_edges, direct_cost, point_heuristic
+from algorithms.landmarks import Landmarks, usable_landmarks
 
 
 @dataclass
@@ -17,24 +21,41 @@ class BestPath(object):
 
 @dataclass
 class AStar(object):
-    _edge_labels: List[EdgeLabel]
-    _destinations: Dict[EdgeId, Cost]
+    _edge_labels: EdgeLabelStore
+    # edge id -> length of the out edges of the destination
+    _destinations: Dict[int, float]
     _adjacency_list: PriorityQueue
-    _edges_status: Dict[EdgeId, EdgeStatus]
-    _orig: NodeId = -1
-    _dest: NodeId = - 1
+    # created on the first origin, when the graph is known
+    _edges_status: EdgeStatusStore
+    # dense node indices, or EdgeLocations
+    _orig: Union[int, EdgeLocation] = -1
+    _dest: Union[int, EdgeLocation] = - 1
     _cost_factor: float = 0.4
-    _best_path: BestPath = BestPath(-1, Cost(0, 0))
+    # set by init(), a default instance would be shared by all the searches
+    _best_path: BestPath = None
     _speed: float = 1.4
+    _queue_backend: object = 'heap'
+    _graph: CompiledGraph = None
+    # the buffers are borrowed from the workspace, init() gets them back empty
+    _workspace: SearchWorkspace = None
+    # target -> heuristic
+    _heuristics: Dict[NodeId, Optional[Heuristic]] = None
+    # when given on a symmetric graph, the ALT potential replaces the great circle heuristic and _cost_factor is unused
+    _landmarks: Optional[Landmarks] = None
 
     def init(self):
-        self._edge_labels = []
-        self._destinations = defaultdict(Cost)
-        self._adjacency_list = PriorityQueue()
-        self._edges_status = defaultdict(EdgeStatus)
+        self._edge_labels = self._workspace.labels()
+        self._destinations = {}
+        self._adjacency_list = self._workspace.queue(backend=self._queue_backend)
+        self._edges_status = None
         self._best_path = BestPath(-1, Cost(0, 0))
+        self._heuristics = {}
 
-    def __init__(self, speed=1.4, cost_factor=0.4):
+    def __init__(self, speed=1.4, cost_factor=0.4, queue_backend='heap', workspace: Optional[SearchWorkspace] = None,
+                 landmarks: Optional[Landmarks] = None):
+        self._queue_backend = queue_backend
+        self._landmarks = landmarks
+        self._workspace = workspace if workspace is not None else SearchWorkspace()
         self.init()
         self._speed = speed
         self._cost_factor = cost_factor
@@ -42,145 +63,97 @@ class AStar(object):
     def _get_edge_cost(self, label):
         return self._edge_labels[label]
 
-    def _get_edge_status(self, edge_id: EdgeId) -> EdgeStatus:
-        s = self._edges_status.get(edge_id)
-        if not s:
-            return self._edges_status[edge_id].set_unreached()
-        return s
-
-    def _get_heuristic_cost(self, g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId) -> float:
-        if self._cost_factor == 0 or end_node is None:
-            return 0
-        start_ll = osm_to_pointll(g, start_node)
-        end_ll = osm_to_pointll(g, end_node)
-        return start_ll.distance_to(end_ll) * self._cost_factor
-
-    def expand_forward(self, g, node, pred_idx, dest):
-
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._get_edge_status(EdgeId(node, end_node))
-
-            if edge_status.is_permanent():
-                continue
-
-            pred = self._edge_labels[pred_idx]
-
-            new_cost = pred.cost + Cost(edge['length'], edge['length'] / self._speed)
-
-            edge_id = EdgeId(node, end_node)
-
-            d = self._destinations.get(edge_id)
-            if d is not None:
-                if self._best_path.edge_label_index is -1 or new_cost < self._best_path.cost:
-                    self._best_path.edge_label_index = edge_status.edge_label_index if edge_status.is_temporary() \
-                                                                              else len(self._edge_labels)
-                    self._best_path.cost = new_cost
-
-            sort_cost = new_cost.cost + self._get_heuristic_cost(g, end_node, self._dest)
-
-            # the edge has been visited
-            if edge_status.is_temporary():
-                lab = weakref.proxy(self._edge_labels[edge_status.edge_label_index])
-                #   Edge:
-                #             4242   -------------  4141
-                #              start       ->        end
-                #                         or
-                #               end        <-       start
-
-                # the edge may have been visited either from its start or end,
-                # let's find out in this case which one is "cheaper"
-
-                # OK, we are visiting the edge at the same direction of last visit, nothing
-                # to be done
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list.insert(new_key=sort_cost,
-                                                    item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-
-                # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length']):
-                        self._adjacency_list.insert(new_key=sort_cost,
-                                                    item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-
-                continue
-
-            idx = len(self._edge_labels)
-            self._edge_labels.append(EdgeLabel(new_cost,
-                                               sort_cost,
-                                               edge_id,
-                                               pred_idx,
-                                               end_node))
-
-            self._edges_status[edge_id] = EdgeStatus(idx).set_temporary()
-
-            self._adjacency_list.insert(sort_cost, idx)
+    def _get_heuristic(self, g: CompiledGraph, target: Union[int, EdgeLocation, None]) -> Optional[Heuristic]:
+        # built once per target and query
+        if target not in self._heuristics:
+            landmarks = usable_landmarks(g, self._landmarks)
+            self._heuristics[target] = point_heuristic(
+                lambda node: landmark_heuristic(landmarks, node) if landmarks is not None
+                else great_circle_heuristic(g, node, self._cost_factor), target)
+        return self._heuristics[target]
+
+    def _reach_destination(self, edge: int, new_cost: float, new_secs: float, init_cost: float, init_secs: float):
+        if self._best_path.edge_label_index == -1 or new_cost < self._best_path.cost.cost:
+            self._best_path.edge_label_index = self._edges_status.label_index[edge] \
+                if self._edges_status.is_temporary(edge) else len(self._edge_labels)
+            self._best_path.cost = Cost(new_cost, new_secs, init_cost, init_secs)
+
+    def expand_forward(self, g: CompiledGraph, node, pred_idx, dest):
+        relax(g, node, pred_idx, self._edge_labels, self._edges_status, self._adjacency_list, self._speed,
+              self._get_heuristic(g, self._dest), self._destinations, self._reach_destination)
 
     def make_osm_path(self):
+        return self._graph.to_osm_path(self._label_path(self._best_path.edge_label_index)), \
+            self._best_path.cost.secs
+
+    def _label_path(self, edge_label_idx: int) -> List[int]:
+        # the nodes from the origin to the end node of the label, following the predecessors
         res = []
+        labels = self._edge_labels
+        res.append(labels.end_node[edge_label_idx])
 
-        edge_label_idx = self._best_path.edge_label_index
-        edge_label = self._edge_labels[edge_label_idx]
-        res.append(edge_label.end_node)
+        while not labels.is_origin(edge_label_idx):
+            edge_label_idx = labels.pred_idx[edge_label_idx]
+            res.append(labels.end_node[edge_label_idx])
 
-        while not edge_label.is_origin:
-            edge_label_idx = edge_label.pred_idx
-            edge_label = self._edge_labels[edge_label_idx]
-            res.append(edge_label.end_node)
+        # a path from an EdgeLocation starts at the first node it reaches
+        if not isinstance(self._orig, EdgeLocation):
+            res.append(labels.start[edge_label_idx])
 
-        res.append(edge_label.edge_id.start)
+        return res[::-1]
 
-        res = res[::-1]
-        return res, self._best_path.cost.secs
+    def init_origin(self, g, orig: Point, init_secs=0, init_cost=0):
+        g = self._graph = as_compiled(g)
+        orig = search_point(g, orig)
+        if self._edges_status is None:
+            self._edges_status = self._workspace.status('edges', g.undirected_edge_count)
 
-    def init_origin(self, g, orig, init_secs=0, init_cost=0):
+        heuristic = self._get_heuristic(g, self._dest)
 
         # init origin
-        for end_node in g.adj[orig]:
-            edge = g.adj[orig][end_node][0]
-
-            secs = edge['length'] / self._speed + init_secs
-            cost = edge['length'] + init_cost
-            sort_cost = cost + self._get_heuristic_cost(g, end_node, self._dest)
-
-            idx = len(self._edge_labels)
-            self._edge_labels.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                               sort_cost,
-                                               EdgeId(orig, end_node),
-                                               -1,
-                                               end_node,
-                                               True))
+        for start, end_node, length, edge in seed_edges(g, orig):
+            secs = length / self._speed + init_secs
+            cost = length + init_cost
+            sort_cost = cost + heuristic(end_node) if heuristic is not None else cost
+
+            idx = self._edge_labels.append(cost, secs, sort_cost, start, end_node, edge, -1, init_cost, init_secs,
+                                           is_origin=True)
             self._adjacency_list.insert(sort_cost, idx)
-            self._edges_status[EdgeId(orig, end_node)] = EdgeStatus(idx).set_temporary()
+            self._edges_status.set_temporary(edge, idx)
 
     def get_best_path(self,
                       g: nx.MultiDiGraph,
-                      orig: NodeId,
-                      dest: NodeId,
-                      callback: Callable=lambda *args, **kwargs: None) -> Tuple[List[NodeId], float]:
-
-        self._orig = orig
-        self._dest = dest
+                      orig: Point,
+                      dest: Point,
+                      callback: Callable=lambda *args, **kwargs: None,
+                      budget: Optional[SearchBudget] = None) -> Union[Tuple[List[NodeId], float], BudgetExceeded]:
+        """
+        The nodes of the shortest path from orig to dest and its seconds. orig and dest are osm ids or
+        EdgeLocations: the path then starts (ends) with the first (last) node it goes through, the seconds count
+        the parts of their edges.
+        """
+        graph = as_compiled(g)
+        self._orig = search_point(graph, orig)
+        self._dest = search_point(graph, dest)
+
+        direct = direct_cost(self._orig, self._dest)
+        if direct is not None:
+            return [], direct / self._speed
 
         self.init()
 
-        self.init_origin(g, orig)
+        self.init_origin(graph, orig)
+        if isinstance(self._dest, EdgeLocation):
+            return self._run_to_location(graph, callback, budget)
+        orig, dest = self._orig, self._dest
 
         # init destination
-        for end_node in g.adj[dest]:
-            edge = g.adj[dest][end_node][0]
-            self._destinations[EdgeId(dest, end_node)] = edge['length']
+        for end_node, length, edge in graph.adjacent(dest):
+            self._destinations[edge] = length
 
         i = 0
         a = 0
+        start = time.monotonic()
         # begin search
         while True:
             if i % 200 == 0:
@@ -188,24 +161,72 @@ class AStar(object):
                 a += 1
             i += 1
 
-            current_labels = len(self._edge_labels)
-
-            if current_labels > PriorityQueue.QUEUE_MAX_SIZE:
-                return []
+            if budget is not None:
+                exceeded = budget.check(len(self._edge_labels), i - 1, start)
+                if exceeded is not None:
+                    return exceeded
 
+            if not len(self._adjacency_list):
+                raise nx.NetworkXNoPath('no path to {}'.format(dest))
             _, pred_index = self._adjacency_list.pop()
-            pred_edge_label = self._edge_labels[pred_index]
+            pred_edge = self._edge_labels.edge[pred_index]
 
-            # Do we touch the destination?
-            d = self._destinations.get(pred_edge_label.edge_id)
-            if d:
-                if self._best_path.edge_label_index is -1:
+            # Do we touch the destination? A seed from an EdgeLocation may leave it behind on its edge
+            d = self._destinations.get(pred_edge)
+            if d and (not self._edge_labels.is_origin(pred_index) or self._edge_labels.end_node[pred_index] == dest):
+                if self._best_path.edge_label_index == -1:
                     self._best_path.edge_label_index = pred_index
-                    self._best_path.cost = pred_edge_label.cost
+                    self._best_path.cost = self._edge_labels.get_cost(pred_index)
 
                 return self.make_osm_path()
 
-            if not pred_edge_label.is_origin:
-                self._edges_status[pred_edge_label.edge_id].set_permanent()
+            if not self._edge_labels.is_origin(pred_index):
+                self._edges_status.set_permanent(pred_edge)
+
+            self.expand_forward(graph, self._edge_labels.end_node[pred_index], pred_index, dest)
+
+    def _run_to_location(self, graph: CompiledGraph, callback: Callable,
+                         budget: Optional[SearchBudget]) -> Union[Tuple[List[NodeId], float], BudgetExceeded]:
+        # the search to an EdgeLocation: the label reaching an end of its edge gives a path to it through the rest
+        # of the edge, the best one is known once the labels left cost more
+        dest = self._dest
+        labels = self._edge_labels
+        rests = {dest.source: dest.fraction * dest.length}
+        if dest.reversible:
+            rests[dest.target] = (1 - dest.fraction) * dest.length
+
+        i = 0
+        a = 0
+        start = time.monotonic()
+        while len(self._adjacency_list):
+            if i % 200 == 0:
+                callback(graph, self._orig, dest, self._edges_status, self._edge_labels, str(a).zfill(4))
+                a += 1
+            i += 1
+
+            if budget is not None:
+                exceeded = budget.check(len(labels), i - 1, start)
+                if exceeded is not None:
+                    return exceeded
+
+            sort_cost, pred_index = self._adjacency_list.pop()
+            if self._best_path.edge_label_index != -1 and sort_cost >= self._best_path.cost.cost:
+                break
+
+            end_node = labels.end_node[pred_index]
+            rest = rests.get(end_node)
+            if rest is not None:
+                cost = labels.cost[pred_index] + rest
+                if self._best_path.edge_label_index == -1 or cost < self._best_path.cost.cost:
+                    self._best_path = BestPath(pred_index, Cost(cost, labels.secs[pred_index] + rest / self._speed,
+                                                                labels.init_cost[pred_index],
+                                                                labels.init_secs[pred_index]))
+
+            if not labels.is_origin(pred_index):
+                self._edges_status.set_permanent(labels.edge[pred_index])
+
+            self.expand_forward(graph, end_node, pred_index, dest)
 
-            self.expand_forward(g, pred_edge_label.end_node, pred_index, dest)
+        if self._best_path.edge_label_index == -1:
+            raise nx.NetworkXNoPath('no path to {}'.format(dest))
+        return self.make_osm_path()
@@ -0,0 +1,131 @@
+from typing import List, Dict, Tuple, Optional, Union
+import networkx as nx
+
+from algorithms.inner_types import NodeId
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.contraction import ContractionHierarchy, get_hierarchy
+from algorithms.workspace import SearchWorkspace
+
+
+class ContractionHierarchyQuery(object):
+    """
+    Shortest path on a contraction hierarchy, a drop-in for DoubleAstar.get_best_path
+
+    Both searches are plain Dijkstra over the nodes going up the hierarchy, the forward one from the origin on
+    the up arcs and the backward one from the destination on the down arcs. A direction is done once the smallest
+    key of its queue reaches the best connection found, the result is exact.
+
+    Stall on demand: a node reached cheaper from a higher node, through one of the arcs the search doesn't follow,
+    isn't on a shortest path going up and isn't expanded.
+    """
+
+    def __init__(self, speed=1.4, hierarchy: Optional[ContractionHierarchy] = None, queue_backend='heap',
+                 workspace: Optional[SearchWorkspace] = None):
+        self._speed = speed
+        self._hierarchy = hierarchy
+        self._queue_backend = queue_backend
+        self._workspace = workspace if workspace is not None else SearchWorkspace()
+        self._graph: CompiledGraph = None
+        self.init()
+
+    def init(self):
+        self._queue_forward = self._workspace.queue('forward', self._queue_backend)
+        self._queue_backward = self._workspace.queue('backward', self._queue_backend)
+        # node -> cost
+        self._dist_forward: Dict[int, float] = {}
+        self._dist_backward: Dict[int, float] = {}
+        # node -> (predecessor, middle of the arc from it)
+        self._parent_forward: Dict[int, Tuple[int, int]] = {}
+        self._parent_backward: Dict[int, Tuple[int, int]] = {}
+        self._best_cost = float('inf')
+        self._meeting_node = -1
+
+    def _get_hierarchy(self, g: CompiledGraph) -> ContractionHierarchy:
+        if self._hierarchy is None:
+            self._hierarchy = get_hierarchy(g)
+        return self._hierarchy
+
+    def _settle(self, node: int, cost: float, offsets: List[int], ends: List[int], weights: List[float],
+                middles: List[int], stall_offsets: List[int], stall_ends: List[int], stall_weights: List[float],
+                queue, dist: Dict[int, float], parent: Dict[int, Tuple[int, int]], other_dist: Dict[int, float]):
+        other = other_dist.get(node)
+        if other is not None and cost + other < self._best_cost:
+            self._best_cost = cost + other
+            self._meeting_node = node
+
+        for i in range(stall_offsets[node], stall_offsets[node + 1]):
+            higher = dist.get(stall_ends[i])
+            if higher is not None and higher + stall_weights[i] < cost:
+                return
+
+        for i in range(offsets[node], offsets[node + 1]):
+            end_node = ends[i]
+            new_cost = cost + weights[i]
+            old_cost = dist.get(end_node)
+            if old_cost is None or new_cost < old_cost:
+                dist[end_node] = new_cost
+                parent[end_node] = (node, middles[i])
+                queue.insert(new_cost, end_node)
+
+    def make_osm_path(self) -> Tuple[List[NodeId], float]:
+        hierarchy = self._hierarchy
+        node = self._meeting_node
+
+        # origin -> meeting node, the arcs are met backward
+        arcs = []
+        while node in self._parent_forward:
+            pred, middle = self._parent_forward[node]
+            arcs.append((pred, node, middle))
+            node = pred
+        res = [node]
+        for start, end, middle in reversed(arcs):
+            hierarchy.unpack(start, end, middle, res)
+
+        # meeting node -> destination
+        node = self._meeting_node
+        while node in self._parent_backward:
+            succ, middle = self._parent_backward[node]
+            hierarchy.unpack(node, succ, middle, res)
+            node = succ
+
+        return self._graph.to_osm_path(res), self._best_cost / self._speed
+
+    def get_best_path(self, g: Union[nx.MultiDiGraph, CompiledGraph], orig: NodeId,
+                      dest: NodeId) -> Tuple[List[NodeId], float]:
+        """
+        The osm nodes of the shortest path and its duration in seconds, ([], inf) when dest can't be reached
+        """
+        self.init()
+        graph = self._graph = as_compiled(g)
+        lists = self._get_hierarchy(graph).lists()
+        orig, dest = graph.node_index(orig), graph.node_index(dest)
+
+        up = lists['up_offsets'], lists['up_targets'], lists['up_weights']
+        down = lists['down_offsets'], lists['down_sources'], lists['down_weights']
+        forward = (*up, lists['up_middles'], *down,
+                   self._queue_forward, self._dist_forward, self._parent_forward, self._dist_backward)
+        backward = (*down, lists['down_middles'], *up,
+                    self._queue_backward, self._dist_backward, self._parent_backward, self._dist_forward)
+
+        self._dist_forward[orig] = 0.
+        self._queue_forward.insert(0., orig)
+        self._dist_backward[dest] = 0.
+        self._queue_backward.insert(0., dest)
+
+        inf = float('inf')
+        while True:
+            forward_key, _ = self._queue_forward.peak()
+            backward_key, _ = self._queue_backward.peak()
+            forward_key = inf if forward_key is None else forward_key
+            backward_key = inf if backward_key is None else backward_key
+
+            if min(forward_key, backward_key) >= self._best_cost:
+                break
+
+            direction = forward if forward_key <= backward_key else backward
+            cost, node = direction[7].pop()
+            self._settle(node, cost, *direction)
+
+        if self._meeting_node == -1:
+            return [], inf
+        return self.make_osm_path()
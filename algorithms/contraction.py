@@ -0,0 +1,271 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+import heapq
+
+import numpy as np
+
+from algorithms.graph import CompiledGraph
+
+# Contraction hierarchies, see Geisberger et al., "Contraction hierarchies: faster and simpler hierarchical
+# routing in road networks".
+#
+# The nodes are contracted one by one, the least important first. Contracting v removes it from the graph and
+# adds a shortcut u -> w of length d(u, v) + d(v, w) for every pair of its neighbours unless a witness search
+# finds a path from u to w as short that avoids v. The rank of a node is its contraction order.
+# Every arc, original or shortcut, is stored at its lower ranked end: a query only goes up the hierarchy from
+# both of its ends and the two searches meet on the highest node of the shortest path.
+#
+# A shortcut remembers the node it bypasses (its middle), -1 for an original arc, to be unpacked into the
+# original path.
+
+ARTEFACT_NAME_PREFIX = 'ch_'
+ARTEFACT_NAMES = ('rank', 'up_offsets', 'up_targets', 'up_weights', 'up_middles',
+                  'down_offsets', 'down_sources', 'down_weights', 'down_middles')
+
+# end node -> (length, middle)
+Arcs = Dict[int, Tuple[float, int]]
+
+
+@dataclass
+class ContractionHierarchy(object):
+    """
+    The up arcs of node u are the arcs u -> up_targets[i] for i in [up_offsets[u], up_offsets[u + 1]),
+    the down arcs of node v are the arcs down_sources[i] -> v, both going to higher ranked nodes.
+    """
+    rank: np.ndarray
+    up_offsets: np.ndarray
+    up_targets: np.ndarray
+    up_weights: np.ndarray
+    up_middles: np.ndarray
+    down_offsets: np.ndarray
+    down_sources: np.ndarray
+    down_weights: np.ndarray
+    down_middles: np.ndarray
+    # memoryviews of the arrays above: the query reads them one item at a time and gets python scalars, almost as
+    # fast as from lists, without copying the arrays out of the graph file mapping shared by the processes
+    _lists: Optional[Dict[str, memoryview]] = field(default=None, init=False, repr=False, compare=False)
+
+    @property
+    def shortcut_count(self) -> int:
+        return int(np.count_nonzero(np.asarray(self.up_middles) >= 0)
+                   + np.count_nonzero(np.asarray(self.down_middles) >= 0))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in ARTEFACT_NAMES)
+
+    def lists(self) -> Dict[str, memoryview]:
+        if self._lists is None:
+            self._lists = {name: memoryview(np.ascontiguousarray(getattr(self, name))) for name in ARTEFACT_NAMES}
+        return self._lists
+
+    def arc_middle(self, start: int, end: int) -> int:
+        """
+        The middle of the arc start -> end, -1 for an original arc
+        """
+        lists = self.lists()
+        if lists['rank'][start] < lists['rank'][end]:
+            first, last = lists['up_offsets'][start], lists['up_offsets'][start + 1]
+            ends, middles, node = lists['up_targets'], lists['up_middles'], end
+        else:
+            first, last = lists['down_offsets'][end], lists['down_offsets'][end + 1]
+            ends, middles, node = lists['down_sources'], lists['down_middles'], start
+        for i in range(first, last):
+            if ends[i] == node:
+                return middles[i]
+        raise ValueError('no arc {} -> {}'.format(start, end))
+
+    def unpack(self, start: int, end: int, middle: int, path: List[int]):
+        """
+        Append to path the nodes of the original path of the arc start -> end, end included and start excluded
+        """
+        stack = [(start, end, middle)]
+        while stack:
+            start, end, middle = stack.pop()
+            if middle < 0:
+                path.append(end)
+                continue
+            # the first half is popped first
+            stack.append((middle, end, self.arc_middle(middle, end)))
+            stack.append((start, middle, self.arc_middle(start, middle)))
+
+    def to_artefacts(self) -> Dict[str, np.ndarray]:
+        return {ARTEFACT_NAME_PREFIX + name: getattr(self, name) for name in ARTEFACT_NAMES}
+
+    @classmethod
+    def from_graph(cls, g: CompiledGraph) -> Optional['ContractionHierarchy']:
+        """
+        The hierarchy stored in the artefacts of g, None when it has none
+        """
+        if ARTEFACT_NAME_PREFIX + 'rank' not in g.artefacts:
+            return None
+        return cls(**{name: g.artefacts[ARTEFACT_NAME_PREFIX + name] for name in ARTEFACT_NAMES})
+
+
+def _witness_distances(out_arcs: List[Arcs], source: int, excluded: int, limit: float,
+                       max_settled: int) -> Dict[int, float]:
+    # Dijkstra from source avoiding excluded, stopped at limit or after max_settled nodes. The distances are
+    # upper bounds of the ones in the remaining graph: a stopped search only adds shortcuts, it's never wrong.
+    inf = float('inf')
+    dist = {source: 0.}
+    heap = [(0., source)]
+    settled = 0
+    while heap:
+        d, node = heapq.heappop(heap)
+        if d > dist[node]:
+            continue
+        if d > limit or settled == max_settled:
+            break
+        settled += 1
+        for end_node, (length, _) in out_arcs[node].items():
+            if end_node == excluded:
+                continue
+            new_dist = d + length
+            if new_dist < dist.get(end_node, inf):
+                dist[end_node] = new_dist
+                heapq.heappush(heap, (new_dist, end_node))
+    return dist
+
+
+def _shortcuts(out_arcs: List[Arcs], in_arcs: List[Arcs], node: int,
+               max_settled: int) -> List[Tuple[int, int, float]]:
+    # (start, end, length) of the shortcuts the contraction of node needs
+    ins, outs = in_arcs[node], out_arcs[node]
+    if not ins or not outs:
+        return []
+    inf = float('inf')
+    max_out = max(length for length, _ in outs.values())
+    shortcuts = []
+    for start, (in_length, _) in ins.items():
+        dist = _witness_distances(out_arcs, start, node, in_length + max_out, max_settled)
+        for end, (out_length, _) in outs.items():
+            if end != start and dist.get(end, inf) > in_length + out_length:
+                shortcuts.append((start, end, in_length + out_length))
+    return shortcuts
+
+
+def build_contraction_hierarchy(g: CompiledGraph, max_settled: int = 50) -> ContractionHierarchy:
+    """
+    Contract the nodes of g by increasing edge difference (the shortcuts added minus the arcs removed) plus
+    the number of their neighbours already contracted, which spreads the contraction over the graph.
+    The priorities are updated lazily: a node popped with a priority grown past the next one goes back.
+    """
+    n = g.node_count
+    out_arcs: List[Arcs] = [{} for _ in range(n)]
+    in_arcs: List[Arcs] = [{} for _ in range(n)]
+    offsets, targets, lengths = g.offsets.tolist(), g.targets.tolist(), np.asarray(g.lengths).tolist()
+    for node in range(n):
+        for i in range(offsets[node], offsets[node + 1]):
+            out_arcs[node][targets[i]] = (lengths[i], -1)
+            in_arcs[targets[i]][node] = (lengths[i], -1)
+
+    contracted_neighbours = [0] * n
+
+    def priority(node: int) -> int:
+        return len(_shortcuts(out_arcs, in_arcs, node, max_settled)) - len(in_arcs[node]) - len(out_arcs[node]) \
+            + contracted_neighbours[node]
+
+    priorities = [priority(node) for node in range(n)]
+    heap = [(p, node) for node, p in enumerate(priorities)]
+    heapq.heapify(heap)
+
+    rank = np.full(n, -1, dtype=np.int32)
+    # (end node, length, middle) of the arcs stored at each node
+    ups: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+    downs: List[List[Tuple[int, float, int]]] = [[] for _ in range(n)]
+    order = 0
+
+    while heap:
+        p, node = heapq.heappop(heap)
+        if rank[node] >= 0 or p != priorities[node]:
+            continue
+        shortcuts = _shortcuts(out_arcs, in_arcs, node, max_settled)
+        p = len(shortcuts) - len(in_arcs[node]) - len(out_arcs[node]) + contracted_neighbours[node]
+        if heap and p > heap[0][0]:
+            priorities[node] = p
+            heapq.heappush(heap, (p, node))
+            continue
+
+        rank[node] = order
+        order += 1
+
+        # what's left around node is of higher rank
+        ups[node] = [(end, length, middle) for end, (length, middle) in out_arcs[node].items()]
+        downs[node] = [(start, length, middle) for start, (length, middle) in in_arcs[node].items()]
+        for start in in_arcs[node]:
+            del out_arcs[start][node]
+        for end in out_arcs[node]:
+            del in_arcs[end][node]
+
+        for start, end, length in shortcuts:
+            if end not in out_arcs[start] or length < out_arcs[start][end][0]:
+                out_arcs[start][end] = (length, node)
+                in_arcs[end][start] = (length, node)
+
+        for neighbour in set(in_arcs[node]) | set(out_arcs[node]):
+            contracted_neighbours[neighbour] += 1
+            priorities[neighbour] += 1
+            heapq.heappush(heap, (priorities[neighbour], neighbour))
+        in_arcs[node] = {}
+        out_arcs[node] = {}
+
+    def to_csr(rows: List[List[Tuple[int, float, int]]]) -> Tuple[np.ndarray, ...]:
+        csr_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum([len(row) for row in rows], out=csr_offsets[1:])
+        flat = [arc for row in rows for arc in row]
+        return (csr_offsets,
+                np.array([arc[0] for arc in flat], dtype=np.int32),
+                np.array([arc[1] for arc in flat], dtype=np.float64),
+                np.array([arc[2] for arc in flat], dtype=np.int32))
+
+    up_offsets, up_targets, up_weights, up_middles = to_csr(ups)
+    down_offsets, down_sources, down_weights, down_middles = to_csr(downs)
+    return ContractionHierarchy(rank, up_offsets, up_targets, up_weights, up_middles,
+                                down_offsets, down_sources, down_weights, down_middles)
+
+
+def upward_search(hierarchy: ContractionHierarchy, origin: int, forward: bool = True,
+                  max_cost: float = float('inf')) -> Dict[int, float]:
+    """
+    Dijkstra from origin going up the hierarchy, on the up arcs or, backward, on the down arcs reversed.
+    A node reached cheaper through an arc going down is stalled (stall on demand), it keeps an upper bound of
+    its distance and isn't expanded. The search stops at max_cost.
+    """
+    lists = hierarchy.lists()
+    if forward:
+        offsets, ends, weights = lists['up_offsets'], lists['up_targets'], lists['up_weights']
+        stall_offsets, stall_ends, stall_weights = lists['down_offsets'], lists['down_sources'], lists['down_weights']
+    else:
+        offsets, ends, weights = lists['down_offsets'], lists['down_sources'], lists['down_weights']
+        stall_offsets, stall_ends, stall_weights = lists['up_offsets'], lists['up_targets'], lists['up_weights']
+    inf = float('inf')
+    dist = {origin: 0.}
+    heap = [(0., origin)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > dist[node]:
+            continue
+        if cost > max_cost:
+            break
+        if any(dist.get(stall_ends[i], inf) + stall_weights[i] < cost
+               for i in range(stall_offsets[node], stall_offsets[node + 1])):
+            continue
+        for i in range(offsets[node], offsets[node + 1]):
+            new_cost = cost + weights[i]
+            end_node = ends[i]
+            if new_cost < dist.get(end_node, inf):
+                dist[end_node] = new_cost
+                heapq.heappush(heap, (new_cost, end_node))
+    return dist
+
+
+def get_hierarchy(g: CompiledGraph) -> ContractionHierarchy:
+    """
+    The hierarchy stored with g, built on first use when there is none and kept in g.artefacts,
+    save_graph() then stores it along
+    """
+    hierarchy = ContractionHierarchy.from_graph(g)
+    if hierarchy is None:
+        hierarchy = build_contraction_hierarchy(g)
+        g.artefacts.update(hierarchy.to_artefacts())
+    return hierarchy
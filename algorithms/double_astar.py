@@ -1,291 +1,284 @@
-from dataclasses import dataclass, field
-from typing import List, Dict, Callable, Tuple
-from collections import defaultdict
+from dataclasses import dataclass
+from typing import List, Dict, Callable, Tuple, Optional, Union
 import networkx as nx
-import weakref
+import time
 from priority_queue import PriorityQueue
-from algorithms import utils
-from algorithms.inner_types import NodeId, EdgeId, Cost, EdgeLabel, EdgeStatus, EdgeLabelIdx
+from algorithms.inner_types import NodeId, EdgeLabelIdx, EdgeLocation, SearchBudget, BudgetExceeded
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.label_store import EdgeLabelStore, EdgeStatusStore
+from algorithms.workspace import SearchWorkspace
+from algorithms.relaxation import Heuristic, Point, great_circle_heuristic, landmark_heuristic, relax, \
+    search_point, reverse_point, seed_edges, direct_cost, point_heuristic
+from algorithms.landmarks import Landmarks, usable_landmarks
 
 kThresholdDelta = 200.
 
 
 @dataclass
 class BestConnection:
-    forward: EdgeId
-    backward: EdgeId
+    # the forward and backward labels where the searches meet
+    forward: EdgeLabelIdx
+    backward: EdgeLabelIdx
     cost: float
 
 
 class DoubleAstar(object):
-    _edge_labels_forward: List[EdgeLabel] = field(default_factory=list)
-    _edge_labels_backward: List[EdgeLabel] = field(default_factory=list)
+    # the per query state is set by init(), nothing mutable lives on the class
+    _edge_labels_forward: EdgeLabelStore = None
+    _edge_labels_backward: EdgeLabelStore = None
 
-    _adjacency_list_forward: PriorityQueue = PriorityQueue()
-    _adjacency_list_backward: PriorityQueue = PriorityQueue()
+    _adjacency_list_forward: PriorityQueue = None
+    _adjacency_list_backward: PriorityQueue = None
 
-    _edges_status_forward: Dict[EdgeId, EdgeStatus] = defaultdict(EdgeStatus)
-    _edges_status_backward: Dict[EdgeId, EdgeStatus] = defaultdict(EdgeStatus)
+    # created by init_forward/init_backward, when the graph is known
+    _edges_status_forward: EdgeStatusStore = None
+    _edges_status_backward: EdgeStatusStore = None
+
+    # edge -> the seed labels of an EdgeLocation on it, the two ways of the edge share its status
+    _forward_seeds: Dict[int, List[EdgeLabelIdx]] = None
+    _backward_seeds: Dict[int, List[EdgeLabelIdx]] = None
 
     _cost_factor: float = .5
-    _best_path: BestConnection = BestConnection(EdgeId(-1, -1),
-                                                EdgeId(-1, -1),
-                                                float('inf'))
+    _best_path: BestConnection = None
     _speed: float = 1.4
     _threshold: float = float('inf')
-
-    def __init__(self, speed=1.4, cost_factor=1):
+    _queue_backend: object = 'heap'
+    _graph: CompiledGraph = None
+    # the buffers are borrowed from the workspace, init() gets them back empty
+    _workspace: SearchWorkspace = None
+    # target -> heuristic
+    _heuristics: Dict[NodeId, Optional[Heuristic]] = None
+    # when given on a symmetric graph, the ALT potential replaces the great circle heuristic and _cost_factor is unused
+    _landmarks: Optional[Landmarks] = None
+
+    def __init__(self, speed=1.4, cost_factor=1, queue_backend='heap', workspace: Optional[SearchWorkspace] = None,
+                 landmarks: Optional[Landmarks] = None):
         self._speed = speed
+        self._landmarks = landmarks
         self._cost_factor = cost_factor
+        self._queue_backend = queue_backend
+        self._workspace = workspace if workspace is not None else SearchWorkspace()
+        self.init()
 
-    def _get_heuristic_cost(self, g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId) -> float:
-        if self._cost_factor == 0 or end_node is None:
-            return 0
-        start_ll = utils.osm_to_pointll(g, start_node)
-        end_ll = utils.osm_to_pointll(g, end_node)
-
-        return start_ll.distance_to(end_ll) * self._cost_factor
-
-    @staticmethod
-    def _get_edge_status_impl(container: Dict[EdgeId, EdgeStatus], edge_id: EdgeId) -> EdgeStatus:
-        s = container.get(edge_id)
-        if not s:
-            return container[edge_id].set_unreached()
-        return s
-
-    def _get_edge_status_forward(self, edge_id: EdgeId) -> EdgeStatus:
-        return self._get_edge_status_impl(self._edges_status_forward, edge_id)
-
-    def _get_edge_status_backward(self, edge_id: EdgeId) -> EdgeStatus:
-        return self._get_edge_status_impl(self._edges_status_backward, edge_id)
-
-    def init_forward(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
-        for end_node in g.adj[orig]:
-            edge = g.adj[orig][end_node][0]
-
-            secs = edge['length'] / self._speed + init_secs
-            cost = edge['length'] + init_cost
-            sort_cost = cost + self._get_heuristic_cost(g, end_node, dest)
-
-            idx = len(self._edge_labels_forward)
-            self._edge_labels_forward.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                       sort_cost,
-                                                       EdgeId(orig, end_node),
-                                                       -1,
-                                                       end_node,
-                                                       is_origin=True,
-                                                       is_destination=False))
+    def _get_heuristic(self, g: CompiledGraph, target: Union[int, EdgeLocation]) -> Optional[Heuristic]:
+        # built once per target and query
+        if target not in self._heuristics:
+            landmarks = usable_landmarks(g, self._landmarks)
+            self._heuristics[target] = point_heuristic(
+                lambda node: landmark_heuristic(landmarks, node) if landmarks is not None
+                else great_circle_heuristic(g, node, self._cost_factor), target)
+        return self._heuristics[target]
+
+    def init_forward(self, g: nx.MultiDiGraph, orig: Point, dest: Point, init_secs: float = 0, init_cost: float = 0):
+        g = self._graph = as_compiled(g)
+        orig, dest = search_point(g, orig), search_point(g, dest)
+        if self._edges_status_forward is None:
+            self._edges_status_forward = self._workspace.status('forward', g.undirected_edge_count)
+
+        heuristic = self._get_heuristic(g, dest)
+        for start, end_node, length, edge in seed_edges(g, orig):
+            secs = length / self._speed + init_secs
+            cost = length + init_cost
+            sort_cost = cost + heuristic(end_node) if heuristic is not None else cost
+
+            idx = self._edge_labels_forward.append(cost, secs, sort_cost, start, end_node, edge, -1,
+                                                   init_cost, init_secs, is_origin=True)
             self._adjacency_list_forward.insert(sort_cost, idx)
-            self._edges_status_forward[EdgeId(orig, end_node)] = EdgeStatus(idx).set_temporary()
-
-    def init_backward(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
-        for end_node in g.adj[dest]:
-            edge = g.adj[dest][end_node][0]
-
-            secs = edge['length'] / self._speed + init_secs
-            cost = edge['length'] + init_cost
-            sort_cost = cost + self._get_heuristic_cost(g, end_node, orig)
-
-            idx = len(self._edge_labels_backward)
-            self._edge_labels_backward.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                        sort_cost,
-                                                        EdgeId(dest, end_node),
-                                                        -1,
-                                                        end_node,
-                                                        is_origin=False,
-                                                        is_destination=True))
+            self._edges_status_forward.set_temporary(edge, idx)
+            if isinstance(orig, EdgeLocation):
+                self._forward_seeds.setdefault(edge, []).append(idx)
+
+    def init_backward(self, g: nx.MultiDiGraph, orig: Point, dest: Point, init_secs: float = 0, init_cost: float = 0):
+        g = self._graph = as_compiled(g)
+        orig, dest = search_point(g, orig), search_point(g, dest)
+        if self._edges_status_backward is None:
+            self._edges_status_backward = self._workspace.status('backward', g.undirected_edge_count)
+
+        # the backward search runs from dest to orig on the reversed graph
+        heuristic = self._get_heuristic(g, reverse_point(orig))
+        for start, end_node, length, edge in seed_edges(g, reverse_point(dest)):
+            secs = length / self._speed + init_secs
+            cost = length + init_cost
+            sort_cost = cost + heuristic(end_node) if heuristic is not None else cost
+
+            idx = self._edge_labels_backward.append(cost, secs, sort_cost, start, end_node, edge, -1,
+                                                    init_cost, init_secs, is_destination=True)
             self._adjacency_list_backward.insert(sort_cost, idx)
-            self._edges_status_backward[EdgeId(dest, end_node)] = EdgeStatus(idx).set_temporary()
+            self._edges_status_backward.set_temporary(edge, idx)
+            if isinstance(dest, EdgeLocation):
+                self._backward_seeds.setdefault(edge, []).append(idx)
 
     def init(self):
-        self._edge_labels_forward = []
-        self._edge_labels_backward = []
+        self._edge_labels_forward = self._workspace.labels('forward')
+        self._edge_labels_backward = self._workspace.labels('backward')
 
-        self._adjacency_list_forward = PriorityQueue()
-        self._adjacency_list_backward = PriorityQueue()
+        self._adjacency_list_forward = self._workspace.queue('forward', self._queue_backend)
+        self._adjacency_list_backward = self._workspace.queue('backward', self._queue_backend)
 
-        self._edges_status_forward.clear()
-        self._edges_status_backward.clear()
+        self._edges_status_forward = None
+        self._edges_status_backward = None
+        self._forward_seeds = {}
+        self._backward_seeds = {}
 
-        self._best_path = BestConnection(EdgeId(-1, -1),
-                                         EdgeId(-1, -1),
-                                         float('inf'))
+        self._best_path = BestConnection(-1, -1, float('inf'))
         self._threshold: float = float('inf')
+        self._heuristics = {}
 
     # forward searching reach on a edge reached by backward searching
-    def set_forward_connection(self, pred: EdgeId):
+    def set_forward_connection(self, pred: int):
 
-        edge_status_backward = self._edges_status_backward.get(pred)
-        edge_label_backward = edge_status_backward.edge_label_index
+        edge_label_backward = self._edges_status_backward.label_index[pred]
+        edge_label_forward = self._edges_status_forward.label_index[pred]
+        pred_idx_forward = self._edge_labels_forward.pred_idx[edge_label_forward]
+        if pred_idx_forward == -1:
+            # pred is an origin edge, there's no forward label before it (cost[-1] would be the last label of the
+            # store): the path is the seed then the backward label before pred, a permanent label isn't a seed
+            self._set_seed_connection(edge_label_forward, self._edge_labels_backward.pred_idx[edge_label_backward],
+                                      self._edge_labels_backward.start[edge_label_backward])
+            return
 
-        edge_status_forward = self._edges_status_forward.get(pred)
-        edge_label_forward = edge_status_forward.edge_label_index
-        pred_idx_forward = self._edge_labels_forward[edge_label_forward].pred_idx
+        c = self._edge_labels_backward.cost[edge_label_backward] + self._edge_labels_forward.cost[pred_idx_forward]
 
-        c = self._edge_labels_backward[edge_label_backward].cost \
-            + self._edge_labels_forward[pred_idx_forward].cost
-
-        if c.cost < self._best_path.cost:
-            self._best_path = BestConnection(self._edge_labels_forward[pred_idx_forward].edge_id,
-                                             self._edge_labels_backward[edge_label_backward].edge_id,
-                                             c.cost)
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(pred_idx_forward, edge_label_backward, c)
 
     # backward searching reach on a edge reached by forward searching
-    def set_backward_connection(self, pred: EdgeId):
-
-        edge_status_forward = self._edges_status_forward.get(pred)
-        edge_label_forward = edge_status_forward.edge_label_index
-
-        edge_status_backward = self._edges_status_backward.get(pred)
-        edge_label_backward = edge_status_backward.edge_label_index
-        pred_idx_backward = self._edge_labels_backward[edge_label_backward].pred_idx
-
-        c = self._edge_labels_backward[pred_idx_backward].cost \
-            + self._edge_labels_forward[edge_label_forward].cost
-
-        if c.cost < self._best_path.cost:
-            self._best_path = BestConnection(self._edge_labels_forward[edge_label_forward].edge_id,
-                                             self._edge_labels_backward[pred_idx_backward].edge_id,
-                                             c.cost)
-
-    def expand_forward(self, g: nx.MultiDiGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId):
-
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._get_edge_status_forward(EdgeId(node, end_node))
-
-            if edge_status.is_permanent():
-                continue
-
-            pred = self._edge_labels_forward[pred_idx]
-
-            new_cost = pred.cost + Cost(edge['length'], edge['length'] / self._speed)
-            edge_id = EdgeId(node, end_node)
-
-            sort_cost = new_cost.cost + self._get_heuristic_cost(g, end_node, dest)
-
-            # the edge has been visited
-            if edge_status.is_temporary():
-                lab = weakref.proxy(self._edge_labels_forward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_forward.insert(new_key=sort_cost,
-                                                            item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-
-                # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length']):
-                        self._adjacency_list_forward.insert(new_key=sort_cost,
-                                                            item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-                continue
-
-            idx = len(self._edge_labels_forward)
-            self._edge_labels_forward.append(EdgeLabel(new_cost,
-                                                       sort_cost,
-                                                       edge_id,
-                                                       pred_idx,
-                                                       end_node))
-
-            self._edges_status_forward[edge_id] = EdgeStatus(idx).set_temporary()
-            self._adjacency_list_forward.insert(sort_cost, idx)
-
-    def expand_backward(self, g, node, pred_idx, origin):
-
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._get_edge_status_backward(EdgeId(node, end_node))
-
-            if edge_status.is_permanent():
-                continue
-
-            pred = self._edge_labels_backward[pred_idx]
-
-            new_cost = pred.cost + Cost(edge['length'], edge['length'] / self._speed)
-            edge_id = EdgeId(node, end_node)
-
-            sort_cost = new_cost.cost + self._get_heuristic_cost(g, end_node, origin)
-
-            # the edge has been visited
-            if edge_status.is_temporary():
-                lab = weakref.proxy(self._edge_labels_backward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_backward.insert(new_key=sort_cost,
-                                                             item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-
-                # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length']):
-                        self._adjacency_list_backward.insert(new_key=sort_cost,
-                                                             item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-                continue
-
-            idx = len(self._edge_labels_backward)
-            self._edge_labels_backward.append(EdgeLabel(new_cost,
-                                                        sort_cost,
-                                                        edge_id,
-                                                        pred_idx,
-                                                        end_node))
-
-            self._edges_status_backward[edge_id] = EdgeStatus(idx).set_temporary()
-            self._adjacency_list_backward.insert(sort_cost, idx)
+    def set_backward_connection(self, pred: int):
+
+        edge_label_forward = self._edges_status_forward.label_index[pred]
+        edge_label_backward = self._edges_status_backward.label_index[pred]
+        pred_idx_backward = self._edge_labels_backward.pred_idx[edge_label_backward]
+        if pred_idx_backward == -1:
+            # pred is a destination edge, see set_forward_connection
+            self._set_seed_connection(self._edge_labels_forward.pred_idx[edge_label_forward], edge_label_backward,
+                                      self._edge_labels_forward.start[edge_label_forward])
+            return
+
+        c = self._edge_labels_backward.cost[pred_idx_backward] + self._edge_labels_forward.cost[edge_label_forward]
+
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(edge_label_forward, pred_idx_backward, c)
+
+    def _set_seed_connection(self, forward: EdgeLabelIdx, backward: EdgeLabelIdx, node: NodeId):
+        # forward and backward labels ending at node, one of them a seed: the searches may have reached the edge of
+        # the seed the other way
+        forward_labels, backward_labels = self._edge_labels_forward, self._edge_labels_backward
+        if forward_labels.end_node[forward] != node or backward_labels.end_node[backward] != node:
+            return
+        c = forward_labels.cost[forward] + backward_labels.cost[backward]
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(forward, backward, c)
+
+    def set_edge_connection(self, forward: EdgeLabelIdx, backward: EdgeLabelIdx):
+        # an origin and a destination seed on the same edge, never permanent: the route is the edge, as long as the
+        # seed of an EdgeLocation, else as the forward seed (the backward one is the reversed arc)
+        forward_labels, backward_labels = self._edge_labels_forward, self._edge_labels_backward
+        edge = forward_labels.edge[forward]
+        backward_location = backward in self._backward_seeds.get(edge, ())
+        if not forward_labels.is_origin(forward) or not backward_labels.is_destination(backward) or \
+           backward_labels.edge[backward] != edge or \
+           forward_labels.start[forward] != backward_labels.end_node[backward] or \
+           forward_labels.end_node[forward] != backward_labels.start[backward]:
+            return
+        if backward_location and forward in self._forward_seeds.get(edge, ()):
+            # both points on the edge, see direct_cost
+            return
+        c = forward_labels.init_cost[forward] + backward_labels.cost[backward] if backward_location else \
+            forward_labels.cost[forward] + backward_labels.init_cost[backward]
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(forward, backward, c)
+
+    # the seeds of an EdgeLocation are never permanent: a search meets them when it reaches their edge from the node
+    # they go to, the path is then the label before the edge and the seed
+    def set_forward_seed_connection(self, label: EdgeLabelIdx):
+        forward, backward = self._edge_labels_forward, self._edge_labels_backward
+        pred_idx_forward = forward.pred_idx[label]
+        if pred_idx_forward == -1:
+            for seed in self._backward_seeds[forward.edge[label]]:
+                self.set_edge_connection(label, seed)
+            return
+        for seed in self._backward_seeds[forward.edge[label]]:
+            c = forward.cost[pred_idx_forward] + backward.cost[seed]
+            if backward.end_node[seed] == forward.start[label] and c < self._best_path.cost:
+                self._best_path = BestConnection(pred_idx_forward, seed, c)
+
+    def set_backward_seed_connection(self, label: EdgeLabelIdx):
+        forward, backward = self._edge_labels_forward, self._edge_labels_backward
+        pred_idx_backward = backward.pred_idx[label]
+        if pred_idx_backward == -1:
+            for seed in self._forward_seeds[backward.edge[label]]:
+                self.set_edge_connection(seed, label)
+            return
+        for seed in self._forward_seeds[backward.edge[label]]:
+            c = forward.cost[seed] + backward.cost[pred_idx_backward]
+            if forward.end_node[seed] == backward.start[label] and c < self._best_path.cost:
+                self._best_path = BestConnection(seed, pred_idx_backward, c)
+
+    def expand_forward(self, g: CompiledGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId):
+        relax(g, node, pred_idx, self._edge_labels_forward, self._edges_status_forward, self._adjacency_list_forward,
+              self._speed, self._get_heuristic(g, dest))
+
+    def expand_backward(self, g: CompiledGraph, node: NodeId, pred_idx: EdgeLabelIdx, origin: NodeId):
+        relax(g, node, pred_idx, self._edge_labels_backward, self._edges_status_backward,
+              self._adjacency_list_backward, self._speed, self._get_heuristic(g, origin))
 
     def make_osm_path(self):
         res_forward = []
-        edge = self._best_path.forward
-        edge_label_idx = self._edges_status_forward[edge].edge_label_index
-        edge_label = self._edge_labels_forward[edge_label_idx]
-        forward_secs = edge_label.cost.secs
-        while not edge_label.is_origin:
-            res_forward.append(edge_label.end_node)
-            edge_label_idx = edge_label.pred_idx
-            edge_label = self._edge_labels_forward[edge_label_idx]
-
-        res_forward.append(edge_label.edge_id.end)
-        res_forward.append(edge_label.edge_id.start)
+        labels = self._edge_labels_forward
+        edge_label_idx = self._best_path.forward
+        forward_secs = labels.secs[edge_label_idx]
+        while not labels.is_origin(edge_label_idx):
+            res_forward.append(labels.end_node[edge_label_idx])
+            edge_label_idx = labels.pred_idx[edge_label_idx]
+
+        res_forward.append(labels.end_node[edge_label_idx])
+        # a path from an EdgeLocation starts at the first node it reaches
+        if edge_label_idx not in self._forward_seeds.get(labels.edge[edge_label_idx], ()):
+            res_forward.append(labels.start[edge_label_idx])
         res_forward = res_forward[::-1]
 
         res_backward = []
+        labels = self._edge_labels_backward
 
-        edge = self._best_path.backward
-        edge_label_idx = self._edges_status_backward[edge].edge_label_index
-        edge_label = self._edge_labels_backward[edge_label_idx]
-        backward_secs = edge_label.cost.secs
+        edge_label_idx = self._best_path.backward
+        backward_secs = labels.secs[edge_label_idx]
 
-        while not edge_label.is_destination:
-            res_backward.append(edge_label.end_node)
-            edge_label_idx = edge_label.pred_idx
-            edge_label = self._edge_labels_backward[edge_label_idx]
+        while not labels.is_destination(edge_label_idx):
+            res_backward.append(labels.end_node[edge_label_idx])
+            edge_label_idx = labels.pred_idx[edge_label_idx]
 
-        res_backward.append(edge_label.edge_id.end)
-        res_backward.append(edge_label.edge_id.start)
+        res_backward.append(labels.end_node[edge_label_idx])
+        if edge_label_idx not in self._backward_seeds.get(labels.edge[edge_label_idx], ()):
+            res_backward.append(labels.start[edge_label_idx])
+
+        forward, backward = self._best_path.forward, self._best_path.backward
+        forward_labels = self._edge_labels_forward
+        if forward_labels.is_origin(forward) and labels.is_destination(backward) and \
+           forward_labels.edge[forward] == labels.edge[backward]:
+            # a route along the edge of both seeds, see set_edge_connection
+            if backward in self._backward_seeds.get(labels.edge[backward], ()):
+                return self._graph.to_osm_path(res_backward), forward_labels.init_secs[forward] + backward_secs
+            return self._graph.to_osm_path(res_forward), forward_secs + labels.init_secs[backward]
 
         if res_forward[-1] == res_backward[0]:
             res_forward.pop(-1)
 
-        return res_forward + res_backward, forward_secs + backward_secs
+        return self._graph.to_osm_path(res_forward + res_backward), forward_secs + backward_secs
+
+    def run(self, g: nx.MultiDiGraph, orig: Point, dest: Point, callback: Callable = lambda *args, **kwargs: None,
+            budget: Optional[SearchBudget] = None) -> Union[Tuple[List[NodeId], float], BudgetExceeded]:
+        graph = self._graph = as_compiled(g)
+        orig, dest = search_point(graph, orig), search_point(graph, dest)
+        # what the heuristic of the backward search aims at
+        backward_target = reverse_point(orig)
 
-    def run(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId, callback: Callable = lambda *args, **kwargs: None) -> Tuple[List[NodeId], float]:
         expand_forward = True
         expand_backward = True
 
-        forward_edge_label = None
+        forward_labels = self._edge_labels_forward
+        backward_labels = self._edge_labels_backward
+
         forward_edge_label_idx = None
-        backward_edge_label = None
         backward_edge_label_idx = None
 
         a = 0
@@ -294,6 +287,8 @@ class DoubleAstar(object):
         # in order to balance the research in both directions
         diff = None 
 
+        start = time.monotonic()
+
         while True:
 
             if a % 15 == 0:
@@ -304,60 +299,104 @@ class DoubleAstar(object):
                 i += 1
             a += 1
 
+            if budget is not None:
+                exceeded = budget.check(len(self._edge_labels_forward) + len(self._edge_labels_backward), a - 1, start)
+                if exceeded is not None:
+                    return exceeded
+
             if expand_forward:
+                if not len(self._adjacency_list_forward):
+                    return self.exhausted_path(dest)
                 _, forward_edge_label_idx = self._adjacency_list_forward.pop()
-                forward_edge_label = self._edge_labels_forward[forward_edge_label_idx]
+                forward_edge = forward_labels.edge[forward_edge_label_idx]
+                forward_sort_cost = forward_labels.sort_cost[forward_edge_label_idx]
 
                 # We don't want the expansion to go forever
-                if forward_edge_label.sort_cost - (diff if diff is not None else 0) > self._threshold:
+                if forward_sort_cost - (diff if diff is not None else 0) > self._threshold:
                     return self.make_osm_path()
 
-                if self._edges_status_backward[forward_edge_label.edge_id].is_permanent():
-                    if self._threshold == float('inf'):
-                        self._threshold = forward_edge_label.sort_cost + kThresholdDelta
+                if self._edges_status_backward.is_permanent(forward_edge):
+                    self.set_forward_connection(forward_edge)
+
+                if forward_labels.is_origin(forward_edge_label_idx) and \
+                   self._edges_status_backward.is_temporary(forward_edge):
+                    self.set_edge_connection(forward_edge_label_idx,
+                                             self._edges_status_backward.label_index[forward_edge])
 
-                    self.set_forward_connection(forward_edge_label.edge_id)
+                if forward_edge in self._backward_seeds:
+                    self.set_forward_seed_connection(forward_edge_label_idx)
+
+                # the meetings may not connect, a seed reached the other way
+                if self._threshold == float('inf') and self._best_path.forward != -1:
+                    self._threshold = forward_sort_cost + kThresholdDelta
 
             if expand_backward:
+                if not len(self._adjacency_list_backward):
+                    return self.exhausted_path(dest)
                 _, backward_edge_label_idx = self._adjacency_list_backward.pop()
-                backward_edge_label = self._edge_labels_backward[backward_edge_label_idx]
+                backward_edge = backward_labels.edge[backward_edge_label_idx]
+                backward_sort_cost = backward_labels.sort_cost[backward_edge_label_idx]
 
                 # We don't want the expansion to go forever
-                if backward_edge_label.sort_cost > self._threshold:
+                if backward_sort_cost > self._threshold:
                     return self.make_osm_path()
 
-                if self._edges_status_forward[backward_edge_label.edge_id].is_permanent():
-                    if self._threshold == float('inf'):
-                        self._threshold = forward_edge_label.sort_cost + kThresholdDelta
+                if self._edges_status_forward.is_permanent(backward_edge):
+                    self.set_backward_connection(backward_edge)
+
+                if backward_labels.is_destination(backward_edge_label_idx) and \
+                   self._edges_status_forward.is_temporary(backward_edge):
+                    self.set_edge_connection(self._edges_status_forward.label_index[backward_edge],
+                                             backward_edge_label_idx)
 
-                    self.set_backward_connection(backward_edge_label.edge_id)
+                if backward_edge in self._forward_seeds:
+                    self.set_backward_seed_connection(backward_edge_label_idx)
+
+                if self._threshold == float('inf') and self._best_path.forward != -1:
+                    self._threshold = forward_sort_cost + kThresholdDelta
 
             if diff is None:
-                diff = forward_edge_label.sort_cost - backward_edge_label.sort_cost
+                diff = forward_sort_cost - backward_sort_cost
 
-            if forward_edge_label.sort_cost <= backward_edge_label.sort_cost + diff:
+            if forward_sort_cost <= backward_sort_cost + diff:
                 expand_forward = True
                 expand_backward = False
 
-                if not forward_edge_label.is_origin:
-                    self._edges_status_forward[forward_edge_label.edge_id].set_permanent()
+                if not forward_labels.is_origin(forward_edge_label_idx):
+                    self._edges_status_forward.set_permanent(forward_edge)
 
-                self.expand_forward(g, forward_edge_label.end_node, forward_edge_label_idx, dest)
+                self.expand_forward(graph, forward_labels.end_node[forward_edge_label_idx], forward_edge_label_idx, dest)
 
             else:
                 expand_forward = False
                 expand_backward = True
 
-                if not backward_edge_label.is_destination:
-                    self._edges_status_backward[backward_edge_label.edge_id].set_permanent()
-
-                self.expand_backward(g, backward_edge_label.end_node, backward_edge_label_idx, orig)
+                if not backward_labels.is_destination(backward_edge_label_idx):
+                    self._edges_status_backward.set_permanent(backward_edge)
+
+                self.expand_backward(graph, backward_labels.end_node[backward_edge_label_idx], backward_edge_label_idx,
+                                     backward_target)
+
+    def exhausted_path(self, dest: Point) -> Tuple[List[NodeId], float]:
+        # one search ran out of labels, no better meeting can come
+        if self._best_path.forward == -1:
+            raise nx.NetworkXNoPath('no path to {}'.format(dest))
+        return self.make_osm_path()
+
+    def get_best_path(self, g: nx.MultiDiGraph, orig: Point, dest: Point,
+                      callback: Callable = lambda *args, **kwargs: None,
+                      budget: Optional[SearchBudget] = None) -> Union[Tuple[List[NodeId], float], BudgetExceeded]:
+        """
+        Like AStar.get_best_path, orig and dest are osm ids or EdgeLocations
+        """
+        graph = as_compiled(g)
+        direct = direct_cost(search_point(graph, orig), search_point(graph, dest))
+        if direct is not None:
+            return [], direct / self._speed
 
-    def get_best_path(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId,
-                      callback: Callable = lambda *args, **kwargs: None) -> Tuple[List[NodeId], float]:
         self.init()
 
         self.init_forward(g, orig, dest)
         self.init_backward(g, orig, dest)
 
-        return self.run(g, orig, dest, callback)
+        return self.run(g, orig, dest, callback, budget)
@@ -0,0 +1,399 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import math
+
+import numpy as np
+
+from algorithms.graph import CompiledGraph
+from algorithms.inner_types import NodeId, EdgeLocation
+
+N_DEG_TO_RAD = 0.01745329238
+EARTH_RADIUS_IN_METERS = 6372797.560856
+
+# BlockTable computes the nodes by blocks of 1 << BLOCK_SHIFT consecutive indices
+BLOCK_SHIFT = 10
+BLOCK_MASK = (1 << BLOCK_SHIFT) - 1
+
+# the cell side of a GridIndex and an EdgeIndex in metres, and their artefacts
+GRID_CELL_SIZE = 100.
+ARTEFACT_GRID_PARAMS = 'grid_params'
+ARTEFACT_GRID_OFFSETS = 'grid_offsets'
+ARTEFACT_GRID_NODES = 'grid_nodes'
+ARTEFACT_EDGE_GRID_PARAMS = 'edge_grid_params'
+ARTEFACT_EDGE_GRID_OFFSETS = 'edge_grid_offsets'
+ARTEFACT_EDGE_GRID_ARCS = 'edge_grid_arcs'
+# the cells are in degrees, a bound in metres from them is a bit optimistic away from the equator
+GRID_BOUND_MARGIN = 0.99
+
+
+def haversine(lats: np.ndarray, lons: np.ndarray, lat, lon) -> np.ndarray:
+    """
+    Great circle distances in metres from every point of (lats, lons) to (lat, lon), in degrees. lat and lon are
+    a point or arrays of the same length, point by point.
+
+    The formula of PointLL.distance_to, over arrays
+    """
+    lon_h = np.sin((lons - lon) * N_DEG_TO_RAD * 0.5)
+    lon_h *= lon_h
+    lat_h = np.sin((lats - lat) * N_DEG_TO_RAD * 0.5)
+    lat_h *= lat_h
+    tmp = np.cos(lats * N_DEG_TO_RAD) * np.cos(lat * N_DEG_TO_RAD)
+    return EARTH_RADIUS_IN_METERS * 2.0 * np.arcsin(np.sqrt(lat_h + tmp * lon_h))
+
+
+class BlockTable(object):
+    """
+    A value per node, computed on first use by blocks of consecutive nodes and kept for the rest of the query
+
+    A search only looks at the nodes around its path, so only their blocks are computed, and a node touched
+    several times, or by both directions of a search, costs one list lookup. Subclasses give _values().
+    """
+    __slots__ = ('_blocks',)
+
+    def __init__(self):
+        self._blocks: Dict[int, List[float]] = {}
+
+    def __call__(self, node: NodeId) -> float:
+        block = self._blocks.get(node >> BLOCK_SHIFT)
+        if block is None:
+            block = self._compute_block(node >> BLOCK_SHIFT)
+        return block[node & BLOCK_MASK]
+
+    def _compute_block(self, block_idx: int) -> List[float]:
+        start = block_idx << BLOCK_SHIFT
+        # python floats, the searches read them one at a time
+        block = self._blocks[block_idx] = self._values(start, start + BLOCK_MASK + 1).tolist()
+        return block
+
+    def _values(self, start: int, end: int) -> np.ndarray:
+        raise NotImplementedError
+
+    def __len__(self):
+        # the number of nodes computed so far
+        return sum(len(block) for block in self._blocks.values())
+
+
+class DistanceTable(BlockTable):
+    """
+    node -> factor * great circle distance from node to target
+    """
+    __slots__ = ('target', 'factor', '_lats', '_lons', '_lat', '_lon')
+
+    def __init__(self, g: CompiledGraph, target: NodeId, factor: float = 1.):
+        super().__init__()
+        self.target = target
+        self.factor = factor
+        self._lats, self._lons = g.lats, g.lons
+        self._lat, self._lon = float(g.lats[target]), float(g.lons[target])
+
+    def _values(self, start: int, end: int) -> np.ndarray:
+        return haversine(self._lats[start:end], self._lons[start:end], self._lat, self._lon) * self.factor
+
+
+def _ring(radius: int) -> Tuple[np.ndarray, np.ndarray]:
+    # the (row, column) offsets of the cells at Chebyshev distance radius
+    if radius == 0:
+        return np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    side = np.arange(-radius, radius + 1)
+    inner = side[1:-1]
+    rows = np.concatenate((np.full(len(side), -radius), np.full(len(side), radius), inner, inner))
+    cols = np.concatenate((side, side, np.full(len(inner), -radius), np.full(len(inner), radius)))
+    return rows, cols
+
+
+def _grid_params(lats: np.ndarray, lons: np.ndarray, cell_size: float) -> np.ndarray:
+    lat_step = cell_size / (EARTH_RADIUS_IN_METERS * N_DEG_TO_RAD)
+    max_abs_lat = float(np.abs(lats).max())
+    # a degree of longitude is the shortest at the largest latitude
+    lon_step = lat_step / max(math.cos(max_abs_lat * N_DEG_TO_RAD), 1e-6)
+    lat0, lon0 = float(lats.min()), float(lons.min())
+    rows = int((lats.max() - lat0) / lat_step) + 1
+    cols = int((lons.max() - lon0) / lon_step) + 1
+    return np.array([lat0, lon0, lat_step, lon_step, rows, cols, max_abs_lat])
+
+
+def segment_distances(lats: np.ndarray, lons: np.ndarray, lats1: np.ndarray, lons1: np.ndarray,
+                      lats2: np.ndarray, lons2: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The distances in metres from every point of (lats, lons) to the segment (lats1, lons1) -> (lats2, lons2) of the
+    same index, and the fraction of the segment from its first end to the nearest point
+
+    On the plane tangent at the point, good up to a few kilometres.
+    """
+    scale = N_DEG_TO_RAD * EARTH_RADIUS_IN_METERS
+    cos_lat = np.cos(lats * N_DEG_TO_RAD)
+    x1, y1 = (lons1 - lons) * cos_lat * scale, (lats1 - lats) * scale
+    dx, dy = (lons2 - lons1) * cos_lat * scale, (lats2 - lats1) * scale
+    squared = dx * dx + dy * dy
+    # a segment of two points at the same place is its first end
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fractions = np.where(squared > 0, np.clip(-(x1 * dx + y1 * dy) / squared, 0, 1), 0.)
+    return np.hypot(x1 + fractions * dx, y1 + fractions * dy), fractions
+
+
+@dataclass
+class GridIndex(object):
+    """
+    The nodes of a graph bucketed by cells of lat_step x lon_step degrees, at least cell_size metres on each side.
+    The items of cell row * cols + col are items[offsets[cell]:offsets[cell + 1]], by increasing index: the node
+    indices here, the arcs for an EdgeIndex.
+
+        index = get_grid_index(graph)
+        nodes, metres = index.snap(lats, lons, radius=200)
+    """
+    lats: np.ndarray
+    lons: np.ndarray
+    # lat0, lon0, lat_step, lon_step, rows, cols, the largest absolute latitude of the nodes
+    params: np.ndarray
+    offsets: np.ndarray
+    items: np.ndarray
+
+    ARTEFACTS = (ARTEFACT_GRID_PARAMS, ARTEFACT_GRID_OFFSETS, ARTEFACT_GRID_NODES)
+
+    @classmethod
+    def build(cls, g: CompiledGraph, cell_size: float = GRID_CELL_SIZE) -> 'GridIndex':
+        lats, lons = np.asarray(g.lats, dtype=np.float64), np.asarray(g.lons, dtype=np.float64)
+        if not len(lats):
+            return cls(lats, lons, np.array([0., 0., 1., 1., 0, 0, 0.]), np.zeros(1, dtype=np.int64),
+                       np.zeros(0, dtype=np.int64))
+        params = _grid_params(lats, lons, cell_size)
+        lat0, lon0, lat_step, lon_step, rows, cols = params[:6].tolist()
+        cells = ((lats - lat0) / lat_step).astype(np.int64) * int(cols) + \
+            ((lons - lon0) / lon_step).astype(np.int64)
+        return cls(lats, lons, params, *cls._bucket(cells, np.arange(len(lats)), int(rows * cols)))
+
+    @staticmethod
+    def _bucket(cells: np.ndarray, items: np.ndarray, cell_count: int) -> Tuple[np.ndarray, np.ndarray]:
+        # the offsets and the items of the cells, items[i] is in cells[i]
+        offsets = np.zeros(cell_count + 1, dtype=np.int64)
+        np.cumsum(np.bincount(cells, minlength=cell_count), out=offsets[1:])
+        return offsets, items[np.argsort(cells, kind='stable')]
+
+    def _distances(self, items: np.ndarray, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        return haversine(self.lats[items], self.lons[items], lats, lons)
+
+    def _all_items(self) -> np.ndarray:
+        return np.arange(len(self.lats))
+
+    def snap(self, lats, lons, radius: float = float('inf')) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        The index of the node nearest to every (lats[i], lons[i]), by great circle distance, and its distance in
+        metres. -1 and inf when there is no node within radius metres. The ties go to the lowest index, like a
+        scan of all the nodes with np.argmin.
+
+        The cells around a point are visited by rings of growing Chebyshev distance, all the points at once. After
+        ring r, the nodes not seen yet are at least r cells away: a point is done when its nearest node is closer,
+        or when r cells are beyond radius.
+        """
+        lats = np.asarray(lats, dtype=np.float64).ravel()
+        lons = np.asarray(lons, dtype=np.float64).ravel()
+        items = np.full(len(lats), -1, dtype=np.int64)
+        metres = np.full(len(lats), np.inf)
+        if not len(lats) or not len(self.items):
+            return items, metres
+
+        lat0, lon0, lat_step, lon_step, rows, cols, max_abs_lat = self.params.tolist()
+        rows, cols = int(rows), int(cols)
+        point_rows = np.floor((lats - lat0) / lat_step).astype(np.int64)
+        point_cols = np.floor((lons - lon0) / lon_step).astype(np.int64)
+        # the ring where the grid starts for the points outside of it, and the one covering all of it
+        first = np.maximum.reduce([-point_rows, point_rows - (rows - 1), -point_cols, point_cols - (cols - 1),
+                                   np.zeros(len(lats), dtype=np.int64)])
+        last = first + max(rows, cols)
+        # the metres of a cell, shorter in longitude for the points further from the equator than the nodes
+        cos_lat = np.cos(np.maximum(np.abs(lats), max_abs_lat) * N_DEG_TO_RAD)
+        cell_metres = np.minimum(lat_step, lon_step * cos_lat) * N_DEG_TO_RAD * EARTH_RADIUS_IN_METERS
+
+        # the rings of a point far from the grid hold more cells than the graph has items, it's scanned instead,
+        # unless all of them are beyond radius
+        far = (8 * first >= len(self.items)) & ((first - 1) * cell_metres * GRID_BOUND_MARGIN < radius)
+        if far.any():
+            all_items = self._all_items()
+            for point in np.flatnonzero(far).tolist():
+                distances = self._distances(all_items, lats[point], lons[point])
+                items[point] = all_items[np.argmin(distances)]
+                metres[point] = distances.min()
+
+        active = np.flatnonzero(~far)
+        ring = int(first[active].min()) if len(active) else 0
+        while len(active):
+            points = active[first[active] <= ring]
+            if len(points):
+                self._visit(ring, points, point_rows, point_cols, lats, lons, items, metres)
+            covered = ring * cell_metres[active] * GRID_BOUND_MARGIN
+            done = (metres[active] <= covered) | (covered >= radius) | (ring >= last[active])
+            active = active[~done]
+            if len(active):
+                # over the empty rings between the grid and the points outside of it
+                ring = max(ring + 1, int(first[active].min()))
+
+        beyond = metres > radius
+        items[beyond] = -1
+        metres[beyond] = np.inf
+        return items, metres
+
+    def _visit(self, ring: int, points: np.ndarray, point_rows: np.ndarray, point_cols: np.ndarray,
+               lats: np.ndarray, lons: np.ndarray, items: np.ndarray, metres: np.ndarray):
+        # the items of the ring of every point, flattened point by point
+        rows, cols = int(self.params[4]), int(self.params[5])
+        ring_rows, ring_cols = _ring(ring)
+        cell_rows = point_rows[points, None] + ring_rows
+        cell_cols = point_cols[points, None] + ring_cols
+        inside = (cell_rows >= 0) & (cell_rows < rows) & (cell_cols >= 0) & (cell_cols < cols)
+        cells = np.where(inside, cell_rows * cols + cell_cols, 0).ravel()
+        counts = np.where(inside.ravel(), self.offsets[cells + 1] - self.offsets[cells], 0)
+        total = int(counts.sum())
+        if not total:
+            return
+        candidate_points = np.repeat(np.repeat(points, len(ring_rows)), counts)
+        # offsets[cell] + 0, 1, .. count - 1 for every cell
+        ends = np.cumsum(counts)
+        positions = np.arange(total) + np.repeat(self.offsets[cells] - ends + counts, counts)
+        candidates = self.items[positions]
+        distances = self._distances(candidates, lats[candidate_points], lons[candidate_points])
+
+        # the nearest candidate of every point, the lowest index on a tie
+        order = np.lexsort((candidates, distances, candidate_points))
+        sorted_points = candidate_points[order]
+        order = order[np.concatenate(([True], sorted_points[1:] != sorted_points[:-1]))]
+        best_points, best_items, best_metres = candidate_points[order], candidates[order], distances[order]
+        better = (best_metres < metres[best_points]) | \
+                 ((best_metres == metres[best_points]) & (best_items < items[best_points]))
+        items[best_points[better]] = best_items[better]
+        metres[best_points[better]] = best_metres[better]
+
+    def to_artefacts(self) -> Dict[str, np.ndarray]:
+        return dict(zip(self.ARTEFACTS, (self.params, self.offsets, self.items)))
+
+    @classmethod
+    def from_graph(cls, g: CompiledGraph) -> Optional['GridIndex']:
+        """
+        The index stored in the artefacts of g, None when it has none
+        """
+        if cls.ARTEFACTS[0] not in g.artefacts:
+            return None
+        return cls(g.lats, g.lons, *(g.artefacts[name] for name in cls.ARTEFACTS))
+
+
+def _arc_sources(g: CompiledGraph) -> np.ndarray:
+    return np.repeat(np.arange(g.node_count, dtype=np.int64), np.diff(g.offsets))
+
+
+@dataclass
+class EdgeIndex(GridIndex):
+    """
+    The edges of a graph bucketed like the nodes of a GridIndex, in every cell of the box of their segment.
+    The items are the first arc of every undirected edge, the arc sources[a] -> targets[a].
+
+    The edges are the straight segments between their nodes, the compiled graph doesn't keep their geometry.
+    """
+    sources: np.ndarray = None
+    targets: np.ndarray = None
+
+    ARTEFACTS = (ARTEFACT_EDGE_GRID_PARAMS, ARTEFACT_EDGE_GRID_OFFSETS, ARTEFACT_EDGE_GRID_ARCS)
+
+    @classmethod
+    def build(cls, g: CompiledGraph, cell_size: float = GRID_CELL_SIZE) -> 'EdgeIndex':
+        lats, lons = np.asarray(g.lats, dtype=np.float64), np.asarray(g.lons, dtype=np.float64)
+        sources, targets = _arc_sources(g), np.asarray(g.targets, dtype=np.int64)
+        arcs = np.unique(np.asarray(g.arc_edges), return_index=True)[1]
+        if not len(arcs):
+            return cls(lats, lons, np.array([0., 0., 1., 1., 0, 0, 0.]), np.zeros(1, dtype=np.int64),
+                       np.zeros(0, dtype=np.int64), sources, targets)
+        params = _grid_params(lats, lons, cell_size)
+        lat0, lon0, lat_step, lon_step, rows, cols = params[:6].tolist()
+        node_rows = ((lats - lat0) / lat_step).astype(np.int64)
+        node_cols = ((lons - lon0) / lon_step).astype(np.int64)
+
+        # the cells of the box of every arc, row by row
+        ends = sources[arcs], targets[arcs]
+        row0, row1 = np.minimum(*(node_rows[n] for n in ends)), np.maximum(*(node_rows[n] for n in ends))
+        col0, col1 = np.minimum(*(node_cols[n] for n in ends)), np.maximum(*(node_cols[n] for n in ends))
+        widths = col1 - col0 + 1
+        counts = (row1 - row0 + 1) * widths
+        owners = np.repeat(np.arange(len(arcs)), counts)
+        local = np.arange(int(counts.sum())) - np.repeat(np.cumsum(counts) - counts, counts)
+        cells = (row0[owners] + local // widths[owners]) * int(cols) + col0[owners] + local % widths[owners]
+        return cls(lats, lons, params, *cls._bucket(cells, arcs[owners], int(rows * cols)), sources, targets)
+
+    def _segments(self, arcs: np.ndarray, lats: np.ndarray, lons: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        sources, targets = self.sources[arcs], self.targets[arcs]
+        return segment_distances(lats, lons, self.lats[sources], self.lons[sources], self.lats[targets],
+                                 self.lons[targets])
+
+    def _distances(self, items: np.ndarray, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+        return self._segments(items, lats, lons)[0]
+
+    def _all_items(self) -> np.ndarray:
+        return np.unique(self.items)
+
+    def snap(self, lats, lons, radius: float = float('inf')) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        The arc nearest to every (lats[i], lons[i]), the fraction of it from its source to the nearest point and
+        the distance in metres. -1, 0 and inf when there is no edge within radius metres.
+        """
+        arcs, metres = super().snap(lats, lons, radius)
+        fractions = np.zeros(len(arcs))
+        found = arcs >= 0
+        if found.any():
+            lats = np.asarray(lats, dtype=np.float64).ravel()
+            lons = np.asarray(lons, dtype=np.float64).ravel()
+            fractions[found] = self._segments(arcs[found], lats[found], lons[found])[1]
+        return arcs, fractions, metres
+
+    @classmethod
+    def from_graph(cls, g: CompiledGraph) -> Optional['EdgeIndex']:
+        index = super().from_graph(g)
+        if index is not None:
+            index.sources, index.targets = _arc_sources(g), g.targets
+        return index
+
+
+def get_grid_index(g: CompiledGraph) -> GridIndex:
+    """
+    The index stored with g, built on first use when there is none and kept in g.artefacts,
+    save_graph() then stores it along
+    """
+    index = GridIndex.from_graph(g)
+    if index is None:
+        index = GridIndex.build(g)
+        g.artefacts.update(index.to_artefacts())
+    return index
+
+
+def get_edge_index(g: CompiledGraph) -> EdgeIndex:
+    """
+    The EdgeIndex stored with g, like get_grid_index
+    """
+    index = EdgeIndex.from_graph(g)
+    if index is None:
+        index = EdgeIndex.build(g)
+        g.artefacts.update(index.to_artefacts())
+    return index
+
+
+def nearest_nodes(g: CompiledGraph, locations: List[Tuple[float, float]]) -> List[NodeId]:
+    """
+    The dense index of the node nearest to every (lat, lon) location, by great circle distance
+    """
+    locations = np.asarray(locations, dtype=np.float64).reshape(-1, 2)
+    return get_grid_index(g).snap(locations[:, 0], locations[:, 1])[0].tolist()
+
+
+def snap_to_edges(g: CompiledGraph, lats, lons, radius: float = float('inf')) -> List[Optional[EdgeLocation]]:
+    """
+    The point of the edges of g nearest to every (lats[i], lons[i]), None when there is no edge within radius
+    metres. The searches take them in place of the origin and destination nodes.
+    """
+    index = get_edge_index(g)
+    arcs, fractions, _ = index.snap(lats, lons, radius)
+    sources = index.sources
+    res = []
+    for arc, fraction in zip(arcs.tolist(), fractions.tolist()):
+        if arc < 0:
+            res.append(None)
+            continue
+        source, target, edge = int(sources[arc]), int(g.targets[arc]), int(g.arc_edges[arc])
+        reversible = any(end_node == source and other == edge for end_node, _, other in g.adjacent(target))
+        res.append(EdgeLocation(source, target, edge, float(g.lengths[arc]), fraction, reversible))
+    return res
@@ -0,0 +1,142 @@
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import weakref
+
+import networkx as nx
+import numpy as np
+
+from algorithms.inner_types import NodeId, PointLL
+
+
+@dataclass
+class CompiledGraph(object):
+    """
+    Compressed sparse row (CSR) form of an osmnx MultiDiGraph
+
+    Nodes are dense indices in [0, node_count), in the order of g.nodes(). The out edges of node n are
+    targets[offsets[n]:offsets[n + 1]] with their lengths in lengths[offsets[n]:offsets[n + 1]].
+    Parallel edges are merged by keeping the shortest one, self loops are dropped.
+    arc_edges gives every out edge the dense id, in [0, undirected_edge_count), of its undirected edge:
+    u -> v and v -> u share the same id, that's what the searches index their edge status with.
+    artefacts holds optional preprocessing results stored along with the graph, see graph_file.py.
+    osm_order sorts osm_ids, node_index() finds an osm id by binary search: unlike a dict, the lookup needs nothing
+    but arrays, shared by the processes mapping the same graph file.
+    """
+    offsets: np.ndarray
+    targets: np.ndarray
+    lengths: np.ndarray
+    arc_edges: np.ndarray
+    lats: np.ndarray
+    lons: np.ndarray
+    osm_ids: np.ndarray
+    osm_order: np.ndarray = field(default=None, repr=False)
+    artefacts: Dict[str, np.ndarray] = field(default_factory=dict, repr=False)
+
+    undirected_edge_count: int = field(init=False)
+    # is_symmetric(), computed on first use
+    _symmetric: Optional[bool] = field(default=None, init=False, repr=False, compare=False)
+
+    def __post_init__(self):
+        if self.osm_order is None:
+            self.osm_order = np.argsort(self.osm_ids, kind='stable')
+        self.undirected_edge_count = int(self.arc_edges.max()) + 1 if len(self.arc_edges) else 0
+
+    @property
+    def node_count(self) -> int:
+        return len(self.osm_ids)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.targets)
+
+    def is_symmetric(self) -> bool:
+        # every arc u -> v has a twin v -> u of the same length
+        if self._symmetric is None:
+            sources = np.repeat(np.arange(self.node_count, dtype=np.int32), np.diff(self.offsets))
+            arcs = np.lexsort((self.targets, sources))
+            twins = np.lexsort((sources, self.targets))
+            lengths = np.asarray(self.lengths)
+            self._symmetric = bool(np.array_equal(sources[arcs], self.targets[twins])
+                                   and np.array_equal(self.targets[arcs], sources[twins])
+                                   and np.array_equal(lengths[arcs], lengths[twins]))
+        return self._symmetric
+
+    def adjacent(self, node: int) -> Iterator[Tuple[int, float, int]]:
+        # (end node, length, undirected edge id) of the out edges of node
+        start, end = self.offsets[node], self.offsets[node + 1]
+        return zip(self.targets[start:end].tolist(), self.lengths[start:end].tolist(),
+                   self.arc_edges[start:end].tolist())
+
+    def node_index(self, osm_id: NodeId) -> int:
+        pos = int(np.searchsorted(self.osm_ids, osm_id, sorter=self.osm_order))
+        if pos == len(self.osm_order) or self.osm_ids[self.osm_order[pos]] != osm_id:
+            raise KeyError(osm_id)
+        return int(self.osm_order[pos])
+
+    def node_indices(self, osm_ids: Iterable[NodeId]) -> List[int]:
+        osm_ids = np.fromiter(osm_ids, dtype=np.int64)
+        if not len(osm_ids):
+            return []
+        # an id past the largest one is checked against the largest one
+        pos = np.minimum(np.searchsorted(self.osm_ids, osm_ids, sorter=self.osm_order), len(self.osm_order) - 1)
+        nodes = self.osm_order[pos]
+        missing = self.osm_ids[nodes] != osm_ids
+        if missing.any():
+            raise KeyError(int(osm_ids[np.argmax(missing)]))
+        return nodes.tolist()
+
+    def to_osm(self, node: int) -> NodeId:
+        return int(self.osm_ids[node])
+
+    def to_osm_path(self, nodes: Iterable[int]) -> List[NodeId]:
+        osm_ids = self.osm_ids
+        return [int(osm_ids[node]) for node in nodes]
+
+    def pointll(self, node: int) -> PointLL:
+        return PointLL(lon=self.lons[node], lat=self.lats[node])
+
+
+def compile_graph(g: nx.MultiDiGraph) -> CompiledGraph:
+    osm_ids = list(g.nodes())
+    index = {osm_id: idx for idx, osm_id in enumerate(osm_ids)}
+
+    offsets = np.zeros(len(osm_ids) + 1, dtype=np.int64)
+    targets = []
+    lengths = []
+    arc_edges = []
+    edge_ids = {}
+
+    for idx, node in enumerate(osm_ids):
+        for end_node, edges in g.adj[node].items():
+            if end_node == node:
+                continue
+            end_idx = index[end_node]
+            targets.append(end_idx)
+            lengths.append(min(edge['length'] for edge in edges.values()))
+            arc_edges.append(edge_ids.setdefault((min(idx, end_idx), max(idx, end_idx)), len(edge_ids)))
+        offsets[idx + 1] = len(targets)
+
+    return CompiledGraph(offsets=offsets,
+                         targets=np.array(targets, dtype=np.int32),
+                         lengths=np.array(lengths, dtype=np.float64),
+                         arc_edges=np.array(arc_edges, dtype=np.int32),
+                         lats=np.array([g.nodes[n]['y'] for n in osm_ids], dtype=np.float64),
+                         lons=np.array([g.nodes[n]['x'] for n in osm_ids], dtype=np.float64),
+                         osm_ids=np.array(osm_ids, dtype=np.int64))
+
+
+_compiled_graphs = weakref.WeakKeyDictionary()
+
+
+def as_compiled(g: Union[nx.MultiDiGraph, CompiledGraph]) -> CompiledGraph:
+    """
+    The algorithms accept both a networkx graph and a CompiledGraph, a networkx graph is compiled once
+    and the result is cached for as long as the graph lives. Don't modify a graph after having searched on it.
+    """
+    if isinstance(g, CompiledGraph):
+        return g
+    compiled = _compiled_graphs.get(g)
+    if compiled is None:
+        compiled = compile_graph(g)
+        _compiled_graphs[g] = compiled
+    return compiled
@@ -0,0 +1,202 @@
+from typing import Dict, Optional
+import hashlib
+import json
+import os
+import shutil
+import warnings
+
+import numpy as np
+
+from algorithms.graph import CompiledGraph, compile_graph
+from algorithms.geo import GridIndex, EdgeIndex
+
+# On-disk format of a CompiledGraph: a directory holding one .npy file per array and a header.json.
+# The arrays are loaded with mmap_mode='r', so loading costs a few page faults instead of parsing xml
+# and the pages are shared by every process that maps the same files.
+#
+# <path>/header.json
+# <path>/offsets.npy, targets.npy, lengths.npy, arc_edges.npy, lats.npy, lons.npy, osm_ids.npy, osm_order.npy
+# <path>/artefact.<name>.npy     optional preprocessing results (landmarks, contraction hierarchy...)
+
+FORMAT_VERSION = 2
+HEADER = 'header.json'
+GRAPH_ARRAYS = ('offsets', 'targets', 'lengths', 'arc_edges', 'lats', 'lons', 'osm_ids')
+# saved too, CompiledGraph computes them when an older file doesn't have them
+OPTIONAL_ARRAYS = ('osm_order',)
+ARTEFACT_PREFIX = 'artefact.'
+
+
+class StaleGraphFile(Exception):
+    pass
+
+
+class StaleArtefacts(Exception):
+    pass
+
+
+def file_sha256(filename: str, chunk_size: int = 1 << 20) -> str:
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def _source_stamp(source: str) -> Dict:
+    stat = os.stat(source)
+    return {'source_size': stat.st_size, 'source_mtime_ns': stat.st_mtime_ns}
+
+
+def read_header(path: str) -> Dict:
+    with open(os.path.join(path, HEADER)) as f:
+        return json.load(f)
+
+
+def _write_header(path: str, header: Dict):
+    tmp = os.path.join(path, HEADER + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(header, f, indent=2, sort_keys=True)
+    os.replace(tmp, os.path.join(path, HEADER))
+
+
+def _kept_artefacts(graph: CompiledGraph, path: str, names, drop_stale: bool) -> Dict[str, np.ndarray]:
+    """
+    The artefacts of the graph file at path not in names, kept when graph replaces it. They're computed from its
+    graph: when graph is another one they're dropped with a warning if drop_stale, StaleArtefacts otherwise.
+    """
+    try:
+        old = set(read_header(path).get('artefacts', ())) - set(names)
+    except (OSError, ValueError):
+        return {}
+    if not old:
+        return {}
+    try:
+        same = all(np.array_equal(np.load(os.path.join(path, name + '.npy'), mmap_mode='r'), getattr(graph, name))
+                   for name in GRAPH_ARRAYS)
+    except (OSError, ValueError):
+        same = False
+    if not same and drop_stale:
+        warnings.warn('dropping the artefacts {} of the previous graph of {}'.format(', '.join(sorted(old)), path))
+        return {}
+    if not same:
+        raise StaleArtefacts('{} has artefacts {} of another graph, remove it and build them again'.format(
+            path, ', '.join(sorted(old))))
+    return {name: np.load(os.path.join(path, ARTEFACT_PREFIX + name + '.npy'), mmap_mode='r') for name in old}
+
+
+def save_graph(graph: CompiledGraph, path: str, source: Optional[str] = None,
+               artefacts: Optional[Dict[str, np.ndarray]] = None, drop_stale_artefacts: bool = False) -> Dict:
+    """
+    Write graph to the directory path, replacing what's there. When source (the graphml the graph
+    was compiled from) is given, its sha256 is recorded so that load_graph can detect a stale file.
+    The artefacts of the file replaced are kept when its graph is the same. Otherwise they're dropped when
+    drop_stale_artefacts, and StaleArtefacts is raised when not.
+    """
+    artefacts = dict(graph.artefacts, **(artefacts or {}))
+    artefacts = dict(_kept_artefacts(graph, path, artefacts, drop_stale_artefacts), **artefacts)
+
+    # write next to the destination and swap at the end: a reader sees the old graph or the new one, never a
+    # half written one, or for an instant no graph at all between the two renames
+    tmp_path = path.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    for name in GRAPH_ARRAYS + OPTIONAL_ARRAYS:
+        np.save(os.path.join(tmp_path, name + '.npy'), np.ascontiguousarray(getattr(graph, name)))
+    for name, array in artefacts.items():
+        np.save(os.path.join(tmp_path, ARTEFACT_PREFIX + name + '.npy'), np.ascontiguousarray(array))
+
+    header = {'version': FORMAT_VERSION,
+              'node_count': graph.node_count,
+              'edge_count': graph.edge_count,
+              'artefacts': sorted(artefacts)}
+    if source is not None:
+        header['source'] = os.path.abspath(source)
+        header['source_sha256'] = file_sha256(source)
+        header.update(_source_stamp(source))
+    _write_header(tmp_path, header)
+
+    # the processes mapping the old files keep reading them until they're done
+    old_path = path.rstrip(os.sep) + '.old'
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+    return header
+
+
+def save_artefact(path: str, name: str, array: np.ndarray):
+    """
+    Add (or replace) a preprocessing result in an existing graph file
+    """
+    np.save(os.path.join(path, ARTEFACT_PREFIX + name + '.npy'), np.ascontiguousarray(array))
+    header = read_header(path)
+    header['artefacts'] = sorted(set(header['artefacts']) | {name})
+    _write_header(path, header)
+
+
+def load_graph(path: str, mmap: bool = True) -> CompiledGraph:
+    header = read_header(path)
+    if header.get('version') != FORMAT_VERSION:
+        raise StaleGraphFile('{} has format version {}, expected {}'.format(path, header.get('version'),
+                                                                            FORMAT_VERSION))
+    mmap_mode = 'r' if mmap else None
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in GRAPH_ARRAYS}
+    for name in OPTIONAL_ARRAYS:
+        if os.path.exists(os.path.join(path, name + '.npy')):
+            arrays[name] = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+    artefacts = {name: np.load(os.path.join(path, ARTEFACT_PREFIX + name + '.npy'), mmap_mode=mmap_mode)
+                 for name in header['artefacts']}
+    return CompiledGraph(artefacts=artefacts, **arrays)
+
+
+def is_stale(path: str, source: str) -> bool:
+    try:
+        header = read_header(path)
+    except (OSError, ValueError):
+        return True
+    if header.get('version') != FORMAT_VERSION or 'source_sha256' not in header:
+        return True
+
+    # hashing a big graphml takes a while, skip it when the file is untouched since the conversion
+    stamp = _source_stamp(source)
+    if all(header.get(k) == v for k, v in stamp.items()):
+        return False
+    if file_sha256(source) != header['source_sha256']:
+        return True
+    header.update(stamp)
+    _write_header(path, header)
+    return False
+
+
+def graphml_to_compiled(source: str) -> CompiledGraph:
+    import osmnx
+    folder, filename = os.path.split(os.path.abspath(source))
+    return compile_graph(osmnx.load_graphml(filename=filename, folder=folder))
+
+
+def convert_graphml(source: str, path: Optional[str] = None) -> str:
+    path = path or default_graph_path(source)
+    graph = graphml_to_compiled(source)
+    # the spatial indexes are cheap to build, every binary graph has them
+    graph.artefacts.update(GridIndex.build(graph).to_artefacts())
+    graph.artefacts.update(EdgeIndex.build(graph).to_artefacts())
+    # the graphml changed: the artefacts of the previous graph don't apply any more
+    save_graph(graph, path, source=source, drop_stale_artefacts=True)
+    return path
+
+
+def default_graph_path(source: str) -> str:
+    return os.path.splitext(source)[0] + '.graph'
+
+
+def load_or_convert(source: str, path: Optional[str] = None) -> CompiledGraph:
+    """
+    Load the binary graph converted from the graphml source, (re)building it first when it's missing,
+    written by another format version or when the graphml content changed.
+    """
+    path = path or default_graph_path(source)
+    if is_stale(path, source):
+        convert_graphml(source, path)
+    return load_graph(path)
@@ -1,7 +1,8 @@
 from enum import Enum
+import time
 
 from dataclasses import dataclass, field
-from typing import Tuple
+from typing import Tuple, Optional
 
 NodeId = int
 EdgeLabelIdx = int
@@ -95,6 +96,71 @@ class EdgeStatus(object):
         return self
 
 
+@dataclass(frozen=True)
+class EdgeLocation(object):
+    """
+    A point on the arc source -> target of a compiled graph (dense node indices), at fraction of its length from
+    source. edge is the undirected edge id of the arc, reversible when the arc target -> source exists too.
+
+    A search can start or end at it in place of a node, the first and last edges of the path are then partial.
+    It can be a dict key, see geo.snap_to_edges.
+    """
+    source: int
+    target: int
+    edge: int
+    length: float
+    fraction: float
+    reversible: bool
+
+    def reverse(self) -> 'EdgeLocation':
+        # the same point on the reversed graph, where a backward search runs
+        return EdgeLocation(self.target, self.source, self.edge, self.length, 1 - self.fraction, self.reversible)
+
+
+@dataclass
+class BudgetExceeded(object):
+    """
+    Returned by a search instead of its result when its SearchBudget is exhausted
+
+    It's falsy, like the empty results the searches used to return
+    """
+    reason: str
+    labels: int
+    settled: int
+    elapsed: float
+    # what had been found so far, e.g. the partial isochrone
+    partial: object = None
+
+    def __bool__(self):
+        return False
+
+
+@dataclass
+class SearchBudget(object):
+    """
+    Per query limits of a search, None means unlimited
+
+    max_wall_time is in seconds, counted from the start of the query
+    """
+    max_labels: Optional[int] = None
+    max_settled: Optional[int] = None
+    max_wall_time: Optional[float] = None
+
+    def check(self, labels: int, settled: int, start: float, partial: object = None) -> Optional[BudgetExceeded]:
+        elapsed = time.monotonic() - start
+        reason = None
+        if self.max_labels is not None and labels > self.max_labels:
+            reason = 'max_labels'
+        elif self.max_settled is not None and settled > self.max_settled:
+            reason = 'max_settled'
+        elif self.max_wall_time is not None and elapsed > self.max_wall_time:
+            reason = 'max_wall_time'
+
+        if reason is None:
+            return None
+        return BudgetExceeded(reason, labels, settled, elapsed, partial)
+
+
 @dataclass
 class PointLL(object):
 
@@ -1,62 +1,189 @@
-from typing import Set, Callable, Dict
+from typing import Iterable, Callable, Dict, List, Optional, Tuple, Union
+import heapq
+import time
 
 import networkx as nx
+import numpy as np
 
 from algorithms.astar import AStar
-from algorithms.inner_types import NodeId, EdgeLabel, Cost, EdgeId
-from priority_queue import PriorityQueue
+from algorithms.inner_types import NodeId, Cost, EdgeLocation, SearchBudget, BudgetExceeded
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.workspace import SearchWorkspace
+from algorithms.relaxation import Point, search_point, direct_cost
 
 
 class Isocrhone(AStar):
-
-    def __init__(self, speed=1.4):
-        super().__init__(speed=speed, cost_factor=0)
-
-    def get_isochrone(self, g: nx.MultiDiGraph, orig: NodeId, dest_nodes: Set[NodeId], limit: int=900,
-                      callback: Callable=lambda *args, **kwargs: None) -> Dict[NodeId, Cost]:
+    """
+    One to many: the cost of every node of dest_nodes reachable within limit seconds
+
+    The search stops as soon as all of dest_nodes are settled, or when no label of the queue can be within the
+    limit anymore. With dense=True the result is the numpy array of the seconds to dest_nodes, in their order
+    (pass a list), inf for the nodes not reached.
+
+    orig and the items of dest_nodes can be EdgeLocations, the result has them as keys. A location is reached
+    through the ends of its edge, its cost is final once the labels of the queue cost more.
+    """
+
+    def __init__(self, speed=1.4, queue_backend='heap', workspace: Optional[SearchWorkspace] = None):
+        super().__init__(speed=speed, cost_factor=0, queue_backend=queue_backend, workspace=workspace)
+
+    def init(self):
+        super().init()
+        # node of dest_nodes -> the label it has been reached by
+        self._reached: Dict[int, int] = {}
+
+    def get_isochrone(self, g: nx.MultiDiGraph, orig: Point, dest_nodes: Iterable[Point], limit: int=900,
+                      callback: Callable=lambda *args, **kwargs: None,
+                      budget: Optional[SearchBudget] = None,
+                      dense: bool = False) -> Union[Dict[NodeId, Cost], np.ndarray, BudgetExceeded]:
+        # run() may stop with labels left in the queue, a new query starts from scratch
+        self.init()
         self.init_origin(g, orig)
-        return self.run(g, orig, dest_nodes, limit, callback=callback)
-
-    def run(self, g: nx.MultiDiGraph, orig: NodeId, dest_nodes: Set[NodeId], limit: int=900,
-            callback: Callable=lambda *args, **kwargs: None) -> Dict[NodeId, Cost]:
-        self._orig = orig
+        return self.run(g, orig, dest_nodes, limit, callback=callback, budget=budget, dense=dense)
+
+    def run(self, g: nx.MultiDiGraph, orig: Point, dest_nodes: Iterable[Point], limit: int=900,
+            callback: Callable=lambda *args, **kwargs: None,
+            budget: Optional[SearchBudget] = None,
+            dense: bool = False) -> Union[Dict[NodeId, Cost], np.ndarray, BudgetExceeded]:
+        graph = as_compiled(g)
+        self._orig = search_point(graph, orig)
         self._dest = None
+        dest_nodes = list(dest_nodes)
+        if any(isinstance(node, EdgeLocation) for node in dest_nodes):
+            dest_list = [search_point(graph, node) for node in dest_nodes]
+        else:
+            dest_list = graph.node_indices(dest_nodes)
+        dest_nodes = set(dest_list)
+
+        def result():
+            return self._to_dense_result(res, dest_list) if dense else self._to_osm_result(graph, res)
+
+        # secs - init_secs of a label is (cost - init_cost) / speed: once the cheapest label of the queue is
+        # beyond the limit even for the seed of the highest init cost, so are all the others
+        labels = self._edge_labels
+        max_init_cost = labels.column('init_cost').max() if len(labels) else 0
+        max_cost = limit * self._speed + max_init_cost
 
         res = {}
+        locations = _Locations(self._orig, dest_nodes, limit, self._speed)
         i = 0
         a = 0
+        start = time.monotonic()
 
         # begin search
         while True:
             if i % 200 == 0:
-                callback(g, orig, dest_nodes, self._edges_status, self._edge_labels, str(a).zfill(4))
+                callback(g, self._orig, dest_nodes, self._edges_status, self._edge_labels, str(a).zfill(4))
                 a += 1
             i += 1
 
-            current_labels = len(self._edge_labels)
-
-            if current_labels > PriorityQueue.QUEUE_MAX_SIZE:
-                print('Warning: current_labels > PriorityQueue.QUEUE_MAX_SIZE')
-                return res
+            if budget is not None:
+                exceeded = budget.check(len(self._edge_labels), i - 1, start)
+                if exceeded is not None:
+                    exceeded.partial = result()
+                    return exceeded
 
             if len(self._adjacency_list) == 0:
-                return res
+                # no label left, the locations reached so far can't be reached cheaper
+                locations.settle(float('inf'), res)
+                return result()
 
             _, pred_index = self._adjacency_list.pop()
-            pred_edge_label = self._edge_labels[pred_index]
 
-            if pred_edge_label.cost.secs - pred_edge_label.cost.init_secs > limit:
-                continue
+            if labels.cost[pred_index] > max_cost:
+                locations.settle(float('inf'), res)
+                return result()
 
-            # Do we touch the destination?
-            if pred_edge_label.end_node in dest_nodes:
-                r = res.get(pred_edge_label.end_node)
-                if r is not None:
-                    res[pred_edge_label.end_node] = min(r, pred_edge_label.cost)
-                else:
-                    res[pred_edge_label.end_node] = pred_edge_label.cost
+            if locations and locations.settle(labels.cost[pred_index], res) and len(res) == len(dest_nodes):
+                return result()
 
-            if not pred_edge_label.is_origin:
-                self._edges_status[pred_edge_label.edge_id].set_permanent()
+            if labels.secs[pred_index] - labels.init_secs[pred_index] > limit:
+                continue
 
-            self.expand_forward(g, pred_edge_label.end_node, pred_index, None)
+            # Do we touch the destination?
+            end_node = labels.end_node[pred_index]
+            if locations:
+                locations.reach(end_node, labels.get_cost(pred_index), res)
+            if end_node in dest_nodes:
+                r = res.get(end_node)
+                if r is None or labels.cost[pred_index] < r.cost:
+                    res[end_node] = labels.get_cost(pred_index)
+                    self._reached[end_node] = pred_index
+                # the labels come by increasing cost, the first one reaching a node is its best
+                if len(res) == len(dest_nodes):
+                    return result()
+
+            if not labels.is_origin(pred_index):
+                self._edges_status.set_permanent(labels.edge[pred_index])
+
+            self.expand_forward(graph, end_node, pred_index, None)
+
+    def get_path(self, node: NodeId) -> List[NodeId]:
+        """
+        The nodes of the path from the origin of the last search to node, a node of its result.
+        The labels are kept until the next search.
+        """
+        return self._graph.to_osm_path(self._label_path(self._reached[self._graph.node_index(node)]))
+
+    @staticmethod
+    def _to_osm_result(graph: CompiledGraph, res: Dict[NodeId, Cost]) -> Dict[NodeId, Cost]:
+        return {node if isinstance(node, EdgeLocation) else graph.to_osm(node): cost for node, cost in res.items()}
+
+    @staticmethod
+    def _to_dense_result(res: Dict[NodeId, Cost], dest_list: List[NodeId]) -> np.ndarray:
+        inf = float('inf')
+        return np.array([res[node].secs if node in res else inf for node in dest_list])
+
+
+class _Locations(object):
+    """
+    The EdgeLocations of the destinations of an Isocrhone: reach() gives them the cost of a label ending at an end
+    of their edge plus the rest of the edge, settle() moves the ones cheaper than the labels left to the result
+    """
+
+    def __init__(self, orig: Union[int, EdgeLocation], dest_nodes: Iterable, limit: float, speed: float):
+        self._limit = limit
+        self._speed = speed
+        # node -> (location, length from the node to it)
+        self._by_node: Dict[int, List[Tuple[EdgeLocation, float]]] = {}
+        self._best: Dict[EdgeLocation, Cost] = {}
+        # (cost, order, location), the order breaks the ties without comparing the locations
+        self._heap: List[Tuple[float, int, EdgeLocation]] = []
+        self._pushes = 0
+        for location in dest_nodes:
+            if not isinstance(location, EdgeLocation):
+                continue
+            self._by_node.setdefault(location.source, []).append((location, location.fraction * location.length))
+            if location.reversible:
+                self._by_node.setdefault(location.target, []).append(
+                    (location, (1 - location.fraction) * location.length))
+            direct = direct_cost(orig, location)
+            if direct is not None:
+                self._push(location, Cost(direct, direct / speed))
+
+    def __bool__(self):
+        return bool(self._by_node)
+
+    def _push(self, location: EdgeLocation, cost: Cost):
+        best = self._best.get(location)
+        if cost.secs - cost.init_secs <= self._limit and (best is None or cost.cost < best.cost):
+            self._best[location] = cost
+            self._pushes += 1
+            heapq.heappush(self._heap, (cost.cost, self._pushes, location))
+
+    def reach(self, node: int, cost: Cost, res: dict):
+        for location, length in self._by_node.get(node, ()):
+            if location not in res:
+                self._push(location, Cost(cost.cost + length, cost.secs + length / self._speed, cost.init_cost,
+                                          cost.init_secs))
+
+    def settle(self, cost: float, res: dict) -> bool:
+        # True when a location has been added to res
+        settled = False
+        heap = self._heap
+        while heap and heap[0][0] <= cost:
+            location_cost, _, location = heapq.heappop(heap)
+            if location not in res and self._best[location].cost == location_cost:
+                res[location] = self._best[location]
+                settled = True
+        return settled
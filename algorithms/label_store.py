@@ -0,0 +1,208 @@
+from array import array
+from typing import List
+
+import numpy as np
+
+from algorithms.inner_types import NodeId, EdgeId, Cost, EdgeLabel, EdgeLabelIdx, TravelMode
+
+IS_ORIGIN = 1
+IS_DESTINATION = 2
+CAN_CHANGE_MODE = 4
+
+_MODES = tuple(TravelMode)
+
+
+class EdgeLabelStore(object):
+    """
+    The edge labels of a search, stored column by column: label i is the i-th item of every column
+
+    A label is ~60 bytes in flat arrays, while an EdgeLabel holding a Cost and an EdgeId is three objects and
+    their dicts. The columns are array.array: they grow by amortized appends and read back as python scalars,
+    which is faster than indexing numpy arrays one item at a time in the search loops. column() gives the numpy
+    version of a column for vectorized code.
+
+    The edge of a label goes from start to end_node, mode is the TravelMode value of the label. edge is the slot
+    of the edge in the EdgeStatusStore of the search, i.e. its dense undirected edge id when there's one layer.
+
+    clear() only forgets the labels, the next search overwrites the columns in place before appending to them.
+    """
+    __slots__ = ('cost', 'secs', 'init_cost', 'init_secs', 'sort_cost', 'start', 'end_node', 'edge', 'pred_idx',
+                 'mode', 'flags', '_size')
+
+    def __init__(self):
+        self.cost = array('d')
+        self.secs = array('d')
+        self.init_cost = array('d')
+        self.init_secs = array('d')
+        self.sort_cost = array('d')
+        self.start = array('i')
+        self.end_node = array('i')
+        self.edge = array('i')
+        self.pred_idx = array('q')
+        self.mode = array('b')
+        self.flags = array('B')
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        self._size = 0
+
+    def append(self, cost: float, secs: float, sort_cost: float, start: NodeId, end_node: NodeId, edge: int,
+               pred_idx: EdgeLabelIdx, init_cost: float = 0, init_secs: float = 0, mode: int = 0,
+               is_origin: bool = False, is_destination: bool = False, can_change_mode: bool = True) -> EdgeLabelIdx:
+        idx = self._size
+        self._size = idx + 1
+        flags = IS_ORIGIN * is_origin | IS_DESTINATION * is_destination | CAN_CHANGE_MODE * can_change_mode
+        if idx < len(self.cost):
+            # a slot left by a previous search
+            self.cost[idx] = cost
+            self.secs[idx] = secs
+            self.init_cost[idx] = init_cost
+            self.init_secs[idx] = init_secs
+            self.sort_cost[idx] = sort_cost
+            self.start[idx] = start
+            self.end_node[idx] = end_node
+            self.edge[idx] = edge
+            self.pred_idx[idx] = pred_idx
+            self.mode[idx] = mode
+            self.flags[idx] = flags
+            return idx
+        self.cost.append(cost)
+        self.secs.append(secs)
+        self.init_cost.append(init_cost)
+        self.init_secs.append(init_secs)
+        self.sort_cost.append(sort_cost)
+        self.start.append(start)
+        self.end_node.append(end_node)
+        self.edge.append(edge)
+        self.pred_idx.append(pred_idx)
+        self.mode.append(mode)
+        self.flags.append(flags)
+        return idx
+
+    def update(self, idx: EdgeLabelIdx, cost: float, secs: float, init_cost: float, init_secs: float,
+               start: NodeId, end_node: NodeId, pred_idx: EdgeLabelIdx):
+        self.cost[idx] = cost
+        self.secs[idx] = secs
+        self.init_cost[idx] = init_cost
+        self.init_secs[idx] = init_secs
+        self.start[idx] = start
+        self.end_node[idx] = end_node
+        self.pred_idx[idx] = pred_idx
+
+    def is_origin(self, idx: EdgeLabelIdx) -> bool:
+        return bool(self.flags[idx] & IS_ORIGIN)
+
+    def is_destination(self, idx: EdgeLabelIdx) -> bool:
+        return bool(self.flags[idx] & IS_DESTINATION)
+
+    def can_change_mode(self, idx: EdgeLabelIdx) -> bool:
+        return bool(self.flags[idx] & CAN_CHANGE_MODE)
+
+    def set_can_change_mode(self, idx: EdgeLabelIdx, can_change_mode: bool):
+        self.flags[idx] = self.flags[idx] & ~CAN_CHANGE_MODE | CAN_CHANGE_MODE * can_change_mode
+
+    def set_origin(self, idx: EdgeLabelIdx):
+        self.flags[idx] = self.flags[idx] & CAN_CHANGE_MODE | IS_ORIGIN
+
+    def set_destination(self, idx: EdgeLabelIdx):
+        self.flags[idx] = self.flags[idx] & CAN_CHANGE_MODE | IS_DESTINATION
+
+    def edge_id(self, idx: EdgeLabelIdx) -> EdgeId:
+        return EdgeId(self.start[idx], self.end_node[idx], _MODES[self.mode[idx]])
+
+    def get_cost(self, idx: EdgeLabelIdx) -> Cost:
+        return Cost(self.cost[idx], self.secs[idx], self.init_cost[idx], self.init_secs[idx])
+
+    def column(self, name: str) -> np.ndarray:
+        # a copy: a view would forbid the store to grow as long as it's alive
+        col = getattr(self, name)
+        return np.array(col[:self._size], dtype=col.typecode)
+
+    @property
+    def nbytes(self) -> int:
+        # what the columns hold, including the slots kept from previous searches
+        return sum(col.itemsize * len(col) for col in (getattr(self, name) for name in self.__slots__[:-1]))
+
+    def __getitem__(self, idx: EdgeLabelIdx) -> EdgeLabel:
+        # a copy of the label, handy when debugging, the searches read the columns
+        return EdgeLabel(self.get_cost(idx),
+                         self.sort_cost[idx],
+                         self.edge_id(idx),
+                         self.pred_idx[idx],
+                         self.end_node[idx],
+                         is_origin=self.is_origin(idx),
+                         is_destination=self.is_destination(idx),
+                         can_change_mode=self.can_change_mode(idx))
+
+
+UNREACHED = 0
+PERMANENT = 1
+TEMPORARY = 2
+
+
+# state = generation << 2 | status, in an unsigned 32 bits array
+_MAX_GENERATION = (1 << 30) - 1
+
+
+class EdgeStatusStore(object):
+    """
+    The status of every edge of the graph during a search, replaces the Dict[EdgeId, EdgeStatus]
+
+    It's indexed by the dense undirected edge ids of CompiledGraph.arc_edges. A search that keeps several
+    independent statuses per edge (one per travel mode...) has as many layers, edge e of layer l is at slot
+    l * edge_count + e. label_index holds the label of a reached slot.
+
+    The status of a slot is stamped with the generation of the search that wrote it, reset() starts a new
+    generation in O(1): every slot written before reads as UNREACHED without touching the arrays.
+    """
+    __slots__ = ('edge_count', 'state', 'label_index', '_generation', '_permanent', '_temporary')
+
+    def __init__(self, edge_count: int, layers: int = 1):
+        self.edge_count = edge_count
+        self.state = array('I', [0]) * (edge_count * layers)
+        self.label_index = array('i', [-1]) * (edge_count * layers)
+        self._generation = 0
+        self.reset()
+
+    def __len__(self):
+        return len(self.state)
+
+    def reset(self):
+        self._generation += 1
+        if self._generation > _MAX_GENERATION:
+            self.state = array('I', [0]) * len(self.state)
+            self._generation = 1
+        self._permanent = self._generation << 2 | PERMANENT
+        self._temporary = self._generation << 2 | TEMPORARY
+
+    def slot(self, edge: int, layer: int) -> int:
+        return layer * self.edge_count + edge
+
+    def is_unreached(self, slot: int) -> bool:
+        # older generations are smaller than any status of the current one
+        return self.state[slot] < self._permanent
+
+    def is_temporary(self, slot: int) -> bool:
+        return self.state[slot] == self._temporary
+
+    def is_permanent(self, slot: int) -> bool:
+        return self.state[slot] == self._permanent
+
+    def set_temporary(self, slot: int, label_idx: EdgeLabelIdx):
+        self.state[slot] = self._temporary
+        self.label_index[slot] = label_idx
+
+    def set_permanent(self, slot: int):
+        self.state[slot] = self._permanent
+
+    def labels(self, status: int) -> List[EdgeLabelIdx]:
+        # the labels of the slots in the given status (PERMANENT or TEMPORARY), for the drawing call backs
+        state = np.array(self.state, dtype=self.state.typecode)
+        slots = np.flatnonzero(state == (self._generation << 2 | status))
+        return np.array(self.label_index, dtype=self.label_index.typecode)[slots].tolist()
+
+    def reached_labels(self) -> List[EdgeLabelIdx]:
+        return self.labels(PERMANENT) + self.labels(TEMPORARY)
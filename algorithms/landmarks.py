@@ -0,0 +1,217 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+import heapq
+import random
+
+import numpy as np
+
+from algorithms.geo import BlockTable
+from algorithms.graph import CompiledGraph
+from algorithms.inner_types import NodeId
+
+# ALT (A*, Landmarks, Triangle inequality), see Goldberg & Harrelson, "Computing the shortest path: A* search
+# meets graph theory".
+#
+# For a landmark L and the shortest path distances d, the triangle inequality gives for every node v and target t
+#     d(v, t) >= d(L, t) - d(L, v)    and    d(v, t) >= d(v, L) - d(t, L)
+# The largest of these bounds over a few well spread landmarks is a feasible potential, much tighter than the
+# great circle distance. It's feasible per directed arc, but the searches keep one status per undirected edge and
+# their backward searches walk the forward arcs: they stay exact with it on a symmetric graph only, and ignore the
+# landmarks of the other ones (usable_landmarks).
+
+ARTEFACT_LANDMARKS = 'alt_landmarks'
+ARTEFACT_FROM = 'alt_from_landmarks'
+ARTEFACT_TO = 'alt_to_landmarks'
+
+STRATEGIES = ('farthest', 'avoid')
+
+
+def reverse_arcs(g: CompiledGraph) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    offsets, targets, lengths of the graph with every arc reversed
+    """
+    sources = np.repeat(np.arange(g.node_count, dtype=np.int32), np.diff(g.offsets))
+    order = np.argsort(g.targets, kind='stable')
+    offsets = np.zeros(g.node_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(g.targets, minlength=g.node_count), out=offsets[1:])
+    return offsets, sources[order], np.asarray(g.lengths)[order]
+
+
+def is_symmetric(g: CompiledGraph) -> bool:
+    return g.is_symmetric()
+
+
+def usable_landmarks(g: CompiledGraph, landmarks: Optional['Landmarks']) -> Optional['Landmarks']:
+    # the landmarks the searches take on g, None when they aren't given or g isn't symmetric
+    return landmarks if landmarks is not None and g.is_symmetric() else None
+
+
+def shortest_path_tree(offsets: List[int], targets: List[int], lengths: List[float],
+                       source: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Dijkstra from source over the arcs given as python lists, returns the distances (inf when unreachable)
+    and the parent of every node in the shortest path tree (-1 for the source and the unreachable nodes)
+    """
+    n = len(offsets) - 1
+    inf = float('inf')
+    dist = [inf] * n
+    parent = [-1] * n
+    dist[source] = 0.
+    heap = [(0., source)]
+    heappop, heappush = heapq.heappop, heapq.heappush
+    while heap:
+        d, node = heappop(heap)
+        if d > dist[node]:
+            continue
+        for i in range(offsets[node], offsets[node + 1]):
+            end_node = targets[i]
+            new_dist = d + lengths[i]
+            if new_dist < dist[end_node]:
+                dist[end_node] = new_dist
+                parent[end_node] = node
+                heappush(heap, (new_dist, end_node))
+    return np.array(dist), np.array(parent, dtype=np.int64)
+
+
+@dataclass
+class Landmarks(object):
+    """
+    The landmarks of a graph and the distances from (from_landmarks[i][v] = d(L_i, v)) and to
+    (to_landmarks[i][v] = d(v, L_i)) each of them, inf for the unreachable nodes.
+    On a symmetric graph both are the same array.
+    """
+    nodes: np.ndarray
+    from_landmarks: np.ndarray
+    to_landmarks: np.ndarray
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def potential(self, target: NodeId, factor: float = 1.) -> 'AltPotential':
+        return AltPotential(self, target, factor)
+
+    def lower_bounds(self, target: NodeId, start: int = 0, end: Optional[int] = None) -> np.ndarray:
+        """
+        The ALT lower bound of d(v, target) for the nodes v in [start, end)
+        """
+        from_l, to_l = self.from_landmarks[:, start:end], self.to_landmarks[:, start:end]
+        with np.errstate(invalid='ignore'):
+            bounds = np.maximum(self.from_landmarks[:, target, None] - from_l,
+                                to_l - self.to_landmarks[:, target, None])
+        # a landmark that doesn't reach both nodes says nothing
+        bounds[~np.isfinite(bounds)] = 0
+        return np.maximum(bounds.max(axis=0), 0) if len(self) else np.zeros(from_l.shape[1])
+
+    def to_artefacts(self) -> Dict[str, np.ndarray]:
+        artefacts = {ARTEFACT_LANDMARKS: self.nodes, ARTEFACT_FROM: self.from_landmarks}
+        if self.to_landmarks is not self.from_landmarks:
+            artefacts[ARTEFACT_TO] = self.to_landmarks
+        return artefacts
+
+    @classmethod
+    def from_graph(cls, g: CompiledGraph) -> Optional['Landmarks']:
+        """
+        The landmarks stored in the artefacts of g, None when it has none
+        """
+        if ARTEFACT_LANDMARKS not in g.artefacts:
+            return None
+        from_landmarks = g.artefacts[ARTEFACT_FROM]
+        return cls(g.artefacts[ARTEFACT_LANDMARKS], from_landmarks, g.artefacts.get(ARTEFACT_TO, from_landmarks))
+
+
+class AltPotential(BlockTable):
+    """
+    node -> factor * ALT lower bound of the distance from node to target
+    """
+    __slots__ = ('target', 'factor', '_landmarks')
+
+    def __init__(self, landmarks: Landmarks, target: NodeId, factor: float = 1.):
+        super().__init__()
+        self.target = target
+        self.factor = factor
+        self._landmarks = landmarks
+
+    def _values(self, start: int, end: int) -> np.ndarray:
+        return self._landmarks.lower_bounds(self.target, start, end) * self.factor
+
+
+def _farthest(dist_to_landmarks: np.ndarray) -> int:
+    # the reachable node the farthest from the closest landmark
+    closest = dist_to_landmarks.min(axis=0)
+    closest[~np.isfinite(closest)] = -1
+    return int(np.argmax(closest))
+
+
+def _avoid(g: CompiledGraph, arcs: Tuple[List, List, List], landmarks: Landmarks, root: int) -> int:
+    """
+    The "avoid" strategy of Goldberg & Werneck: in the shortest path tree of root, weight every node by how badly
+    the current landmarks bound its distance to root, sum the weights of the subtrees that hold no landmark yet,
+    then go down from the heaviest node through its heaviest children to a leaf
+    """
+    dist, parent = shortest_path_tree(*arcs, root)
+    reached = np.flatnonzero(np.isfinite(dist))
+    weight = np.zeros(g.node_count)
+    weight[reached] = dist[reached] - landmarks.lower_bounds(root)[reached]
+
+    size = weight.copy()
+    has_landmark = np.zeros(g.node_count, dtype=bool)
+    has_landmark[np.asarray(landmarks.nodes, dtype=np.int64)] = True
+    # children before their parent
+    for node in reached[np.argsort(-dist[reached], kind='stable')].tolist():
+        p = parent[node]
+        if p >= 0:
+            size[p] += size[node]
+            has_landmark[p] |= has_landmark[node]
+    size[has_landmark] = 0
+
+    children: Dict[int, List[int]] = {}
+    for node in reached.tolist():
+        if parent[node] >= 0:
+            children.setdefault(int(parent[node]), []).append(node)
+
+    node = int(np.argmax(size))
+    while node in children:
+        node = max(children[node], key=lambda child: size[child])
+    return node
+
+
+def build_landmarks(g: CompiledGraph, count: int = 16, strategy: str = 'avoid', seed: int = 0) -> Landmarks:
+    """
+    Pick count landmarks and compute the distances from and to each of them, a few Dijkstra per landmark
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError('unknown landmark strategy {}, expected one of {}'.format(strategy, STRATEGIES))
+    rnd = random.Random(seed)
+    forward = (g.offsets.tolist(), g.targets.tolist(), np.asarray(g.lengths).tolist())
+    symmetric = is_symmetric(g)
+    backward = forward if symmetric else tuple(a.tolist() for a in reverse_arcs(g))
+
+    nodes: List[int] = []
+    from_rows: List[np.ndarray] = []
+    to_rows: List[np.ndarray] = []
+
+    def add(node: int):
+        nodes.append(node)
+        from_rows.append(shortest_path_tree(*forward, node)[0])
+        to_rows.append(from_rows[-1] if symmetric else shortest_path_tree(*backward, node)[0])
+
+    def current() -> Landmarks:
+        from_l = np.array(from_rows).reshape(len(nodes), g.node_count)
+        return Landmarks(np.array(nodes, dtype=np.int32), from_l,
+                         from_l if symmetric else np.array(to_rows).reshape(len(nodes), g.node_count))
+
+    # the first landmark is the farthest node from a random one, on the edge of the graph
+    first = shortest_path_tree(*forward, rnd.randrange(g.node_count))[0]
+    first[~np.isfinite(first)] = -1
+    add(int(np.argmax(first)))
+
+    while len(nodes) < min(count, g.node_count):
+        if strategy == 'farthest':
+            node = _farthest(np.array(from_rows))
+        else:
+            node = _avoid(g, forward, current(), rnd.randrange(g.node_count))
+        if node in nodes:
+            break
+        add(node)
+
+    return current()
@@ -0,0 +1,116 @@
+from typing import Dict, List, Optional, Set, Tuple, Union
+import heapq
+
+import networkx as nx
+import numpy as np
+
+from algorithms.inner_types import NodeId, TravelMode
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.contraction import ContractionHierarchy, upward_search
+
+WALKING_SPEED = 1.4
+BIKE_SPEED = 3.3
+
+SPEEDS = {TravelMode.WALKING: WALKING_SPEED, TravelMode.BIKE: BIKE_SPEED}
+
+# Many to many durations, without a search per pair.
+#
+# With a contraction hierarchy stored with the graph (build_contraction_hierarchy.py), the matrix is built with
+# buckets, see Knopp et al., "Computing many-to-many shortest paths using highway hierarchies": a backward upward
+# search from every target leaves (target, distance) in the bucket of every node it reaches, then a forward
+# upward search from every source meets them. A pair costs a few array operations instead of a search.
+# Otherwise it's one Dijkstra per source, stopped as soon as all the targets are settled or at the limit.
+
+
+def one_to_many(g: CompiledGraph, source: int, targets: Dict[int, List[int]], max_cost: float,
+                row: np.ndarray):
+    """
+    Fill row[j] with the distance from source to the node of every column j of targets (node -> columns),
+    the Dijkstra stops once all of them are settled or at max_cost
+    """
+    remaining = len(targets)
+    inf = float('inf')
+    dist = {source: 0.}
+    settled: Set[int] = set()
+    heap = [(0., source)]
+    while heap and remaining:
+        cost, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        if cost > max_cost:
+            break
+        settled.add(node)
+        columns = targets.get(node)
+        if columns is not None:
+            row[columns] = cost
+            remaining -= 1
+        for end_node, length, _ in g.adjacent(node):
+            new_cost = cost + length
+            if new_cost < dist.get(end_node, inf):
+                dist[end_node] = new_cost
+                heapq.heappush(heap, (new_cost, end_node))
+
+
+def dijkstra_matrix(g: CompiledGraph, sources: List[int], targets: List[int], max_cost: float) -> np.ndarray:
+    metres = np.full((len(sources), len(targets)), np.inf)
+    columns: Dict[int, List[int]] = {}
+    for j, target in enumerate(targets):
+        columns.setdefault(target, []).append(j)
+    for i, source in enumerate(sources):
+        one_to_many(g, source, columns, max_cost, metres[i])
+    return metres
+
+
+def bucket_matrix(hierarchy: ContractionHierarchy, sources: List[int], targets: List[int],
+                  max_cost: float) -> np.ndarray:
+    metres = np.full((len(sources), len(targets)), np.inf)
+
+    # node -> (columns, distances to the targets of these columns)
+    buckets: Dict[int, Tuple[List[int], List[float]]] = {}
+    for j, target in enumerate(targets):
+        for node, cost in upward_search(hierarchy, target, forward=False, max_cost=max_cost).items():
+            bucket = buckets.get(node)
+            if bucket is None:
+                bucket = buckets[node] = ([], [])
+            bucket[0].append(j)
+            bucket[1].append(cost)
+    arrays = {node: (np.array(columns), np.array(costs)) for node, (columns, costs) in buckets.items()}
+
+    for i, source in enumerate(sources):
+        row = metres[i]
+        for node, cost in upward_search(hierarchy, source, max_cost=max_cost).items():
+            bucket = arrays.get(node)
+            if bucket is not None:
+                # a target appears once per bucket, the fancy assignment doesn't lose any minimum
+                columns, costs = bucket
+                row[columns] = np.minimum(row[columns], costs + cost)
+    return metres
+
+
+def matrix(g: Union[nx.MultiDiGraph, CompiledGraph],
+           sources: List[NodeId],
+           targets: List[NodeId],
+           mode: TravelMode = TravelMode.WALKING,
+           limit: float = float('inf'),
+           hierarchy: Optional[ContractionHierarchy] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    The seconds and metres matrices from every source (rows) to every target (columns), in their order,
+    inf when the target can't be reached within limit seconds
+
+    hierarchy defaults to the one stored with the graph, if any.
+    """
+    graph = as_compiled(g)
+    speed = SPEEDS[mode]
+    source_indices, target_indices = graph.node_indices(sources), graph.node_indices(targets)
+    max_cost = limit * speed
+
+    if hierarchy is None:
+        hierarchy = ContractionHierarchy.from_graph(graph)
+
+    if hierarchy is not None:
+        metres = bucket_matrix(hierarchy, source_indices, target_indices, max_cost)
+    else:
+        metres = dijkstra_matrix(graph, source_indices, target_indices, max_cost)
+
+    metres[metres > max_cost] = np.inf
+    return metres / speed, metres
@@ -1,29 +1,67 @@
 from dataclasses import dataclass
 import networkx as nx
+import numpy as np
 from typing import *
 
 from .inner_types import *
 from .isochrone import Isocrhone
 from .double_astar import DoubleAstar
 from .astar import AStar
+from .graph import CompiledGraph, as_compiled
+from .station_table import StationTable
+from .seed_pruning import SeedStats, prune_seeds
+from .workspace import SearchWorkspace
 from call_backs import double_astar_call_back
 
 WALKING_SPEED = 1.4
 BIKE_SPEED = 3.3
 
 
+def _path_secs(graph: CompiledGraph, route: List[NodeId], speed: float) -> float:
+    # the seconds of the route, arc by arc like the labels of a search
+    secs = 0.
+    nodes = graph.node_indices(route)
+    for node, end_node in zip(nodes, nodes[1:]):
+        start = graph.offsets[node]
+        arc = start + graph.targets[start:graph.offsets[node + 1]].tolist().index(end_node)
+        secs = secs + float(graph.lengths[arc]) / speed
+    return secs
+
+
 @dataclass
 class MultiModalAStart(object):
 
-    _foward_isocrhone: Isocrhone = Isocrhone(speed=WALKING_SPEED)
-    _backward_isocrhone: Isocrhone = Isocrhone(speed=WALKING_SPEED)
+    _foward_isocrhone: Isocrhone = None
+    _backward_isocrhone: Isocrhone = None
+
+    _double_astar: DoubleAstar = None
+
+    # the walking legs
+    _forward_astar: AStar = None
+    _backward_astar: AStar = None
+
+    _workspace: SearchWorkspace = None
 
-    _double_astar: DoubleAstar = DoubleAstar(speed=BIKE_SPEED)
+    # the stations dominated by another one aren't seeded, see seed_pruning.py
+    _prune_seeds: bool = True
+    _seed_stats: SeedStats = None
+
+    def __post_init__(self):
+        # every sub search borrows its buffers from a child of the workspace, they're reused by the next query
+        if self._workspace is None:
+            self._workspace = SearchWorkspace()
+        self._foward_isocrhone = Isocrhone(speed=WALKING_SPEED, workspace=self._workspace.child('forward_isochrone'))
+        self._backward_isocrhone = Isocrhone(speed=WALKING_SPEED,
+                                             workspace=self._workspace.child('backward_isochrone'))
+        self._double_astar = DoubleAstar(speed=BIKE_SPEED, workspace=self._workspace.child('double_astar'))
+        self._forward_astar = AStar(speed=WALKING_SPEED, workspace=self._workspace.child('forward_astar'))
+        self._backward_astar = AStar(speed=WALKING_SPEED, workspace=self._workspace.child('backward_astar'))
 
     def init(self):
         self._foward_isocrhone.init()
         self._backward_isocrhone.init()
         self._double_astar.init()
+        self._seed_stats = SeedStats()
 
     def get_best_path(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId, bss_nodes: Set[NodeId]) -> \
         Tuple[Tuple[List[NodeId], List[NodeId], List[NodeId]], Tuple[float, float, float]]:
@@ -35,20 +73,79 @@ class MultiModalAStart(object):
         if not forward_isochrone or not backward_isochrone:
             return []
 
-        for node, cost in forward_isochrone.items():
-            self._double_astar.init_forward(g, node, dest, 0, cost.secs * BIKE_SPEED)
-
-        for node, cost in backward_isochrone.items():
-            self._double_astar.init_backward(g, orig, node, 0, cost.secs * BIKE_SPEED)
-
-        bss_route, bike_secs = self._double_astar.run(g, orig, dest)
+        graph = as_compiled(g)
+        table = StationTable.from_graph(graph)
+        bike_leg = self._table_bike_leg(graph, table, forward_isochrone, backward_isochrone) \
+            if table is not None else None
+        if bike_leg is None:
+            forward_seeds, backward_seeds = forward_isochrone.keys(), backward_isochrone.keys()
+            if self._prune_seeds:
+                # the backward isochrone goes from dest, its paths are walked the other way on a symmetric graph only
+                symmetric = graph.is_symmetric()
+                forward_seeds = prune_seeds({node: cost.secs for node, cost in forward_isochrone.items()},
+                                            lambda node: self._foward_isocrhone.get_path(node)[1:-1],
+                                            WALKING_SPEED / BIKE_SPEED, symmetric, self._seed_stats)
+                backward_seeds = prune_seeds({node: cost.secs for node, cost in backward_isochrone.items()},
+                                             lambda node: self._backward_isocrhone.get_path(node)[1:-1]
+                                             if symmetric else (), WALKING_SPEED / BIKE_SPEED, symmetric,
+                                             self._seed_stats)
+            else:
+                self._seed_stats.seeds += len(forward_isochrone) + len(backward_isochrone)
+
+            for node, cost in forward_isochrone.items():
+                if node in forward_seeds:
+                    self._double_astar.init_forward(g, node, dest, 0, cost.secs * BIKE_SPEED)
+
+            for node, cost in backward_isochrone.items():
+                if node in backward_seeds:
+                    self._double_astar.init_backward(g, orig, node, 0, cost.secs * BIKE_SPEED)
+
+            bike_leg = self._double_astar.run(g, orig, dest)
+
+        bss_route, bike_secs = bike_leg
+        if not bss_route:
+            return []
 
         forward_bss = bss_route[0]
         backward_bss = bss_route[-1]
 
-        forward_walking_route, forward_secs = AStar(speed=WALKING_SPEED).get_best_path(g, orig, forward_bss)
-
-        backward_walking_route, backward_secs = AStar(speed=WALKING_SPEED).get_best_path(g, backward_bss, dest)
+        # the walking legs are the paths of the isochrones to the stations, the backward one goes from dest and is
+        # only the same path reversed when every arc has a twin. A bike leg of DoubleAstar can end beside a station.
+        if forward_bss in forward_isochrone:
+            forward_walking_route = self._foward_isocrhone.get_path(forward_bss)
+            forward_secs = forward_isochrone[forward_bss].secs
+        else:
+            forward_walking_route, forward_secs = self._forward_astar.get_best_path(g, orig, forward_bss)
+
+        if backward_bss in backward_isochrone and graph.is_symmetric():
+            backward_walking_route = self._backward_isocrhone.get_path(backward_bss)[::-1]
+            # summed in the walking order, the seconds are the same float as a search from the station
+            backward_secs = _path_secs(graph, backward_walking_route, WALKING_SPEED)
+        else:
+            backward_walking_route, backward_secs = self._backward_astar.get_best_path(g, backward_bss, dest)
 
         return (forward_walking_route, bss_route, backward_walking_route), (forward_secs, bike_secs, backward_secs)
 
+    @staticmethod
+    def _table_bike_leg(graph: CompiledGraph, table: StationTable, forward_isochrone: Dict[NodeId, Cost],
+                        backward_isochrone: Dict[NodeId, Cost]) -> Optional[Tuple[List[NodeId], float]]:
+        """
+        The bike leg of the best pair of stations by the precomputed table, only its path is expanded.
+        None when a reached station isn't in the table.
+        """
+        forward_stations, backward_stations = list(forward_isochrone), list(backward_isochrone)
+        forward_columns = table.columns(graph.node_indices(forward_stations))
+        backward_columns = table.columns(graph.node_indices(backward_stations))
+        if forward_columns is None or backward_columns is None:
+            return None
+
+        # walking + bike + walking seconds of every pair of stations, a bike leg goes to another station
+        secs = np.array([forward_isochrone[node].secs for node in forward_stations])[:, None] \
+            + table.metres[np.ix_(forward_columns, backward_columns)] / BIKE_SPEED \
+            + np.array([backward_isochrone[node].secs for node in backward_stations])[None, :]
+        secs[forward_columns[:, None] == backward_columns[None, :]] = np.inf
+        i, j = np.unravel_index(np.argmin(secs), secs.shape)
+        if not np.isfinite(secs[i, j]):
+            return [], float('inf')
+        i, j = forward_columns[i], backward_columns[j]
+        return graph.to_osm_path(table.path(i, j)), float(table.metres[i, j]) / BIKE_SPEED
@@ -1,14 +1,18 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import *
-from collections import defaultdict
-import weakref
 
 import networkx as nx
 
 from .inner_types import *
 from priority_queue import PriorityQueue
-from algorithms import utils
-from algorithms.inner_types import NodeId, EdgeId, Cost, EdgeLabel, EdgeStatus, EdgeLabelIdx
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.geo import BlockTable, DistanceTable
+from algorithms.landmarks import Landmarks, usable_landmarks
+from algorithms.inner_types import NodeId, EdgeLabelIdx
+from algorithms.label_store import EdgeLabelStore, EdgeStatusStore
+from algorithms.seed_pruning import SeedStats, is_dominated
+from algorithms.station_bounds import StationBounds
+from algorithms.workspace import SearchWorkspace
 
 
 kThresholdDelta = 50.
@@ -19,8 +23,9 @@ BIKE_SPEED = 3.3
 
 @dataclass
 class BestConnection:
-    forward: EdgeId = EdgeId(-1, -1)
-    backward: EdgeId = EdgeId(-1, -1)
+    # the edge ids where the forward and backward searches meet, None when a bike search meets at its station
+    forward: Optional[int] = -1
+    backward: Optional[int] = -1
     cost: float = float('inf')
     mode: str = None
 
@@ -29,27 +34,28 @@ class BestConnection:
 class MultiModalDoubleExpansionAStar(object):
 
     # Walking
-    _edge_labels_walking_forward: List[EdgeLabel] = field(default_factory=list)
-    _edge_labels_walking_backward: List[EdgeLabel] = field(default_factory=list)
+    _edge_labels_walking_forward: EdgeLabelStore = field(init=False)
+    _edge_labels_walking_backward: EdgeLabelStore = field(init=False)
 
-    _adjacency_list_walking_forward: PriorityQueue = PriorityQueue()
-    _adjacency_list_walking_backward: PriorityQueue = PriorityQueue()
+    _adjacency_list_walking_forward: PriorityQueue = field(init=False)
+    _adjacency_list_walking_backward: PriorityQueue = field(init=False)
 
-    _edges_status_walking_forward: Dict[EdgeId, EdgeStatus] = field(default_factory=lambda: defaultdict(EdgeStatus))
-    _edges_status_walking_backward: Dict[EdgeId, EdgeStatus] = field(default_factory=lambda: defaultdict(EdgeStatus))
+    _edges_status_walking_forward: EdgeStatusStore = None
+    _edges_status_walking_backward: EdgeStatusStore = None
 
     # Bike
-    _edge_labels_bike_forward: List[EdgeLabel] = field(default_factory=list)
-    _edge_labels_bike_backward: List[EdgeLabel] = field(default_factory=list)
+    _edge_labels_bike_forward: EdgeLabelStore = field(init=False)
+    _edge_labels_bike_backward: EdgeLabelStore = field(init=False)
 
-    _adjacency_list_bike_forward: PriorityQueue = PriorityQueue()
-    _adjacency_list_bike_backward: PriorityQueue = PriorityQueue()
+    _adjacency_list_bike_forward: PriorityQueue = field(init=False)
+    _adjacency_list_bike_backward: PriorityQueue = field(init=False)
 
-    _edges_status_bike_forward: Dict[EdgeId, EdgeStatus] = field(default_factory=lambda: defaultdict(EdgeStatus))
-    _edges_status_bike_backward: Dict[EdgeId, EdgeStatus] = field(default_factory=lambda: defaultdict(EdgeStatus))
+    _edges_status_bike_forward: EdgeStatusStore = None
+    _edges_status_bike_backward: EdgeStatusStore = None
 
+    # the great circle heuristic of both modes, when the graph has no station bounds
     _cost_factor: float = 0.3
-    _best_path: BestConnection = BestConnection()
+    _best_path: BestConnection = field(default_factory=BestConnection)
 
     _forward_walking_bss: Dict[NodeId, EdgeLabelIdx] = field(default_factory=dict)
     _backward_walking_bss: Dict[NodeId, EdgeLabelIdx] = field(default_factory=dict)
@@ -58,455 +64,445 @@ class MultiModalDoubleExpansionAStar(object):
     _bike_speed: float = BIKE_SPEED
 
     _threshold: float = float('inf')
-
-    @staticmethod
-    def _get_heuristic_cost_impl(g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId, cost_factor: float) -> float:
+    _queue_backend: object = 'heap'
+    # the buffers are borrowed from the workspace, init() gets them back empty
+    _workspace: SearchWorkspace = None
+    _graph: CompiledGraph = None
+    # target -> great circle distances or ALT potentials to it
+    _distances: Dict[NodeId, BlockTable] = field(default_factory=dict)
+    # when given on a symmetric graph, the ALT potential replaces the great circle heuristic and _cost_factor is
+    # unused, _alt holds them for the query
+    _landmarks: Optional[Landmarks] = None
+    _alt: Optional[Landmarks] = None
+    # the bounds of build_station_table.py when they cover the stations of the query and there are no landmarks,
+    # and (target, walking) -> their potential, see station_bounds.py
+    _station_bounds: Optional[StationBounds] = None
+    # the walk to the nearest station is a bound of the walk from it on a symmetric graph only, the backward
+    # searches fall back to the great circle heuristic on the others
+    _backward_station_bounds: Optional[StationBounds] = None
+    _potentials: Dict[Tuple[NodeId, bool], BlockTable] = field(default_factory=dict)
+
+    # the stations dominated by another one aren't seeded, see seed_pruning.py
+    _prune_seeds: bool = True
+    _seed_stats: SeedStats = field(default_factory=SeedStats)
+
+    def __post_init__(self):
+        if self._workspace is None:
+            self._workspace = SearchWorkspace()
+        self.init()
+
+    def init(self):
+        # the state of the previous query, an instance can serve one query after the other
+        self._edge_labels_walking_forward = self._workspace.labels('walking_forward')
+        self._edge_labels_walking_backward = self._workspace.labels('walking_backward')
+        self._edge_labels_bike_forward = self._workspace.labels('bike_forward')
+        self._edge_labels_bike_backward = self._workspace.labels('bike_backward')
+        self._adjacency_list_walking_forward = self._workspace.queue('walking_forward', self._queue_backend)
+        self._adjacency_list_walking_backward = self._workspace.queue('walking_backward', self._queue_backend)
+        self._adjacency_list_bike_forward = self._workspace.queue('bike_forward', self._queue_backend)
+        self._adjacency_list_bike_backward = self._workspace.queue('bike_backward', self._queue_backend)
+        self._forward_walking_bss = {}
+        self._backward_walking_bss = {}
+        self._distances = {}
+        self._potentials = {}
+        self._best_path = BestConnection()
+        self._threshold = float('inf')
+        self._seed_stats = SeedStats()
+
+    def _get_heuristic_cost_impl(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId, cost_factor: float) -> float:
+        if self._alt is not None:
+            return self._get_landmark_cost(start_node, end_node)
         if cost_factor == 0 or end_node is None:
             return 0
-        start_ll = utils.osm_to_pointll(g, start_node)
-        end_ll = utils.osm_to_pointll(g, end_node)
+        distances = self._distances.get(end_node)
+        if distances is None:
+            distances = self._distances[end_node] = DistanceTable(g, end_node)
+        return distances(start_node) * cost_factor
 
-        return start_ll.distance_to(end_ll) * cost_factor
-
-    def _get_walking_heuristic_cost(self, g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId) -> float:
+    def _get_landmark_cost(self, start_node: NodeId, end_node: NodeId) -> float:
+        if end_node is None:
+            return 0
+        potential = self._distances.get(end_node)
+        if potential is None:
+            # the rest of the way costs at least its length at the cheapest of the two modes per metre
+            potential = self._distances[end_node] = self._alt.potential(
+                end_node, min(1., self._walking_speed / self._bike_speed))
+        return potential(start_node)
+
+    def _get_station_cost(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId, walking: bool) -> float:
+        if end_node is None:
+            return 0
+        potential = self._potentials.get((end_node, walking))
+        if potential is None:
+            potential = self._potentials[(end_node, walking)] = self._station_bounds.potential(
+                g, end_node, self._walking_speed / self._bike_speed, walking)
+        return potential(start_node)
+
+    def _get_walking_heuristic_cost(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId,
+                                    backward: bool = False) -> float:
+        if (self._backward_station_bounds if backward else self._station_bounds) is not None:
+            return self._get_station_cost(g, start_node, end_node, True)
         return self._get_heuristic_cost_impl(g, start_node, end_node, self._cost_factor)
 
-    def _get_bike_heuristic_cost(self, g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId) -> float:
+    def _get_bike_heuristic_cost(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId,
+                                 backward: bool = False) -> float:
+        if (self._backward_station_bounds if backward else self._station_bounds) is not None:
+            return self._get_station_cost(g, start_node, end_node, False)
         return self._get_heuristic_cost_impl(g, start_node, end_node, self._cost_factor)
 
-    @staticmethod
-    def _get_edge_status_impl(container: Dict[EdgeId, EdgeStatus], edge_id: EdgeId) -> EdgeStatus:
-        s = container.get(edge_id)
-        if not s:
-            return container[edge_id].set_unreached()
-        return s
-
-    def _get_edge_status_walking_forward(self, edge_id: EdgeId) -> EdgeStatus:
-        return self._get_edge_status_impl(self._edges_status_walking_forward, edge_id)
-
-    def _get_edge_status_walking_backward(self, edge_id: EdgeId) -> EdgeStatus:
-        return self._get_edge_status_impl(self._edges_status_walking_backward, edge_id)
-
-    def _get_edge_status_bike_forward(self, edge_id: EdgeId) -> EdgeStatus:
-        return self._get_edge_status_impl(self._edges_status_bike_forward, edge_id)
-
-    def _get_edge_status_bike_backward(self, edge_id: EdgeId) -> EdgeStatus:
-        return self._get_edge_status_impl(self._edges_status_bike_backward, edge_id)
-
-    def init_forward(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
-        for end_node in g.adj[orig]:
-            edge = g.adj[orig][end_node][0]
-
-            secs = edge['length'] / self._walking_speed + init_secs
-            cost = edge['length'] + init_cost
+    def _is_dominated_seed(self, labels: EdgeLabelStore, edge_label_idx: EdgeLabelIdx, is_seed: Callable,
+                           stations: Dict[NodeId, EdgeLabelIdx], symmetric: bool) -> bool:
+        # the station the label ends at, by the stations reached before it: the nearest one through the
+        # origin (destination) on a symmetric graph, or one on its walking path
+        if not self._prune_seeds:
+            return False
+        nearest = min((labels.secs[idx] for idx in stations.values()), default=None)
+        if symmetric and is_dominated(labels.secs[edge_label_idx], nearest,
+                                      self._walking_speed / self._bike_speed):
+            return True
+        return any(node in stations for node in self._walk_back(labels, edge_label_idx, is_seed)[1:-1])
+
+    def init_forward(self, g: CompiledGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
+        for end_node, length, edge in g.adjacent(orig):
+            secs = length / self._walking_speed + init_secs
+            cost = length + init_cost
             sort_cost = cost + self._get_walking_heuristic_cost(g, end_node, dest)
 
-            idx = len(self._edge_labels_walking_forward)
-            self._edge_labels_walking_forward.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                     sort_cost,
-                                                     EdgeId(orig, end_node),
-                                                     -1,
-                                                     end_node,
-                                                     is_origin=True,
-                                                     is_destination=False))
+            idx = self._edge_labels_walking_forward.append(cost, secs, sort_cost, orig, end_node, edge, -1,
+                                                           init_cost, init_secs, is_origin=True)
             self._adjacency_list_walking_forward.insert(sort_cost, idx)
-            self._edges_status_walking_forward[EdgeId(orig, end_node)] = EdgeStatus(idx).set_temporary()
-
-    def append_bike_forward(self, g: nx.MultiDiGraph, bss_node: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
-        for end_node in g.adj[bss_node]:
-            edge = g.adj[bss_node][end_node][0]
+            self._edges_status_walking_forward.set_temporary(edge, idx)
 
-            secs = edge['length'] / self._bike_speed + init_secs
-            cost = edge['length'] * (self._walking_speed / self._bike_speed) + init_cost
+    def append_bike_forward(self, g: CompiledGraph, bss_node: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
+        for end_node, length, edge in g.adjacent(bss_node):
+            secs = length / self._bike_speed + init_secs
+            cost = length * (self._walking_speed / self._bike_speed) + init_cost
             sort_cost = cost + self._get_bike_heuristic_cost(g, end_node, dest)
 
             # let's see if the edge has already been visited?
-            edge_status = self._edges_status_bike_forward[EdgeId(bss_node, end_node)]
-            if edge_status.is_permanent():
+            if self._edges_status_bike_forward.is_permanent(edge):
                 # if it's permanent is this edge has less cost?
-                edge_label_idx = edge_status.edge_label_index
-                lab = weakref.proxy(self._edge_labels_bike_forward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if cost > lab.cost.cost:
+                edge_label_idx = self._edges_status_bike_forward.label_index[edge]
+                labels = self._edge_labels_bike_forward
+                if labels.end_node[edge_label_idx] == end_node:
+                    if cost > labels.cost[edge_label_idx]:
                         continue
                     self._adjacency_list_bike_forward.insert(new_key=sort_cost,
                                                              item=edge_label_idx)
-                    lab.pred_idx = -1
-                    lab.end_node = end_node
-                    lab.cost = Cost(cost, secs, init_cost, init_secs)
-                    lab.is_origin = True
-                    lab.is_destination = False
+                    labels.update(edge_label_idx, cost, secs, init_cost, init_secs,
+                                  labels.start[edge_label_idx], end_node, -1)
+                    labels.set_origin(edge_label_idx)
 
             else:
-                idx = len(self._edge_labels_bike_forward)
-                self._edge_labels_bike_forward.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                         sort_cost,
-                                                         EdgeId(bss_node, end_node),
-                                                         -1,
-                                                         end_node,
-                                                         is_origin=True,
-                                                         is_destination=False))
+                idx = self._edge_labels_bike_forward.append(cost, secs, sort_cost, bss_node, end_node, edge, -1,
+                                                            init_cost, init_secs, is_origin=True)
                 self._adjacency_list_bike_forward.insert(sort_cost, idx)
-                self._edges_status_bike_forward[EdgeId(bss_node, end_node)] = EdgeStatus(idx).set_temporary()
-
-    def init_backward(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
-        for end_node in g.adj[dest]:
-            edge = g.adj[dest][end_node][0]
-
-            secs = edge['length'] / self._walking_speed + init_secs
-            cost = edge['length'] + init_cost
-            sort_cost = cost + self._get_walking_heuristic_cost(g, end_node, orig)
-
-            idx = len(self._edge_labels_walking_backward)
-            self._edge_labels_walking_backward.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                      sort_cost,
-                                                      EdgeId(dest, end_node),
-                                                      -1,
-                                                      end_node,
-                                                      is_origin=False,
-                                                      is_destination=True))
-            self._adjacency_list_walking_backward.insert(sort_cost, idx)
-            self._edges_status_walking_backward[EdgeId(dest, end_node)] = EdgeStatus(idx).set_temporary()
+                self._edges_status_bike_forward.set_temporary(edge, idx)
+
+    def init_backward(self, g: CompiledGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
+        for end_node, length, edge in g.adjacent(dest):
+            secs = length / self._walking_speed + init_secs
+            cost = length + init_cost
+            sort_cost = cost + self._get_walking_heuristic_cost(g, end_node, orig, backward=True)
 
-    def append_bike_backward(self, g: nx.MultiDiGraph, bss_node: NodeId, orig: NodeId, init_secs: float = 0, init_cost: float = 0):
-        for end_node in g.adj[bss_node]:
-            edge = g.adj[bss_node][end_node][0]
+            idx = self._edge_labels_walking_backward.append(cost, secs, sort_cost, dest, end_node, edge, -1,
+                                                            init_cost, init_secs, is_destination=True)
+            self._adjacency_list_walking_backward.insert(sort_cost, idx)
+            self._edges_status_walking_backward.set_temporary(edge, idx)
 
-            secs = edge['length'] / self._bike_speed + init_secs
-            cost = edge['length'] * (self._walking_speed / self._bike_speed) + init_cost
-            sort_cost = cost + self._get_bike_heuristic_cost(g, end_node, orig)
-            edge_status = self._edges_status_bike_backward[EdgeId(bss_node, end_node)]
+    def append_bike_backward(self, g: CompiledGraph, bss_node: NodeId, orig: NodeId, init_secs: float = 0, init_cost: float = 0):
+        for end_node, length, edge in g.adjacent(bss_node):
+            secs = length / self._bike_speed + init_secs
+            cost = length * (self._walking_speed / self._bike_speed) + init_cost
+            sort_cost = cost + self._get_bike_heuristic_cost(g, end_node, orig, backward=True)
 
-            if edge_status.is_permanent():
+            if self._edges_status_bike_backward.is_permanent(edge):
                 # if it's permanent is this edge has less cost?
-                edge_label_idx = edge_status.edge_label_index
-                lab = weakref.proxy(self._edge_labels_bike_backward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if cost > lab.cost.cost:
+                edge_label_idx = self._edges_status_bike_backward.label_index[edge]
+                labels = self._edge_labels_bike_backward
+                if labels.end_node[edge_label_idx] == end_node:
+                    if cost > labels.cost[edge_label_idx]:
                         continue
                     self._adjacency_list_bike_backward.insert(new_key=sort_cost,
                                                               item=edge_label_idx)
-                    lab.pred_idx = -1
-                    lab.end_node = end_node
-                    lab.cost = Cost(cost, secs, init_cost, init_secs)
-                    lab.is_origin = False
-                    lab.is_destination = True
+                    labels.update(edge_label_idx, cost, secs, init_cost, init_secs,
+                                  labels.start[edge_label_idx], end_node, -1)
+                    labels.set_destination(edge_label_idx)
             else:
-                idx = len(self._edge_labels_bike_backward)
-                self._edge_labels_bike_backward.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                                 sort_cost,
-                                                                 EdgeId(bss_node, end_node),
-                                                                 -1,
-                                                                 end_node,
-                                                                 is_origin=False,
-                                                                 is_destination=True))
+                idx = self._edge_labels_bike_backward.append(cost, secs, sort_cost, bss_node, end_node, edge, -1,
+                                                             init_cost, init_secs, is_destination=True)
                 self._adjacency_list_bike_backward.insert(sort_cost, idx)
-                self._edges_status_bike_backward[EdgeId(bss_node, end_node)] = EdgeStatus(idx).set_temporary()
+                self._edges_status_bike_backward.set_temporary(edge, idx)
 
-    def expand_walking_forward(self, g: nx.MultiDiGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId):
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._get_edge_status_walking_forward(EdgeId(node, end_node))
+    def expand_walking_forward(self, g: CompiledGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId):
+        labels = self._edge_labels_walking_forward
+        edges_status = self._edges_status_walking_forward
+        pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+        init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
 
-            if edge_status.is_permanent():
+        for end_node, length, edge in g.adjacent(node):
+            if edges_status.is_permanent(edge):
                 continue
 
-            pred = self._edge_labels_walking_forward[pred_idx]
-
-            new_cost = pred.cost + Cost(edge['length'], edge['length'] / self._walking_speed)
-            edge_id = EdgeId(node, end_node)
+            new_cost = pred_cost + length
+            new_secs = pred_secs + length / self._walking_speed
 
-            sort_cost = new_cost.cost + self._get_walking_heuristic_cost(g, end_node, dest)
+            sort_cost = new_cost + self._get_walking_heuristic_cost(g, end_node, dest)
 
             # the edge has been visited
-            if edge_status.is_temporary():
-                lab = weakref.proxy(self._edge_labels_walking_forward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_walking_forward.insert(new_key=sort_cost,
-                                                            item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+            if edges_status.is_temporary(edge):
+                lab_idx = edges_status.label_index[edge]
+                if labels.end_node[lab_idx] == end_node:
+                    if new_cost < labels.cost[lab_idx]:
+                        self._adjacency_list_walking_forward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
 
                 # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length']):
-                        self._adjacency_list_walking_forward.insert(new_key=sort_cost,
-                                                            item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+                elif labels.end_node[lab_idx] == node:
+                    if new_cost < (labels.cost[lab_idx] - length):
+                        self._adjacency_list_walking_forward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
                 continue
 
-            idx = len(self._edge_labels_walking_forward)
-            self._edge_labels_walking_forward.append(EdgeLabel(new_cost,
-                                                               sort_cost,
-                                                               edge_id,
-                                                               pred_idx,
-                                                               end_node))
+            idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, edge, pred_idx, init_cost, init_secs)
 
-            self._edges_status_walking_forward[edge_id] = EdgeStatus(idx).set_temporary()
+            edges_status.set_temporary(edge, idx)
             self._adjacency_list_walking_forward.insert(sort_cost, idx)
 
     def expand_walking_backward(self, g, node, pred_idx, origin):
+        labels = self._edge_labels_walking_backward
+        edges_status = self._edges_status_walking_backward
+        pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+        init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
 
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._get_edge_status_walking_backward(EdgeId(node, end_node))
-
-            if edge_status.is_permanent():
+        for end_node, length, edge in g.adjacent(node):
+            if edges_status.is_permanent(edge):
                 continue
 
-            pred = self._edge_labels_walking_backward[pred_idx]
-
-            new_cost = pred.cost + Cost(edge['length'], edge['length'] / self._walking_speed)
-            edge_id = EdgeId(node, end_node)
+            new_cost = pred_cost + length
+            new_secs = pred_secs + length / self._walking_speed
 
-            sort_cost = new_cost.cost + self._get_walking_heuristic_cost(g, end_node, origin)
+            sort_cost = new_cost + self._get_walking_heuristic_cost(g, end_node, origin, backward=True)
 
             # the edge has been visited
-            if edge_status.is_temporary():
-                lab = weakref.proxy(self._edge_labels_walking_backward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_walking_backward.insert(new_key=sort_cost,
-                                                                     item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+            if edges_status.is_temporary(edge):
+                lab_idx = edges_status.label_index[edge]
+                if labels.end_node[lab_idx] == end_node:
+                    if new_cost < labels.cost[lab_idx]:
+                        self._adjacency_list_walking_backward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
 
                 # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length']):
-                        self._adjacency_list_walking_backward.insert(new_key=sort_cost,
-                                                                     item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+                elif labels.end_node[lab_idx] == node:
+                    if new_cost < (labels.cost[lab_idx] - length):
+                        self._adjacency_list_walking_backward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
                 continue
 
-            idx = len(self._edge_labels_walking_backward)
-            self._edge_labels_walking_backward.append(EdgeLabel(new_cost,
-                                                                sort_cost,
-                                                                edge_id,
-                                                                pred_idx,
-                                                                end_node))
+            idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, edge, pred_idx, init_cost, init_secs)
 
-            self._edges_status_walking_backward[edge_id] = EdgeStatus(idx).set_temporary()
+            edges_status.set_temporary(edge, idx)
             self._adjacency_list_walking_backward.insert(sort_cost, idx)
 
-    def expand_bike_forward(self, g: nx.MultiDiGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId):
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._get_edge_status_bike_forward(EdgeId(node, end_node))
+    def expand_bike_forward(self, g: CompiledGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId):
+        labels = self._edge_labels_bike_forward
+        edges_status = self._edges_status_bike_forward
+        pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+        init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
 
-            if edge_status.is_permanent():
+        for end_node, length, edge in g.adjacent(node):
+            if edges_status.is_permanent(edge):
                 continue
 
-            pred = self._edge_labels_bike_forward[pred_idx]
-
-            new_cost = pred.cost + Cost(edge['length'] * self._walking_speed / self._bike_speed,
-                                        edge['length'] / self._bike_speed)
-            edge_id = EdgeId(node, end_node)
+            new_cost = pred_cost + length * self._walking_speed / self._bike_speed
+            new_secs = pred_secs + length / self._bike_speed
 
-            sort_cost = new_cost.cost + self._get_bike_heuristic_cost(g, end_node, dest)
+            sort_cost = new_cost + self._get_bike_heuristic_cost(g, end_node, dest)
 
             # the edge has been visited
-            if edge_status.is_temporary():
-                lab = weakref.proxy(self._edge_labels_bike_forward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_bike_forward.insert(new_key=sort_cost,
-                                                                 item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+            if edges_status.is_temporary(edge):
+                lab_idx = edges_status.label_index[edge]
+                if labels.end_node[lab_idx] == end_node:
+                    if new_cost < labels.cost[lab_idx]:
+                        self._adjacency_list_bike_forward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
 
                 # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length'] * (self._walking_speed / self._bike_speed)):
-                        self._adjacency_list_bike_forward.insert(new_key=sort_cost,
-                                                                 item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+                elif labels.end_node[lab_idx] == node:
+                    if new_cost < (labels.cost[lab_idx] - length * (self._walking_speed / self._bike_speed)):
+                        self._adjacency_list_bike_forward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
                 continue
 
-            idx = len(self._edge_labels_bike_forward)
-            self._edge_labels_bike_forward.append(EdgeLabel(new_cost,
-                                                            sort_cost,
-                                                            edge_id,
-                                                            pred_idx,
-                                                            end_node))
+            idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, edge, pred_idx, init_cost, init_secs)
 
-            self._edges_status_bike_forward[edge_id] = EdgeStatus(idx).set_temporary()
+            edges_status.set_temporary(edge, idx)
             self._adjacency_list_bike_forward.insert(sort_cost, idx)
 
     def expand_bike_backward(self, g, node, pred_idx, origin):
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._get_edge_status_bike_backward(EdgeId(node, end_node))
+        labels = self._edge_labels_bike_backward
+        edges_status = self._edges_status_bike_backward
+        pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+        init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
 
-            if edge_status.is_permanent():
+        for end_node, length, edge in g.adjacent(node):
+            if edges_status.is_permanent(edge):
                 continue
 
-            pred = self._edge_labels_bike_backward[pred_idx]
+            new_cost = pred_cost + length * self._walking_speed / self._bike_speed
+            new_secs = pred_secs + length / self._bike_speed
 
-            new_cost = pred.cost + Cost(edge['length'] * self._walking_speed / self._bike_speed,
-                                        edge['length'] / self._bike_speed)
-            edge_id = EdgeId(node, end_node)
-
-            sort_cost = new_cost.cost + self._get_bike_heuristic_cost(g, end_node, origin)
+            sort_cost = new_cost + self._get_bike_heuristic_cost(g, end_node, origin, backward=True)
 
             # the edge has been visited
-            if edge_status.is_temporary():
-                lab = weakref.proxy(self._edge_labels_bike_backward[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_bike_backward.insert(new_key=sort_cost,
-                                                                  item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+            if edges_status.is_temporary(edge):
+                lab_idx = edges_status.label_index[edge]
+                if labels.end_node[lab_idx] == end_node:
+                    if new_cost < labels.cost[lab_idx]:
+                        self._adjacency_list_bike_backward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
 
                 # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length'] * (self._walking_speed / self._bike_speed)):
-                        self._adjacency_list_bike_backward.insert(new_key=sort_cost,
-                                                                  item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+                elif labels.end_node[lab_idx] == node:
+                    if new_cost < (labels.cost[lab_idx] - length * (self._walking_speed / self._bike_speed)):
+                        self._adjacency_list_bike_backward.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
                 continue
 
-            idx = len(self._edge_labels_bike_backward)
-            self._edge_labels_bike_backward.append(EdgeLabel(new_cost,
-                                                             sort_cost,
-                                                             edge_id,
-                                                             pred_idx,
-                                                             end_node))
+            idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, edge, pred_idx, init_cost, init_secs)
 
-            self._edges_status_bike_backward[edge_id] = EdgeStatus(idx).set_temporary()
+            edges_status.set_temporary(edge, idx)
             self._adjacency_list_bike_backward.insert(sort_cost, idx)
 
-    def set_forward_walking_connection(self, pred: EdgeId):
-
-        edge_status_backward = self._edges_status_walking_backward.get(pred)
-        edge_label_backward = edge_status_backward.edge_label_index
-
-        edge_status_forward = self._edges_status_walking_forward.get(pred)
-        edge_label_forward = edge_status_forward.edge_label_index
-        pred_idx_forward = self._edge_labels_walking_forward[edge_label_forward].pred_idx
-
-        c = self._edge_labels_walking_backward[edge_label_backward].cost \
-            + self._edge_labels_walking_forward[pred_idx_forward].cost
-
-        if c.cost < self._best_path.cost:
-            self._best_path = BestConnection(self._edge_labels_walking_forward[pred_idx_forward].edge_id,
-                                             self._edge_labels_walking_backward[edge_label_backward].edge_id,
-                                             c.cost,
+    def set_forward_walking_connection(self, pred: int):
+
+        edge_label_backward = self._edges_status_walking_backward.label_index[pred]
+        edge_label_forward = self._edges_status_walking_forward.label_index[pred]
+        pred_idx_forward = self._edge_labels_walking_forward.pred_idx[edge_label_forward]
+        if pred_idx_forward == -1:
+            # pred is an origin edge (cost[-1] would be the last label of the store): the path is the seed then
+            # the backward label before pred, a permanent label isn't a seed
+            self._set_walking_seed_connection(edge_label_forward,
+                                              self._edge_labels_walking_backward.pred_idx[edge_label_backward])
+            return
+
+        c = self._edge_labels_walking_backward.cost[edge_label_backward] \
+            + self._edge_labels_walking_forward.cost[pred_idx_forward]
+
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(self._edge_labels_walking_forward.edge[pred_idx_forward],
+                                             self._edge_labels_walking_backward.edge[edge_label_backward],
+                                             c,
                                              "walking")
 
     # backward searching reach on a edge reached by forward searching
-    def set_backward_walking_connection(self, pred: EdgeId):
-
-        edge_status_forward = self._edges_status_walking_forward.get(pred)
-        edge_label_forward = edge_status_forward.edge_label_index
-
-        edge_status_backward = self._edges_status_walking_backward.get(pred)
-        edge_label_backward = edge_status_backward.edge_label_index
-        pred_idx_backward = self._edge_labels_walking_backward[edge_label_backward].pred_idx
-
-        c = self._edge_labels_walking_backward[pred_idx_backward].cost \
-            + self._edge_labels_walking_forward[edge_label_forward].cost
+    def set_backward_walking_connection(self, pred: int):
+
+        edge_label_forward = self._edges_status_walking_forward.label_index[pred]
+        edge_label_backward = self._edges_status_walking_backward.label_index[pred]
+        pred_idx_backward = self._edge_labels_walking_backward.pred_idx[edge_label_backward]
+        if pred_idx_backward == -1:
+            # pred is a destination edge, see set_forward_walking_connection
+            self._set_walking_seed_connection(self._edge_labels_walking_forward.pred_idx[edge_label_forward],
+                                              edge_label_backward)
+            return
+
+        c = self._edge_labels_walking_backward.cost[pred_idx_backward] \
+            + self._edge_labels_walking_forward.cost[edge_label_forward]
+
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(self._edge_labels_walking_forward.edge[edge_label_forward],
+                                             self._edge_labels_walking_backward.edge[pred_idx_backward],
+                                             c,
+                                             "walking")
 
-        if c.cost < self._best_path.cost:
-            self._best_path = BestConnection(self._edge_labels_walking_forward[edge_label_forward].edge_id,
-                                             self._edge_labels_walking_backward[pred_idx_backward].edge_id,
-                                             c.cost,
+    def _set_walking_seed_connection(self, forward: EdgeLabelIdx, backward: EdgeLabelIdx):
+        # walking labels, one of them a seed, joined where they end: the searches may have reached the edge of the
+        # seed the other way
+        forward_labels, backward_labels = self._edge_labels_walking_forward, self._edge_labels_walking_backward
+        if forward_labels.end_node[forward] != backward_labels.end_node[backward]:
+            return
+        c = forward_labels.cost[forward] + backward_labels.cost[backward]
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(forward_labels.edge[forward], backward_labels.edge[backward], c,
                                              "walking")
 
     # forward searching reach on a edge reached by backward searching
-    def set_forward_bike_connection(self, pred: EdgeId):
-
-        edge_status_backward = self._edges_status_bike_backward.get(pred)
-        edge_label_backward = self._edge_labels_bike_backward[edge_status_backward.edge_label_index]
-
-        edge_status_forward = self._edges_status_bike_forward.get(pred)
-        edge_label_forward = self._edge_labels_bike_forward[edge_status_forward.edge_label_index]
-        # if pred_idx_forward == -1, it means that we are actually at the bss and there is no pred
-        pred_idx_forward = edge_label_forward.pred_idx
-
-        c = edge_label_backward.cost \
-            + (edge_label_forward.cost if pred_idx_forward == -1 else self._edge_labels_bike_forward[pred_idx_forward].cost)
-
-        if c.cost < self._best_path.cost:
-            self._best_path = BestConnection(None if pred_idx_forward == -1 else self._edge_labels_bike_forward[pred_idx_forward].edge_id,
-                                             edge_label_backward.edge_id,
-                                             c.cost,
+    def set_forward_bike_connection(self, pred: int):
+
+        labels_forward, labels_backward = self._edge_labels_bike_forward, self._edge_labels_bike_backward
+
+        edge_label_backward = self._edges_status_bike_backward.label_index[pred]
+        edge_label_forward = self._edges_status_bike_forward.label_index[pred]
+        # if pred_idx_forward == -1, it means that we are actually at the bss and there is no pred: the backward
+        # label has to end there, the ride costs the seed's init cost up to it
+        pred_idx_forward = labels_forward.pred_idx[edge_label_forward]
+        if pred_idx_forward == -1 and \
+           labels_backward.end_node[edge_label_backward] != labels_forward.start[edge_label_forward]:
+            return
+
+        c = labels_backward.cost[edge_label_backward] \
+            + (labels_forward.init_cost[edge_label_forward] if pred_idx_forward == -1
+               else labels_forward.cost[pred_idx_forward])
+
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(None if pred_idx_forward == -1 else labels_forward.edge[pred_idx_forward],
+                                             labels_backward.edge[edge_label_backward],
+                                             c,
                                              "bike")
 
     # backward searching reach on a edge reached by forward searching
-    def set_backward_bike_connection(self, pred: EdgeId):
-
-        edge_status_forward = self._edges_status_bike_forward.get(pred)
-        edge_label_forward = self._edge_labels_bike_forward[edge_status_forward.edge_label_index]
-
-        edge_status_backward = self._edges_status_bike_backward.get(pred)
-        edge_label_backward = self._edge_labels_bike_backward[edge_status_backward.edge_label_index]
-        # if pred_idx_backward == -1, it means that we are actually at the bss and there is no pred
-        pred_idx_backward = edge_label_backward.pred_idx
+    def set_backward_bike_connection(self, pred: int):
+
+        labels_forward, labels_backward = self._edge_labels_bike_forward, self._edge_labels_bike_backward
+
+        edge_label_forward = self._edges_status_bike_forward.label_index[pred]
+        edge_label_backward = self._edges_status_bike_backward.label_index[pred]
+        # if pred_idx_backward == -1, it means that we are actually at the bss and there is no pred, see
+        # set_forward_bike_connection
+        pred_idx_backward = labels_backward.pred_idx[edge_label_backward]
+        if pred_idx_backward == -1 and \
+           labels_forward.end_node[edge_label_forward] != labels_backward.start[edge_label_backward]:
+            return
+
+        c = (labels_backward.init_cost[edge_label_backward] if pred_idx_backward == -1
+             else labels_backward.cost[pred_idx_backward]) \
+            + labels_forward.cost[edge_label_forward]
+
+        if c < self._best_path.cost:
+            self._best_path = BestConnection(labels_forward.edge[edge_label_forward],
+                                             None if pred_idx_backward == -1 else labels_backward.edge[pred_idx_backward],
+                                             c,
+                                             "bike")
 
-        c = (edge_label_backward.cost if pred_idx_backward == -1 else self._edge_labels_bike_backward[pred_idx_backward].cost) \
-            + edge_label_forward.cost
+    @staticmethod
+    def _walk_back(labels: EdgeLabelStore, edge_label_idx: EdgeLabelIdx, is_seed: Callable) -> List[NodeId]:
+        # the nodes from the label back to the seed of its search, the last one being the seed's start
+        nodes = []
+        while not is_seed(edge_label_idx):
+            nodes.append(labels.end_node[edge_label_idx])
+            edge_label_idx = labels.pred_idx[edge_label_idx]
 
-        if c.cost < self._best_path.cost:
-            self._best_path = BestConnection(edge_label_forward.edge_id,
-                                             None if pred_idx_backward == -1 else self._edge_labels_bike_backward[pred_idx_backward].edge_id,
-                                             c.cost,
-                                             "bike")
+        nodes.append(labels.end_node[edge_label_idx])
+        nodes.append(labels.start[edge_label_idx])
+        return nodes
 
     def make_osm_path(self) -> Tuple[List[List[NodeId]], float]:
 
         if self._best_path.mode == "walking":
-            res_forward = []
-            edge = self._best_path.forward
+            labels = self._edge_labels_walking_forward
+            edge_label_idx = self._edges_status_walking_forward.label_index[self._best_path.forward]
+            forward_secs = labels.secs[edge_label_idx]
+            res_forward = self._walk_back(labels, edge_label_idx, labels.is_origin)[::-1]
 
-            edge_label_idx = self._edges_status_walking_forward[edge].edge_label_index
-            edge_label = self._edge_labels_walking_forward[edge_label_idx]
-            forward_secs = edge_label.cost.secs
-            while not edge_label.is_origin:
-                res_forward.append(edge_label.end_node)
-                edge_label_idx = edge_label.pred_idx
-                edge_label = self._edge_labels_walking_forward[edge_label_idx]
-
-            res_forward.append(edge_label.edge_id.end)
-            res_forward.append(edge_label.edge_id.start)
-            res_forward = res_forward[::-1]
-
-            res_backward = []
-
-            edge = self._best_path.backward
-            edge_label_idx = self._edges_status_walking_backward[edge].edge_label_index
-            edge_label = self._edge_labels_walking_backward[edge_label_idx]
-            backward_secs = edge_label.cost.secs
-
-            while not edge_label.is_destination:
-                res_backward.append(edge_label.end_node)
-                edge_label_idx = edge_label.pred_idx
-                edge_label = self._edge_labels_walking_backward[edge_label_idx]
-
-            res_backward.append(edge_label.edge_id.end)
-            res_backward.append(edge_label.edge_id.start)
+            labels = self._edge_labels_walking_backward
+            edge_label_idx = self._edges_status_walking_backward.label_index[self._best_path.backward]
+            backward_secs = labels.secs[edge_label_idx]
+            res_backward = self._walk_back(labels, edge_label_idx, labels.is_destination)
 
             if res_forward[-1] == res_backward[0]:
                 res_forward.pop(-1)
-            return [res_forward + res_backward], forward_secs + backward_secs
+            return [self._graph.to_osm_path(res_forward + res_backward)], forward_secs + backward_secs
 
         else:
 
@@ -516,17 +512,10 @@ class MultiModalDoubleExpansionAStar(object):
 
             edge = self._best_path.forward
             if edge is not None:
-                edge_label_idx = self._edges_status_bike_forward[edge].edge_label_index
-                edge_label = self._edge_labels_bike_forward[edge_label_idx]
-                bike_forward_secs = edge_label.cost.secs
-                while not edge_label.is_origin:
-                    bike_forward.append(edge_label.end_node)
-                    edge_label_idx = edge_label.pred_idx
-                    edge_label = self._edge_labels_bike_forward[edge_label_idx]
-
-                bike_forward.append(edge_label.edge_id.end)
-                bike_forward.append(edge_label.edge_id.start)
-                bike_forward = bike_forward[::-1]
+                labels = self._edge_labels_bike_forward
+                edge_label_idx = self._edges_status_bike_forward.label_index[edge]
+                bike_forward_secs = labels.secs[edge_label_idx]
+                bike_forward = self._walk_back(labels, edge_label_idx, labels.is_origin)[::-1]
 
             # the bss backward part
             bike_backward = []
@@ -534,17 +523,10 @@ class MultiModalDoubleExpansionAStar(object):
 
             edge = self._best_path.backward
             if edge is not None:
-                edge_label_idx = self._edges_status_bike_backward[edge].edge_label_index
-                edge_label = self._edge_labels_bike_backward[edge_label_idx]
-                bike_backward_secs = edge_label.cost.secs
-
-                while not edge_label.is_destination:
-                    bike_backward.append(edge_label.end_node)
-                    edge_label_idx = edge_label.pred_idx
-                    edge_label = self._edge_labels_bike_backward[edge_label_idx]
-
-                bike_backward.append(edge_label.edge_id.end)
-                bike_backward.append(edge_label.edge_id.start)
+                labels = self._edge_labels_bike_backward
+                edge_label_idx = self._edges_status_bike_backward.label_index[edge]
+                bike_backward_secs = labels.secs[edge_label_idx]
+                bike_backward = self._walk_back(labels, edge_label_idx, labels.is_destination)
 
             if bike_forward and bike_backward and bike_forward[-1] == bike_backward[0]:
                 bike_forward.pop(-1)
@@ -552,35 +534,19 @@ class MultiModalDoubleExpansionAStar(object):
             bike_route = bike_forward + bike_backward
 
             # walking_forward
-            walking_forward = []
+            labels = self._edge_labels_walking_forward
             edge_label_idx = self._forward_walking_bss[bike_route[0]]
-            edge_label = self._edge_labels_walking_forward[edge_label_idx]
-            walking_forward_secs = edge_label.cost.secs
-
-            while not edge_label.is_origin:
-                walking_forward.append(edge_label.end_node)
-                edge_label_idx = edge_label.pred_idx
-                edge_label = self._edge_labels_walking_forward[edge_label_idx]
-
-            walking_forward.append(edge_label.edge_id.end)
-            walking_forward.append(edge_label.edge_id.start)
-            walking_forward = walking_forward[::-1]
+            walking_forward_secs = labels.secs[edge_label_idx]
+            walking_forward = self._walk_back(labels, edge_label_idx, labels.is_origin)[::-1]
 
             # walking_backward
-            walking_backward = []
+            labels = self._edge_labels_walking_backward
             edge_label_idx = self._backward_walking_bss[bike_route[-1]]
-            edge_label = self._edge_labels_walking_backward[edge_label_idx]
-            walking_backward_secs = edge_label.cost.secs
-            while not edge_label.is_destination:
-                walking_backward.append(edge_label.end_node)
-                edge_label_idx = edge_label.pred_idx
-                edge_label = self._edge_labels_walking_backward[edge_label_idx]
-
-            walking_backward.append(edge_label.edge_id.end)
-            walking_backward.append(edge_label.edge_id.start)
-            walking_backward = walking_backward[::-1]
-
-            return [walking_forward, bike_route, walking_backward], bike_forward_secs + \
+            walking_backward_secs = labels.secs[edge_label_idx]
+            walking_backward = self._walk_back(labels, edge_label_idx, labels.is_destination)[::-1]
+
+            return [self._graph.to_osm_path(route) for route in (walking_forward, bike_route, walking_backward)], \
+                   bike_forward_secs + \
                    bike_backward_secs + walking_forward_secs + walking_backward_secs
 
     def get_best_path(self,
@@ -590,11 +556,26 @@ class MultiModalDoubleExpansionAStar(object):
                       bss_nodes: Set[NodeId],
                       callback: Callable = lambda *args, **kwargs: None) -> Tuple[List[List[NodeId]], float]:
 
+        graph = self._graph = as_compiled(g)
+        orig, dest = graph.node_index(orig), graph.node_index(dest)
+        bss_nodes = set(graph.node_indices(bss_nodes))
+        self.init()
+        symmetric = graph.is_symmetric()
+        self._alt = usable_landmarks(graph, self._landmarks)
+        bounds = StationBounds.from_graph(graph) if self._alt is None else None
+        self._station_bounds = bounds if bounds is not None and bounds.covers(bss_nodes) else None
+        self._backward_station_bounds = self._station_bounds if symmetric else None
+
+        self._edges_status_walking_forward = self._workspace.status('walking_forward', graph.undirected_edge_count)
+        self._edges_status_walking_backward = self._workspace.status('walking_backward', graph.undirected_edge_count)
+        self._edges_status_bike_forward = self._workspace.status('bike_forward', graph.undirected_edge_count)
+        self._edges_status_bike_backward = self._workspace.status('bike_backward', graph.undirected_edge_count)
+
         expand_forward = True
         expand_backward = True
 
-        self.init_forward(g, orig, dest)
-        self.init_backward(g, orig, dest)
+        self.init_forward(graph, orig, dest)
+        self.init_backward(graph, orig, dest)
 
         a = 0
         i = 0
@@ -637,31 +618,40 @@ class MultiModalDoubleExpansionAStar(object):
                     expand_bike_forward = False
                     forward_cost = walking_cost
                     self._adjacency_list_walking_forward.pop()
-                    forward_edge_label = self._edge_labels_walking_forward[walking_forward_edge_label_idx]
+                    forward_labels, forward_edge_label_idx = self._edge_labels_walking_forward, walking_forward_edge_label_idx
+                    forward_edge = forward_labels.edge[forward_edge_label_idx]
+                    forward_end_node = forward_labels.end_node[forward_edge_label_idx]
 
                     if not all((bss_reached_forward, bss_reached_backward)):
-                        if forward_edge_label.sort_cost - (walking_diff if walking_diff is not None else 0) > self._threshold:
+                        if forward_labels.sort_cost[forward_edge_label_idx] - (walking_diff if walking_diff is not None else 0) > self._threshold:
                             return self.make_osm_path()
 
-                    if self._edges_status_walking_backward[forward_edge_label.edge_id].is_permanent():
-                        if self._threshold == float('inf'):
-                            self._threshold = forward_edge_label.sort_cost + kThresholdDelta
-                        self.set_forward_walking_connection(forward_edge_label.edge_id)
+                    if self._edges_status_walking_backward.is_permanent(forward_edge):
+                        self.set_forward_walking_connection(forward_edge)
+                        # the meeting may not connect, a seed reached the other way
+                        if self._threshold == float('inf') and self._best_path.mode is not None:
+                            self._threshold = forward_labels.sort_cost[forward_edge_label_idx] + kThresholdDelta
 
-                    if forward_edge_label.end_node in bss_nodes:
+                    if forward_end_node in bss_nodes:
                         bss_reached_forward = True
-                        idx = self._forward_walking_bss.get(forward_edge_label.end_node)
-                        if not idx:
-                            self._forward_walking_bss[forward_edge_label.end_node] = walking_forward_edge_label_idx
+                        idx = self._forward_walking_bss.get(forward_end_node)
+                        dominated = self._is_dominated_seed(forward_labels, forward_edge_label_idx,
+                                                            forward_labels.is_origin, self._forward_walking_bss,
+                                                            symmetric)
+                        if idx is None:
+                            self._seed_stats.seeds += 1
+                            self._seed_stats.pruned += dominated
+                            self._forward_walking_bss[forward_end_node] = walking_forward_edge_label_idx
                         else:
-                            if self._edge_labels_walking_forward[walking_forward_edge_label_idx].cost < \
-                               self._edge_labels_walking_forward[idx].cost:
-                                self._forward_walking_bss[forward_edge_label.end_node] = walking_forward_edge_label_idx
-                        self.append_bike_forward(g,
-                                                 forward_edge_label.end_node,
-                                                 dest,
-                                                 0,
-                                                 forward_edge_label.cost.secs * self._walking_speed)
+                            if self._edge_labels_walking_forward.cost[walking_forward_edge_label_idx] < \
+                               self._edge_labels_walking_forward.cost[idx]:
+                                self._forward_walking_bss[forward_end_node] = walking_forward_edge_label_idx
+                        if not dominated:
+                            self.append_bike_forward(graph,
+                                                     forward_end_node,
+                                                     dest,
+                                                     0,
+                                                     forward_labels.secs[forward_edge_label_idx] * self._walking_speed)
                         if bike_diff is None and all((bss_reached_forward, bss_reached_backward)):
                             f_cost, _ = self._adjacency_list_bike_forward.peak()
                             b_cost, _ = self._adjacency_list_bike_backward.peak()
@@ -671,15 +661,16 @@ class MultiModalDoubleExpansionAStar(object):
                     expand_bike_forward = True
                     forward_cost = bike_cost
                     self._adjacency_list_bike_forward.pop()
-                    forward_edge_label = self._edge_labels_bike_forward[bike_forward_edge_label_idx]
+                    forward_labels, forward_edge_label_idx = self._edge_labels_bike_forward, bike_forward_edge_label_idx
+                    forward_edge = forward_labels.edge[forward_edge_label_idx]
 
-                    if forward_edge_label.sort_cost - (bike_diff if bike_diff is not None else 0) > self._threshold:
+                    if forward_labels.sort_cost[forward_edge_label_idx] - (bike_diff if bike_diff is not None else 0) > self._threshold:
                         return self.make_osm_path()
 
-                    if self._edges_status_bike_backward[forward_edge_label.edge_id].is_permanent():
-                        if self._threshold == float('inf'):
-                            self._threshold = forward_edge_label.sort_cost + kThresholdDelta
-                        self.set_forward_bike_connection(forward_edge_label.edge_id)
+                    if self._edges_status_bike_backward.is_permanent(forward_edge):
+                        self.set_forward_bike_connection(forward_edge)
+                        if self._threshold == float('inf') and self._best_path.mode is not None:
+                            self._threshold = forward_labels.sort_cost[forward_edge_label_idx] + kThresholdDelta
 
             if expand_backward:
 
@@ -696,32 +687,42 @@ class MultiModalDoubleExpansionAStar(object):
                     backward_cost = walking_cost + walking_diff if walking_diff is not None else 0
 
                     self._adjacency_list_walking_backward.pop()
-                    backward_edge_label = self._edge_labels_walking_backward[walking_backward_edge_label_idx]
+                    backward_labels, backward_edge_label_idx = self._edge_labels_walking_backward, \
+                        walking_backward_edge_label_idx
+                    backward_edge = backward_labels.edge[backward_edge_label_idx]
+                    backward_end_node = backward_labels.end_node[backward_edge_label_idx]
 
                     if not all((bss_reached_forward, bss_reached_backward)):
-                        if backward_edge_label.sort_cost - (walking_diff if walking_diff is not None else 0) > self._threshold:
+                        if backward_labels.sort_cost[backward_edge_label_idx] - (walking_diff if walking_diff is not None else 0) > self._threshold:
                             return self.make_osm_path()
 
-                    if self._edges_status_walking_forward[backward_edge_label.edge_id].is_permanent():
-                        if self._threshold == float('inf'):
-                            self._threshold = backward_edge_label.sort_cost + kThresholdDelta
-                        self.set_backward_walking_connection(backward_edge_label.edge_id)
+                    if self._edges_status_walking_forward.is_permanent(backward_edge):
+                        self.set_backward_walking_connection(backward_edge)
+                        if self._threshold == float('inf') and self._best_path.mode is not None:
+                            self._threshold = backward_labels.sort_cost[backward_edge_label_idx] + kThresholdDelta
 
-                    if backward_edge_label.end_node in bss_nodes:
+                    if backward_end_node in bss_nodes:
                         bss_reached_backward = True
-                        idx = self._backward_walking_bss.get(backward_edge_label.end_node)
-                        if not idx:
-                            self._backward_walking_bss[backward_edge_label.end_node] = walking_backward_edge_label_idx
+                        idx = self._backward_walking_bss.get(backward_end_node)
+                        # the walking paths from dest are walked the other way on a symmetric graph only
+                        dominated = symmetric and self._is_dominated_seed(
+                            backward_labels, backward_edge_label_idx, backward_labels.is_destination,
+                            self._backward_walking_bss, symmetric)
+                        if idx is None:
+                            self._seed_stats.seeds += 1
+                            self._seed_stats.pruned += dominated
+                            self._backward_walking_bss[backward_end_node] = walking_backward_edge_label_idx
                         else:
-                            if self._edge_labels_walking_backward[walking_backward_edge_label_idx].cost < \
-                               self._edge_labels_walking_backward[idx].cost:
-                                self._backward_walking_bss[backward_edge_label.end_node] = walking_backward_edge_label_idx
-
-                        self.append_bike_backward(g,
-                                                  backward_edge_label.end_node,
-                                                  orig,
-                                                  0,
-                                                  backward_edge_label.cost.secs * self._walking_speed)
+                            if self._edge_labels_walking_backward.cost[walking_backward_edge_label_idx] < \
+                               self._edge_labels_walking_backward.cost[idx]:
+                                self._backward_walking_bss[backward_end_node] = walking_backward_edge_label_idx
+
+                        if not dominated:
+                            self.append_bike_backward(graph,
+                                                      backward_end_node,
+                                                      orig,
+                                                      0,
+                                                      backward_labels.secs[backward_edge_label_idx] * self._walking_speed)
                         if bike_diff is None and all((bss_reached_forward, bss_reached_backward)):
                             f_cost, _ = self._adjacency_list_bike_forward.peak()
                             b_cost, _ = self._adjacency_list_bike_backward.peak()
@@ -732,23 +733,25 @@ class MultiModalDoubleExpansionAStar(object):
                     expand_bike_backward = True
                     backward_cost = bike_cost + bike_diff if bike_diff is not None else 0
                     self._adjacency_list_bike_backward.pop()
-                    backward_edge_label = self._edge_labels_bike_backward[bike_backward_edge_label_idx]
+                    backward_labels, backward_edge_label_idx = self._edge_labels_bike_backward, bike_backward_edge_label_idx
+                    backward_edge = backward_labels.edge[backward_edge_label_idx]
 
-                    if backward_edge_label.sort_cost - (bike_diff if bike_diff is not None else 0) > self._threshold:
+                    if backward_labels.sort_cost[backward_edge_label_idx] - (bike_diff if bike_diff is not None else 0) > self._threshold:
                         return self.make_osm_path()
 
-                    if self._edges_status_bike_forward[backward_edge_label.edge_id].is_permanent():
-                        if self._threshold == float('inf'):
-                            self._threshold = backward_edge_label.sort_cost + kThresholdDelta
-                        self.set_backward_bike_connection(backward_edge_label.edge_id)
+                    if self._edges_status_bike_forward.is_permanent(backward_edge):
+                        self.set_backward_bike_connection(backward_edge)
+                        if self._threshold == float('inf') and self._best_path.mode is not None:
+                            self._threshold = backward_labels.sort_cost[backward_edge_label_idx] + kThresholdDelta
 
             if all((bss_reached_forward, bss_reached_backward)):
-                if self._best_path.mode == "walking":
-                    bike_forward_edge_label = self._edge_labels_bike_forward[bike_forward_edge_label_idx]
-                    bike_backward_edge_label = self._edge_labels_bike_backward[bike_backward_edge_label_idx]
-
-                    if self._best_path.cost < (bike_forward_edge_label.cost.cost + bike_backward_edge_label.cost.cost):
-                        expand_walking_forward = expand_walking_backward = True
+                # a bike queue may be empty, or not peeked yet, there is no bike label to compare the walk with
+                if self._best_path.mode == "walking" and \
+                   None not in (bike_forward_edge_label_idx, bike_backward_edge_label_idx):
+                    # the walk found costs less than the bike labels left: a popped bike label is dropped, the
+                    # walking label of its direction was only peeked and is expanded once popped
+                    if self._best_path.cost < (self._edge_labels_bike_forward.cost[bike_forward_edge_label_idx] +
+                                               self._edge_labels_bike_backward.cost[bike_backward_edge_label_idx]):
                         expand_bike_forward = expand_bike_backward = False
 
             if forward_cost <= backward_cost:
@@ -756,23 +759,27 @@ class MultiModalDoubleExpansionAStar(object):
                 expand_backward = False
 
                 if expand_walking_forward:
-                    if not forward_edge_label.is_origin:
-                        self._edges_status_walking_forward[forward_edge_label.edge_id].set_permanent()
-                    self.expand_walking_forward(g, forward_edge_label.end_node, walking_forward_edge_label_idx, dest)
+                    if not forward_labels.is_origin(forward_edge_label_idx):
+                        self._edges_status_walking_forward.set_permanent(forward_edge)
+                    self.expand_walking_forward(graph, forward_labels.end_node[forward_edge_label_idx],
+                                                walking_forward_edge_label_idx, dest)
                 if expand_bike_forward:
-                    if not forward_edge_label.is_origin:
-                        self._edges_status_bike_forward[forward_edge_label.edge_id].set_permanent()
-                    self.expand_bike_forward(g, forward_edge_label.end_node, bike_forward_edge_label_idx, dest)
+                    if not forward_labels.is_origin(forward_edge_label_idx):
+                        self._edges_status_bike_forward.set_permanent(forward_edge)
+                    self.expand_bike_forward(graph, forward_labels.end_node[forward_edge_label_idx],
+                                             bike_forward_edge_label_idx, dest)
 
             else:
                 expand_forward = False
                 expand_backward = True
 
                 if expand_walking_backward:
-                    if not backward_edge_label.is_destination:
-                        self._edges_status_walking_backward[backward_edge_label.edge_id].set_permanent()
-                    self.expand_walking_backward(g, backward_edge_label.end_node, walking_backward_edge_label_idx, orig)
+                    if not backward_labels.is_destination(backward_edge_label_idx):
+                        self._edges_status_walking_backward.set_permanent(backward_edge)
+                    self.expand_walking_backward(graph, backward_labels.end_node[backward_edge_label_idx],
+                                                 walking_backward_edge_label_idx, orig)
                 if expand_bike_backward:
-                    if not backward_edge_label.is_destination:
-                        self._edges_status_bike_backward[backward_edge_label.edge_id].set_permanent()
-                    self.expand_bike_backward(g, backward_edge_label.end_node, bike_backward_edge_label_idx, orig)
+                    if not backward_labels.is_destination(backward_edge_label_idx):
+                        self._edges_status_bike_backward.set_permanent(backward_edge)
+                    self.expand_bike_backward(graph, backward_labels.end_node[backward_edge_label_idx],
+                                              bike_backward_edge_label_idx, orig)
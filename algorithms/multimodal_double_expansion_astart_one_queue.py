@@ -1,15 +1,17 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import *
-from collections import defaultdict
-import weakref
-
+import time
 
 import networkx as nx
 
 from .inner_types import *
 from priority_queue import PriorityQueue
-from algorithms import utils
-from algorithms.inner_types import NodeId, EdgeId, Cost, EdgeLabel, EdgeStatus, EdgeLabelIdx
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.geo import BlockTable, DistanceTable
+from algorithms.inner_types import NodeId, Cost, EdgeLabelIdx
+from algorithms.label_store import EdgeLabelStore, EdgeStatusStore
+from algorithms.station_bounds import StationBounds
+from algorithms.workspace import SearchWorkspace
 
 
 WALKING_SPEED = 1.4
@@ -25,71 +27,86 @@ class BestPath(object):
 @dataclass
 class MultiModalDoubleExpansionAStarOneQueue(object):
 
-    _edge_labels: List[EdgeLabel] = field(default_factory=list)
-    _adjacency_list: PriorityQueue = PriorityQueue()
-    _edges_status: Dict[EdgeId, EdgeStatus] = field(default_factory=lambda: defaultdict(EdgeStatus))
+    _edge_labels: EdgeLabelStore = field(init=False)
+    _adjacency_list: PriorityQueue = field(init=False)
+    # one layer per TravelMode, the edge column of the labels holds their slot
+    _edges_status: EdgeStatusStore = None
 
+    # the great circle heuristic of both modes, when the graph has no station bounds
     _cost_factor: float = 0
 
     _walking_speed: float = WALKING_SPEED
     _bike_speed: float = BIKE_SPEED
 
     _threshold: float = float('inf')
-
-    _destinations: Dict[EdgeId, BestPath] = field(default_factory=dict)
-
-    _best_path: BestPath = BestPath(-1, Cost(0, 0))
-
-    @staticmethod
-    def _get_heuristic_cost_impl(g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId, cost_factor: float) -> float:
+    _queue_backend: object = 'heap'
+    # the buffers are borrowed from the workspace, init() gets them back empty
+    _workspace: SearchWorkspace = None
+    _graph: CompiledGraph = None
+    # target -> great circle distances to it
+    _distances: Dict[NodeId, DistanceTable] = field(default_factory=dict)
+    # the bounds of build_station_table.py when they cover the stations of the query, and (target, walking) ->
+    # their potential, see station_bounds.py
+    _station_bounds: Optional[StationBounds] = None
+    _potentials: Dict[Tuple[NodeId, bool], BlockTable] = field(default_factory=dict)
+
+    _best_path: BestPath = field(default_factory=lambda: BestPath(-1, Cost(0, 0)))
+
+    def __post_init__(self):
+        if self._workspace is None:
+            self._workspace = SearchWorkspace()
+        self.init()
+
+    def init(self):
+        # the state of the previous query, an instance can serve one query after the other
+        self._edge_labels = self._workspace.labels()
+        self._adjacency_list = self._workspace.queue(backend=self._queue_backend)
+        self._distances = {}
+        self._potentials = {}
+        self._best_path = BestPath(-1, Cost(0, 0))
+        self._threshold = float('inf')
+
+    def _get_heuristic_cost_impl(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId, cost_factor: float) -> float:
         if cost_factor == 0 or end_node is None:
             return 0
-        start_ll = utils.osm_to_pointll(g, start_node)
-        end_ll = utils.osm_to_pointll(g, end_node)
-        return start_ll.distance_to(end_ll) * cost_factor
+        distances = self._distances.get(end_node)
+        if distances is None:
+            distances = self._distances[end_node] = DistanceTable(g, end_node)
+        return distances(start_node) * cost_factor
 
-    def _get_walking_heuristic_cost(self, g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId) -> float:
+    def _get_station_cost(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId, walking: bool) -> float:
+        if end_node is None:
+            return 0
+        potential = self._potentials.get((end_node, walking))
+        if potential is None:
+            potential = self._potentials[(end_node, walking)] = self._station_bounds.potential(
+                g, end_node, self._walking_speed / self._bike_speed, walking)
+        return potential(start_node)
+
+    def _get_walking_heuristic_cost(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId) -> float:
+        if self._station_bounds is not None:
+            return self._get_station_cost(g, start_node, end_node, True)
         return self._get_heuristic_cost_impl(g, start_node, end_node, self._cost_factor)
 
-    def _get_bike_heuristic_cost(self, g: nx.MultiDiGraph, start_node: NodeId, end_node: NodeId) -> float:
-        return self._get_heuristic_cost_impl(g, start_node, end_node, self._cost_factor) * 1.2 * (self._walking_speed / self._bike_speed)
-
-    @staticmethod
-    def _get_edge_status_impl(container: Dict[EdgeId, EdgeStatus], edge_id: EdgeId) -> EdgeStatus:
-        s = container.get(edge_id)
-        if not s:
-            return container[edge_id].set_unreached()
-        return s
+    def _get_bike_heuristic_cost(self, g: CompiledGraph, start_node: NodeId, end_node: NodeId) -> float:
+        if self._station_bounds is not None:
+            return self._get_station_cost(g, start_node, end_node, False)
+        return self._get_heuristic_cost_impl(g, start_node, end_node, self._cost_factor) * \
+            (self._walking_speed / self._bike_speed)
 
-    def _get_edge_status(self, edge_id: EdgeId) -> EdgeStatus:
-        return self._get_edge_status_impl(self._edges_status, edge_id)
-
-    def init_origin(self, g: nx.MultiDiGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
-        for end_node in g.adj[orig]:
-            edge = g.adj[orig][end_node][0]
-
-            secs = edge['length'] / self._walking_speed + init_secs
-            cost = edge['length'] + init_cost
+    def init_origin(self, g: CompiledGraph, orig: NodeId, dest: NodeId, init_secs: float = 0, init_cost: float = 0):
+        for end_node, length, edge in g.adjacent(orig):
+            secs = length / self._walking_speed + init_secs
+            cost = length + init_cost
             sort_cost = cost + self._get_walking_heuristic_cost(g, end_node, dest)
 
-            idx = len(self._edge_labels)
-            self._edge_labels.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                               sort_cost,
-                                               EdgeId(orig, end_node),
-                                               -1,
-                                               end_node,
-                                               is_origin=True,
-                                               is_destination=False))
+            slot = self._edges_status.slot(edge, TravelMode.WALKING.value)
+            idx = self._edge_labels.append(cost, secs, sort_cost, orig, end_node, slot, -1, init_cost, init_secs,
+                                           is_origin=True)
             self._adjacency_list.insert(sort_cost, idx)
-            self._edges_status[EdgeId(orig, end_node)] = EdgeStatus(idx).set_temporary()
-
-    def init_destination(self,  g: nx.MultiDiGraph, dest: NodeId):
-        # init destination
-        for end_node in g.adj[dest]:
-            edge = g.adj[dest][end_node][0]
-            self._destinations[EdgeId(dest, end_node, mode=TravelMode.WALKING)] = edge['length']
+            self._edges_status.set_temporary(slot, idx)
 
-    def expand_forward(self, g: nx.MultiDiGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId, bss_nodes: Set[NodeId]):
+    def expand_forward(self, g: CompiledGraph, node: NodeId, pred_idx: EdgeLabelIdx, dest: NodeId, bss_nodes: Set[NodeId]):
 
         def _get_speed(travel_mode: TravelMode):
             return (self._walking_speed, self._bike_speed)[travel_mode.value]
@@ -101,97 +118,77 @@ class MultiModalDoubleExpansionAStarOneQueue(object):
             fun = (self._get_walking_heuristic_cost, self._get_bike_heuristic_cost)[travel_mode.value]
             return fun(*args, **kwargs)
 
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
+        labels = self._edge_labels
+        edges_status = self._edges_status
+        pred_mode = TravelMode(labels.mode[pred_idx])
+        pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+        init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
 
-            pred = self._edge_labels[pred_idx]
+        for end_node, length, edge in g.adjacent(node):
+            slot = edges_status.slot(edge, pred_mode.value)
 
-            edge_status = self._get_edge_status(EdgeId(node, end_node, mode=pred.edge_id.mode))
-
-            if node not in bss_nodes and edge_status.is_permanent():
+            if node not in bss_nodes and edges_status.is_permanent(slot):
                 continue
 
-            if node not in bss_nodes and not edge_status.is_permanent():
-                new_cost = pred.cost + Cost(edge['length'] * _normalize_factor(pred.edge_id.mode),
-                                            edge['length'] / _get_speed(pred.edge_id.mode))
-                edge_id = EdgeId(node, end_node, pred.edge_id.mode)
-                sort_cost = new_cost.cost + _get_heurestic_cost(pred.edge_id.mode, g, end_node, dest)
+            if node not in bss_nodes and not edges_status.is_permanent(slot):
+                new_cost = pred_cost + length * _normalize_factor(pred_mode)
+                new_secs = pred_secs + length / _get_speed(pred_mode)
+                sort_cost = new_cost + _get_heurestic_cost(pred_mode, g, end_node, dest)
                 # the edge has been visited
-                if edge_status.is_temporary():
-                    lab = weakref.proxy(self._edge_labels[edge_status.edge_label_index])
-                    if lab.end_node == end_node:
-                        if new_cost < lab.cost:
-                            self._adjacency_list.insert(new_key=sort_cost,
-                                                        item=edge_status.edge_label_index)
-                            lab.edge_id = EdgeId(node, end_node, pred.edge_id.mode)
-                            lab.pred_idx = pred_idx
-                            lab.end_node = end_node
-                            lab.cost = new_cost
+                if edges_status.is_temporary(slot):
+                    lab_idx = edges_status.label_index[slot]
+                    if labels.end_node[lab_idx] == end_node:
+                        if new_cost < labels.cost[lab_idx]:
+                            self._adjacency_list.insert(new_key=sort_cost, item=lab_idx)
+                            labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
+                            labels.mode[lab_idx] = pred_mode.value
 
                     # Hmmm, we are visiting the edge in the opposing direction of last visit
-                    elif lab.end_node == node:
-                        if new_cost.cost < (lab.cost.cost - edge['length'] * _normalize_factor(pred.edge_id.mode)):
-                            self._adjacency_list.insert(new_key=sort_cost,
-                                                        item=edge_status.edge_label_index)
-                            lab.edge_id = EdgeId(node, end_node, pred.edge_id.mode)
-                            lab.pred_idx = pred_idx
-                            lab.end_node = end_node
-                            lab.cost = new_cost
+                    elif labels.end_node[lab_idx] == node:
+                        if new_cost < (labels.cost[lab_idx] - length * _normalize_factor(pred_mode)):
+                            self._adjacency_list.insert(new_key=sort_cost, item=lab_idx)
+                            labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
+                            labels.mode[lab_idx] = pred_mode.value
                     continue
 
-                idx = len(self._edge_labels)
-                self._edge_labels.append(EdgeLabel(new_cost,
-                                                   sort_cost,
-                                                   edge_id,
-                                                   pred_idx,
-                                                   end_node))
-                self._edges_status[edge_id] = EdgeStatus(idx).set_temporary()
+                idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, slot, pred_idx, init_cost, init_secs,
+                                    mode=pred_mode.value)
+                edges_status.set_temporary(slot, idx)
                 self._adjacency_list.insert(sort_cost, idx)
 
             if node in bss_nodes:
                 for mode in TravelMode:
-                    edge_status = self._get_edge_status(EdgeId(node, end_node, mode=mode))
+                    slot = edges_status.slot(edge, mode.value)
 
-                    if edge_status.is_permanent():
+                    if edges_status.is_permanent(slot):
                         continue
-                    new_cost = pred.cost + Cost(edge['length'] * _normalize_factor(mode),
-                                                edge['length'] / _get_speed(mode))
+                    new_cost = pred_cost + length * _normalize_factor(mode)
+                    new_secs = pred_secs + length / _get_speed(mode)
 
-                    edge_id = EdgeId(node, end_node, mode)
                     if mode == TravelMode.WALKING:
-                        sort_cost = new_cost.cost + self._get_walking_heuristic_cost(g, end_node, dest)
+                        sort_cost = new_cost + self._get_walking_heuristic_cost(g, end_node, dest)
                     else:
-                        sort_cost = new_cost.cost + self._get_bike_heuristic_cost(g, end_node, dest)
+                        sort_cost = new_cost + self._get_bike_heuristic_cost(g, end_node, dest)
 
                     # the edge has been visited
-                    if edge_status.is_temporary():
-                        lab = weakref.proxy(self._edge_labels[edge_status.edge_label_index])
-                        if lab.end_node == end_node:
-                            if new_cost < lab.cost:
-                                self._adjacency_list.insert(new_key=sort_cost,
-                                                            item=edge_status.edge_label_index)
-                                # lab.edge_id = EdgeId(node, end_node, mode)
-                                lab.pred_idx = pred_idx
-                                lab.end_node = end_node
-                                lab.cost = new_cost
+                    if edges_status.is_temporary(slot):
+                        lab_idx = edges_status.label_index[slot]
+                        if labels.end_node[lab_idx] == end_node:
+                            if new_cost < labels.cost[lab_idx]:
+                                self._adjacency_list.insert(new_key=sort_cost, item=lab_idx)
+                                labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs,
+                                              labels.start[lab_idx], end_node, pred_idx)
                         # Hmmm, we are visiting the edge in the opposing direction of last visit
-                        elif lab.end_node == node:
-                            if new_cost.cost < (lab.cost.cost - edge['length'] * _normalize_factor(mode)):
-                                self._adjacency_list.insert(new_key=sort_cost,
-                                                            item=edge_status.edge_label_index)
-                                # lab.edge_id = EdgeId(node, end_node, mode)
-                                lab.pred_idx = pred_idx
-                                lab.end_node = end_node
-                                lab.cost = new_cost
+                        elif labels.end_node[lab_idx] == node:
+                            if new_cost < (labels.cost[lab_idx] - length * _normalize_factor(mode)):
+                                self._adjacency_list.insert(new_key=sort_cost, item=lab_idx)
+                                labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs,
+                                              labels.start[lab_idx], end_node, pred_idx)
                         continue
 
-                    idx = len(self._edge_labels)
-                    self._edge_labels.append(EdgeLabel(new_cost,
-                                                       sort_cost,
-                                                       edge_id,
-                                                       pred_idx,
-                                                       end_node))
-                    self._edges_status[edge_id] = EdgeStatus(idx).set_temporary()
+                    idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, slot, pred_idx, init_cost,
+                                        init_secs, mode=mode.value)
+                    edges_status.set_temporary(slot, idx)
                     self._adjacency_list.insert(sort_cost, idx)
 
     def make_osm_path(self) -> Tuple[List[List[NodeId]], float]:
@@ -201,34 +198,38 @@ class MultiModalDoubleExpansionAStarOneQueue(object):
         bike = []
         first_walking = []
 
+        labels = self._edge_labels
         edge_label_idx = self._best_path.edge_label_index
-        edge_label = self._edge_labels[edge_label_idx]
-        second_walking.append(edge_label.end_node)
+        second_walking.append(labels.end_node[edge_label_idx])
 
         changed_mode = 0
-        old_mode = edge_label.edge_id.mode
+        old_mode = labels.mode[edge_label_idx]
+        if old_mode == TravelMode.BIKE.value:
+            # the bike is returned at the destination, the last walk is empty
+            changed_mode = 1
+            bike.append(labels.end_node[edge_label_idx])
 
-        while not edge_label.is_origin:
+        while not labels.is_origin(edge_label_idx):
 
-            edge_label_idx = edge_label.pred_idx
-            edge_label = self._edge_labels[edge_label_idx]
+            edge_label_idx = labels.pred_idx[edge_label_idx]
+            end_node = labels.end_node[edge_label_idx]
 
-            if old_mode != edge_label.edge_id.mode:
+            if old_mode != labels.mode[edge_label_idx]:
                 changed_mode += 1
-                old_mode = edge_label.edge_id.mode
+                old_mode = labels.mode[edge_label_idx]
 
             if changed_mode == 0:
-                second_walking.append(edge_label.end_node)
+                second_walking.append(end_node)
             elif changed_mode == 1:
                 if not bike:
-                    second_walking.append(edge_label.end_node)
-                bike.append(edge_label.end_node)
+                    second_walking.append(end_node)
+                bike.append(end_node)
             elif changed_mode == 2:
                 if not first_walking:
-                    bike.append(edge_label.end_node)
-                first_walking.append(edge_label.end_node)
+                    bike.append(end_node)
+                first_walking.append(end_node)
 
-        first_walking.append(edge_label.edge_id.start)
+        first_walking.append(labels.start[edge_label_idx])
 
         first_walking = first_walking[::-1]
         bike = bike[::-1]
@@ -242,20 +243,29 @@ class MultiModalDoubleExpansionAStarOneQueue(object):
             res.append(bike)
 
         res.append(second_walking)
-        return res, self._best_path.cost.secs
+        return [self._graph.to_osm_path(route) for route in res], self._best_path.cost.secs
 
     def get_best_path(self,
                       g: nx.MultiDiGraph,
                       orig: NodeId,
                       dest: NodeId,
                       bss_nodes: Set[NodeId],
-                      callback: Callable = lambda *args, **kwargs: None) -> Tuple[List[List[NodeId]], float]:
+                      callback: Callable = lambda *args, **kwargs: None,
+                      budget: Optional[SearchBudget] = None) -> Union[Tuple[List[List[NodeId]], float], BudgetExceeded]:
+
+        graph = self._graph = as_compiled(g)
+        orig, dest = graph.node_index(orig), graph.node_index(dest)
+        bss_nodes = set(graph.node_indices(bss_nodes))
+        self.init()
+        bounds = StationBounds.from_graph(graph)
+        self._station_bounds = bounds if bounds is not None and bounds.covers(bss_nodes) else None
+        self._edges_status = self._workspace.status('edges', graph.undirected_edge_count, layers=len(TravelMode))
 
-        self.init_origin(g, orig, dest)
-        self.init_destination(g, dest)
+        self.init_origin(graph, orig, dest)
 
         i = 0
         a = 0
+        start = time.monotonic()
         # begin search
         while True:
             if i % 10 == 0 and 0:
@@ -263,23 +273,25 @@ class MultiModalDoubleExpansionAStarOneQueue(object):
                 a += 1
             i += 1
 
-            current_labels = len(self._edge_labels)
-
-            if current_labels > PriorityQueue.QUEUE_MAX_SIZE:
-                return []
+            if budget is not None:
+                exceeded = budget.check(len(self._edge_labels), i - 1, start)
+                if exceeded is not None:
+                    return exceeded
 
+            if not len(self._adjacency_list):
+                raise nx.NetworkXNoPath('no path to {}'.format(dest))
             _, pred_index = self._adjacency_list.pop()
-            pred_edge_label = self._edge_labels[pred_index]
+            pred_slot = self._edge_labels.edge[pred_index]
 
-            # Do we touch the destination?
-            d = self._destinations.get(pred_edge_label.edge_id)
-            if d:
-                if self._best_path.edge_label_index is -1:
+            # Do we reach the destination? walking, or riding when the bike can be returned there
+            if self._edge_labels.end_node[pred_index] == dest and \
+               (self._edge_labels.mode[pred_index] == TravelMode.WALKING.value or dest in bss_nodes):
+                if self._best_path.edge_label_index == -1:
                     self._best_path.edge_label_index = pred_index
-                    self._best_path.cost = pred_edge_label.cost
+                    self._best_path.cost = self._edge_labels.get_cost(pred_index)
                 return self.make_osm_path()
 
-            if not pred_edge_label.is_origin:
-                self._edges_status[pred_edge_label.edge_id].set_permanent()
+            if not self._edge_labels.is_origin(pred_index):
+                self._edges_status.set_permanent(pred_slot)
 
-            self.expand_forward(g, pred_edge_label.end_node, pred_index, dest, bss_nodes)
+            self.expand_forward(graph, self._edge_labels.end_node[pred_index], pred_index, dest, bss_nodes)
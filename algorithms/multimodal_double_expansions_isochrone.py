@@ -1,14 +1,14 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from typing import *
-from collections import defaultdict
-import weakref
 
 import networkx as nx
 
 from .inner_types import *
 from priority_queue import PriorityQueue
-from algorithms import utils
-from algorithms.inner_types import NodeId, EdgeId, Cost, EdgeLabel, EdgeStatus, EdgeLabelIdx
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.inner_types import NodeId, Cost, EdgeLabelIdx
+from algorithms.label_store import EdgeLabelStore, EdgeStatusStore
+from algorithms.workspace import SearchWorkspace
 
 
 kThresholdDelta = 50.
@@ -21,14 +21,15 @@ BIKE_SPEED = 3.3
 class MultiModalDoubleExpansionIsochrone(object):
 
     # Walking
-    _edge_labels_walking: List[EdgeLabel] = field(default_factory=list)
-    _adjacency_list_walking: PriorityQueue = PriorityQueue()
-    _edges_status_walking: Dict[EdgeId, EdgeStatus] = field(default_factory=lambda: defaultdict(EdgeStatus))
+    _edge_labels_walking: EdgeLabelStore = field(init=False)
+    _adjacency_list_walking: PriorityQueue = field(init=False)
+    # one layer per can_change_mode value, the edge column of the labels holds their slot
+    _edges_status_walking: EdgeStatusStore = None
 
     # Bike
-    _edge_labels_bike: List[EdgeLabel] = field(default_factory=list)
-    _adjacency_list_bike: PriorityQueue = PriorityQueue()
-    _edges_status_bike: Dict[EdgeId, EdgeStatus] = field(default_factory=lambda: defaultdict(EdgeStatus))
+    _edge_labels_bike: EdgeLabelStore = field(init=False)
+    _adjacency_list_bike: PriorityQueue = field(init=False)
+    _edges_status_bike: EdgeStatusStore = None
 
     _walking_bss: Dict[NodeId, EdgeLabelIdx] = field(default_factory=dict)
     _backward_walking_bss: Dict[NodeId, EdgeLabelIdx] = field(default_factory=dict)
@@ -37,171 +38,151 @@ class MultiModalDoubleExpansionIsochrone(object):
     _bike_speed: float = BIKE_SPEED
 
     _threshold: float = float('inf')
+    _queue_backend: object = 'heap'
+    # the buffers are borrowed from the workspace, init() gets them back empty
+    _workspace: SearchWorkspace = None
+
+    def __post_init__(self):
+        if self._workspace is None:
+            self._workspace = SearchWorkspace()
+        self.init()
+
+    def init(self):
+        # the state of the previous query, an instance can serve one query after the other
+        self._edge_labels_walking = self._workspace.labels('walking')
+        self._edge_labels_bike = self._workspace.labels('bike')
+        self._adjacency_list_walking = self._workspace.queue('walking', self._queue_backend)
+        self._adjacency_list_bike = self._workspace.queue('bike', self._queue_backend)
+        self._walking_bss = {}
+        self._backward_walking_bss = {}
+        self._threshold = float('inf')
 
     def append_walking(self, g, orig, can_change_mode: bool, init_secs: float=0, init_cost: float=0):
         # init origin
-        for end_node in g.adj[orig]:
-            edge = g.adj[orig][end_node][0]
-
-            secs = edge['length'] / self._walking_speed + init_secs
-            cost = edge['length'] + init_cost
+        edges_status = self._edges_status_walking
+        for end_node, length, edge in g.adjacent(orig):
+            secs = length / self._walking_speed + init_secs
+            cost = length + init_cost
             sort_cost = cost
 
             # let's see if the edge has already been visited?
-            edge_status = self._edges_status_walking[EdgeId(orig, end_node, can_change_mode)]
-            if not edge_status.is_unreached():
+            slot = edges_status.slot(edge, int(can_change_mode))
+            if not edges_status.is_unreached(slot):
                 # if it's visted, is this edge had less cost?
-                edge_label_idx = edge_status.edge_label_index
-                lab = weakref.proxy(self._edge_labels_walking[edge_label_idx])
-                if lab.end_node == end_node:
-                    if cost > lab.cost.cost:
+                edge_label_idx = edges_status.label_index[slot]
+                labels = self._edge_labels_walking
+                if labels.end_node[edge_label_idx] == end_node:
+                    if cost > labels.cost[edge_label_idx]:
                         continue
                     self._adjacency_list_walking.insert(new_key=cost,
                                                         item=edge_label_idx)
-                    lab.pred_idx = -1
-                    lab.end_node = end_node
-                    lab.cost = Cost(cost, secs, init_cost, init_secs)
-                    lab.is_origin = True
-                    lab.is_destination = False
+                    labels.update(edge_label_idx, cost, secs, init_cost, init_secs,
+                                  labels.start[edge_label_idx], end_node, -1)
+                    labels.set_origin(edge_label_idx)
 
             else:
-                idx = len(self._edge_labels_walking)
-                self._edge_labels_walking.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                           sort_cost,
-                                                           EdgeId(orig, end_node),
-                                                           -1,
-                                                           end_node,
-                                                           is_origin=True,
-                                                           can_change_mode=can_change_mode))
+                idx = self._edge_labels_walking.append(cost, secs, sort_cost, orig, end_node, slot, -1,
+                                                       init_cost, init_secs,
+                                                       is_origin=True, can_change_mode=can_change_mode)
                 self._adjacency_list_walking.insert(sort_cost, idx)
-                self._edges_status_walking[EdgeId(orig, end_node, can_change_mode)] = EdgeStatus(idx).set_temporary()
-
-    def append_bike(self, g: nx.MultiDiGraph, bss_node: NodeId, init_secs: float=0, init_cost: float=0):
-        for end_node in g.adj[bss_node]:
-            edge = g.adj[bss_node][end_node][0]
+                edges_status.set_temporary(slot, idx)
 
-            secs = edge['length'] / self._bike_speed + init_secs
-            cost = edge['length'] * (self._walking_speed / self._bike_speed) + init_cost
+    def append_bike(self, g: CompiledGraph, bss_node: NodeId, init_secs: float=0, init_cost: float=0):
+        edges_status = self._edges_status_bike
+        for end_node, length, edge in g.adjacent(bss_node):
+            secs = length / self._bike_speed + init_secs
+            cost = length * (self._walking_speed / self._bike_speed) + init_cost
 
             # let's see if the edge has already been visited?
-            edge_status = self._edges_status_bike[EdgeId(bss_node, end_node)]
-            if not edge_status.is_unreached():
+            if not edges_status.is_unreached(edge):
                 # if it's visted, is this edge had less cost?
-                edge_label_idx = edge_status.edge_label_index
-                lab = weakref.proxy(self._edge_labels_bike[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if cost > lab.cost.cost:
+                edge_label_idx = edges_status.label_index[edge]
+                labels = self._edge_labels_bike
+                if labels.end_node[edge_label_idx] == end_node:
+                    if cost > labels.cost[edge_label_idx]:
                         continue
                     self._adjacency_list_bike.insert(new_key=cost,
                                                      item=edge_label_idx)
-                    lab.pred_idx = -1
-                    lab.end_node = end_node
-                    lab.cost = Cost(cost, secs, init_cost, init_secs)
-                    lab.is_origin = True
-                    lab.is_destination = False
+                    labels.update(edge_label_idx, cost, secs, init_cost, init_secs,
+                                  labels.start[edge_label_idx], end_node, -1)
+                    labels.set_origin(edge_label_idx)
 
             else:
-                idx = len(self._edge_labels_bike)
-                self._edge_labels_bike.append(EdgeLabel(Cost(cost, secs, init_cost, init_secs),
-                                                        cost,
-                                                        EdgeId(bss_node, end_node),
-                                                        -1,
-                                                        end_node,
-                                                        is_origin=True))
+                idx = self._edge_labels_bike.append(cost, secs, cost, bss_node, end_node, edge, -1, init_cost, init_secs,
+                                                    is_origin=True)
                 self._adjacency_list_bike.insert(cost, idx)
-                self._edges_status_bike[EdgeId(bss_node, end_node)] = EdgeStatus(idx).set_temporary()
-
-    def expand_walking(self, g: nx.MultiDiGraph, node: NodeId, pred_idx: EdgeLabelIdx):
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-
-            pred = self._edge_labels_walking[pred_idx]
+                edges_status.set_temporary(edge, idx)
 
-            edge_id = EdgeId(node, end_node, pred.can_change_mode)
+    def expand_walking(self, g: CompiledGraph, node: NodeId, pred_idx: EdgeLabelIdx):
+        labels = self._edge_labels_walking
+        edges_status = self._edges_status_walking
+        pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+        init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
+        can_change_mode = labels.can_change_mode(pred_idx)
 
-            edge_status = self._edges_status_walking[edge_id]
+        for end_node, length, edge in g.adjacent(node):
+            slot = edges_status.slot(edge, int(can_change_mode))
 
-            new_cost = pred.cost + Cost(edge['length'], edge['length'] / self._walking_speed)
+            new_cost = pred_cost + length
+            new_secs = pred_secs + length / self._walking_speed
 
             # the edge has been visited
-            if not edge_status.is_unreached():
-                lab = weakref.proxy(self._edge_labels_walking[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_walking.insert(new_key=new_cost.cost,
-                                                            item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-                        lab.can_change_mode = pred.can_change_mode
+            if not edges_status.is_unreached(slot):
+                lab_idx = edges_status.label_index[slot]
+                if labels.end_node[lab_idx] == end_node:
+                    if new_cost < labels.cost[lab_idx]:
+                        self._adjacency_list_walking.insert(new_key=new_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs,
+                                      labels.start[lab_idx], end_node, pred_idx)
+                        labels.set_can_change_mode(lab_idx, can_change_mode)
 
                 # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length']):
-                        self._adjacency_list_walking.insert(new_key=new_cost.cost,
-                                                            item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
-                        lab.can_change_mode = pred.can_change_mode
+                elif labels.end_node[lab_idx] == node:
+                    if new_cost < (labels.cost[lab_idx] - length):
+                        self._adjacency_list_walking.insert(new_key=new_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
+                        labels.set_can_change_mode(lab_idx, can_change_mode)
 
                 continue
 
-            idx = len(self._edge_labels_walking)
-            self._edge_labels_walking.append(EdgeLabel(new_cost,
-                                                       new_cost.cost,
-                                                       edge_id,
-                                                       pred_idx,
-                                                       end_node,
-                                                       can_change_mode=pred.can_change_mode))
+            idx = labels.append(new_cost, new_secs, new_cost, node, end_node, slot, pred_idx, init_cost, init_secs,
+                                can_change_mode=can_change_mode)
 
-            self._edges_status_walking[edge_id] = EdgeStatus(idx).set_temporary()
-            self._adjacency_list_walking.insert(new_cost.cost, idx)
+            edges_status.set_temporary(slot, idx)
+            self._adjacency_list_walking.insert(new_cost, idx)
 
-    def expand_bike(self, g: nx.MultiDiGraph, node: NodeId, pred_idx: EdgeLabelIdx):
-        for end_node in g.adj[node]:
-            edge = g.adj[node][end_node][0]
-            edge_status = self._edges_status_bike[EdgeId(node, end_node)]
+    def expand_bike(self, g: CompiledGraph, node: NodeId, pred_idx: EdgeLabelIdx):
+        labels = self._edge_labels_bike
+        edges_status = self._edges_status_bike
+        pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+        init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
 
-            pred = self._edge_labels_bike[pred_idx]
+        for end_node, length, edge in g.adjacent(node):
 
-            new_cost = pred.cost + Cost(edge['length'] * self._walking_speed / self._bike_speed,
-                                        edge['length'] / self._bike_speed)
-            edge_id = EdgeId(node, end_node)
+            new_cost = pred_cost + length * self._walking_speed / self._bike_speed
+            new_secs = pred_secs + length / self._bike_speed
 
-            sort_cost = new_cost.cost
+            sort_cost = new_cost
 
             # the edge has been visited
-            if not edge_status.is_unreached():
-                lab = weakref.proxy(self._edge_labels_bike[edge_status.edge_label_index])
-                if lab.end_node == end_node:
-                    if new_cost < lab.cost:
-                        self._adjacency_list_bike.insert(new_key=sort_cost,
-                                                         item=edge_status.edge_label_index)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+            if not edges_status.is_unreached(edge):
+                lab_idx = edges_status.label_index[edge]
+                if labels.end_node[lab_idx] == end_node:
+                    if new_cost < labels.cost[lab_idx]:
+                        self._adjacency_list_bike.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs,
+                                      labels.start[lab_idx], end_node, pred_idx)
 
                 # Hmmm, we are visiting the edge in the opposing direction of last visit
-                elif lab.end_node == node:
-                    if new_cost.cost < (lab.cost.cost - edge['length'] * (self._walking_speed / self._bike_speed)):
-                        self._adjacency_list_bike.insert(new_key=sort_cost,
-                                                         item=edge_status.edge_label_index)
-                        lab.edge_id = EdgeId(node, end_node)
-                        lab.pred_idx = pred_idx
-                        lab.end_node = end_node
-                        lab.cost = new_cost
+                elif labels.end_node[lab_idx] == node:
+                    if new_cost < (labels.cost[lab_idx] - length * (self._walking_speed / self._bike_speed)):
+                        self._adjacency_list_bike.insert(new_key=sort_cost, item=lab_idx)
+                        labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
                 continue
 
-            idx = len(self._edge_labels_bike)
-            self._edge_labels_bike.append(EdgeLabel(new_cost,
-                                                            sort_cost,
-                                                            edge_id,
-                                                            pred_idx,
-                                                            end_node))
+            idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, edge, pred_idx, init_cost, init_secs)
 
-            self._edges_status_bike[edge_id] = EdgeStatus(idx).set_temporary()
+            edges_status.set_temporary(edge, idx)
             self._adjacency_list_bike.insert(sort_cost, idx)
 
     def get_isochrone(self,
@@ -211,7 +192,15 @@ class MultiModalDoubleExpansionIsochrone(object):
                       bss_nodes: Set[NodeId],
                       callback: Callable=lambda *args, **kwargs: None) -> Dict[NodeId, Cost]:
 
-        self.append_walking(g, orig, can_change_mode=True)
+        graph = as_compiled(g)
+        orig = graph.node_index(orig)
+        dest_nodes = set(graph.node_indices(dest_nodes))
+        bss_nodes = set(graph.node_indices(bss_nodes))
+        self.init()
+        self._edges_status_walking = self._workspace.status('walking', graph.undirected_edge_count, layers=2)
+        self._edges_status_bike = self._workspace.status('bike', graph.undirected_edge_count)
+
+        self.append_walking(graph, orig, can_change_mode=True)
 
         expand_walking = True
         expand_bike = True
@@ -230,52 +219,57 @@ class MultiModalDoubleExpansionIsochrone(object):
                 a = 0
             a += 1
 
+            # everything reachable has been visited
+            if not self._adjacency_list_walking and not self._adjacency_list_bike:
+                return {}
+
             bike_cost, bike_edge_label_idx = float('inf'), None
             if self._adjacency_list_bike:
                 bike_cost, bike_edge_label_idx = self._adjacency_list_bike.peak()
-            walking_cost, walking_edge_label_idx = self._adjacency_list_walking.peak()
+            walking_cost, walking_edge_label_idx = float('inf'), None
+            if self._adjacency_list_walking:
+                walking_cost, walking_edge_label_idx = self._adjacency_list_walking.peak()
 
             if walking_cost < bike_cost:
                 expand_walking = True
                 expand_bike = False
                 self._adjacency_list_walking.pop()
-                forward_edge_label = self._edge_labels_walking[walking_edge_label_idx]
+                labels, label_idx = self._edge_labels_walking, walking_edge_label_idx
+                secs, end_node = labels.secs[label_idx], labels.end_node[label_idx]
 
-                if forward_edge_label.can_change_mode and forward_edge_label.cost.secs > 1200:
+                if labels.can_change_mode(label_idx) and secs > 1200:
                     continue
 
-                if not forward_edge_label.can_change_mode and (forward_edge_label.cost.secs - forward_edge_label.cost.init_secs)> 1200:
+                if not labels.can_change_mode(label_idx) and (secs - labels.init_secs[label_idx]) > 1200:
                     continue
 
-                if forward_edge_label.end_node in dest_nodes:
-                    print(forward_edge_label.cost.secs)
-
-                if forward_edge_label.can_change_mode and forward_edge_label.end_node in bss_nodes:
-                    self.append_bike(g,
-                                     forward_edge_label.end_node,
-                                     init_secs=forward_edge_label.cost.secs,
-                                     init_cost=forward_edge_label.cost.secs * self._walking_speed)
+                if labels.can_change_mode(label_idx) and end_node in bss_nodes:
+                    self.append_bike(graph,
+                                     end_node,
+                                     init_secs=secs,
+                                     init_cost=secs * self._walking_speed)
 
             else:
                 expand_walking = False
                 expand_bike = True
                 self._adjacency_list_bike.pop()
-                forward_edge_label = self._edge_labels_bike[bike_edge_label_idx]
+                labels, label_idx = self._edge_labels_bike, bike_edge_label_idx
+                secs, end_node = labels.secs[label_idx], labels.end_node[label_idx]
 
-                if (forward_edge_label.cost.secs - forward_edge_label.cost.init_secs) > 1800:
+                if (secs - labels.init_secs[label_idx]) > 1800:
                     continue
 
-                if forward_edge_label.end_node in bss_nodes:
-                    self.append_walking(g,
-                                        forward_edge_label.end_node,
+                if end_node in bss_nodes:
+                    self.append_walking(graph,
+                                        end_node,
                                         can_change_mode=False,
-                                        init_secs=forward_edge_label.cost.secs,
-                                        init_cost=forward_edge_label.cost.secs * self._bike_speed)
+                                        init_secs=secs,
+                                        init_cost=secs * self._bike_speed)
 
             if walking_cost > 3600 * self._walking_speed:
                 return {}
 
             if expand_walking:
-                self.expand_walking(g, forward_edge_label.end_node, walking_edge_label_idx)
+                self.expand_walking(graph, labels.end_node[label_idx], walking_edge_label_idx)
             elif expand_bike:
-                self.expand_bike(g, forward_edge_label.end_node, bike_edge_label_idx)
+                self.expand_bike(graph, labels.end_node[label_idx], bike_edge_label_idx)
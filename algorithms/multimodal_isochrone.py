@@ -1,24 +1,38 @@
-from typing import Set, Callable, Dict
+from typing import Set, Callable, Dict, List, Optional
 import networkx as nx
+import numpy as np
 
 from algorithms.isochrone import Isocrhone
-from algorithms.inner_types import NodeId, Cost
+from algorithms.inner_types import NodeId, Cost, EdgeLocation
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.relaxation import Point
+from algorithms.station_table import StationReach, build_station_reach
+from algorithms.workspace import SearchWorkspace
 from call_backs import astar_call_back
 WALKING_SPEED = 1.4
 BIKE_SPEED = 3.3
 
 
 class MultiModalIsochrone(object):
+    """
+    The nodes reachable by a walk to a station, a bike leg to another station and a walk from it, each leg within
+    its limit, at the seconds of the fastest such trip
+
+    The first walk is searched. The bike leg and the last walk are merged from the reach of the stations
+    precomputed next to the graph (build_station_table.py) when it covers the limits and the stations, otherwise
+    from the reach of the stations the query needs, searched for it. Both give the same result.
+    """
     _bss_nodes: Set[NodeId]
     _first_isochrone: Isocrhone
-    _second_isochrone: Isocrhone
-    _third_isochrone: Isocrhone
 
-    def __init__(self, bss_nodes: Set[NodeId], walking_speed: float=WALKING_SPEED, bike_speed: float=BIKE_SPEED):
+    def __init__(self, bss_nodes: Set[NodeId], walking_speed: float=WALKING_SPEED, bike_speed: float=BIKE_SPEED,
+                 queue_backend='heap', workspace: Optional[SearchWorkspace] = None):
         self._bss_nodes = bss_nodes
-        self._first_isochrone = Isocrhone(speed=walking_speed)
-        self._second_isochrone = Isocrhone(speed=bike_speed)
-        self._third_isochrone = Isocrhone(speed=walking_speed)
+        self._walking_speed = walking_speed
+        self._bike_speed = bike_speed
+        workspace = workspace if workspace is not None else SearchWorkspace()
+        self._first_isochrone = Isocrhone(speed=walking_speed, queue_backend=queue_backend,
+                                          workspace=workspace.child('first'))
 
     def get_isochrone(self,
                       g: nx.MultiDiGraph,
@@ -29,12 +43,60 @@ class MultiModalIsochrone(object):
                       callback: Callable=lambda *args, **kwargs: None) -> Dict[NodeId, Cost]:
 
         first_res = self._first_isochrone.get_isochrone(g, orig, self._bss_nodes, limit=walking_time_limit)
-        for node, cost in first_res.items():
-            self._second_isochrone.init_origin(g, node, cost.secs, cost.secs * BIKE_SPEED)
+        if not first_res:
+            return {}
+
+        graph = as_compiled(g)
+        walking_metres, bike_metres = walking_time_limit * self._walking_speed, bike_time_limit * self._bike_speed
+        stations = graph.node_indices(self._bss_nodes)
+        reach = StationReach.from_graph(graph)
+        if reach is None or not reach.covers(walking_metres, bike_metres) or reach.columns(stations) is None:
+            reach = None
+            # the bike rows of the stations walked to, the walking rows of the ones ridden to are searched below
+            ride_reach = build_station_reach(graph, self._bss_nodes, walking_metres, bike_metres,
+                                             bike_sources=first_res, walk_sources=())
+        else:
+            ride_reach = reach
+
+        allowed = np.zeros(len(ride_reach), dtype=bool)
+        allowed[ride_reach.columns(stations)] = True
+        station_secs = ride_reach.ride(ride_reach.columns(graph.node_indices(first_res)),
+                                       np.array([cost.secs for cost in first_res.values()]), allowed,
+                                       self._bike_speed, bike_time_limit)
 
-        second_res = self._second_isochrone.run(g, orig, self._bss_nodes, limit=bike_time_limit)
+        if reach is None:
+            ridden = ride_reach.stations[np.isfinite(station_secs)]
+            reach = build_station_reach(graph, self._bss_nodes, walking_metres, bike_metres, bike_sources=(),
+                                        walk_sources=graph.osm_ids[ridden].tolist())
+        return self._walk(graph, reach, station_secs, list(dest_nodes), walking_time_limit)
 
-        for node, cost in second_res.items():
-            self._third_isochrone.init_origin(g, node, cost.secs, cost.init_cost + (cost.secs - cost.init_secs) * WALKING_SPEED)
+    def _walk(self, graph: CompiledGraph, reach: StationReach, station_secs: np.ndarray, dest_nodes: List[Point],
+              walking_time_limit: int) -> Dict[Point, Cost]:
+        """
+        The last walk from the stations at station_secs (the columns of reach) to dest_nodes
+        """
+        # the nodes a walk to a destination ends at and the metres left from them: the node itself, or the ends of
+        # the edge of an EdgeLocation
+        nodes = iter(graph.node_indices([point for point in dest_nodes if not isinstance(point, EdgeLocation)]))
+        targets, metres, owners = [], [], []
+        for i, point in enumerate(dest_nodes):
+            if not isinstance(point, EdgeLocation):
+                ends = [(next(nodes), 0.)]
+            else:
+                ends = [(point.source, point.fraction * point.length)]
+                if point.reversible:
+                    ends.append((point.target, (1 - point.fraction) * point.length))
+            for node, length in ends:
+                targets.append(node)
+                metres.append(length)
+                owners.append(i)
 
-        return self._third_isochrone.run(g, orig, dest_nodes, limit=walking_time_limit)
+        secs, init_secs = reach.walk(station_secs, np.array(targets, dtype=np.int64), np.array(metres),
+                                     self._walking_speed, walking_time_limit)
+        res = {}
+        for i, target_secs, target_init_secs in zip(owners, secs.tolist(), init_secs.tolist()):
+            point = dest_nodes[i]
+            if target_secs < float('inf') and (point not in res or target_secs < res[point].secs):
+                res[point] = Cost(target_secs * self._walking_speed, target_secs,
+                                  target_init_secs * self._walking_speed, target_init_secs)
+        return res
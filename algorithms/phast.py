@@ -0,0 +1,162 @@
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+import networkx as nx
+import numpy as np
+
+from algorithms.inner_types import NodeId, Cost
+from algorithms.graph import CompiledGraph, as_compiled
+from algorithms.contraction import ContractionHierarchy, get_hierarchy, upward_search
+
+# PHAST, see Delling et al., "PHAST: Hardware-accelerated shortest path trees".
+#
+# The distances from an origin to every node of a contraction hierarchy come in two phases: a small upward
+# Dijkstra from the origin, then one sweep over the down arcs from the highest nodes to the lowest, where a node
+# takes the best of its distance and the ones of its higher neighbours plus the arc. No queue in the sweep: the
+# down arcs are grouped by level, the level of a node being one more than the highest level of the nodes above it,
+# and a level is relaxed at once with numpy.
+#
+# RPHAST restricts the sweep to the targets and the nodes above them, which is what a target set of a few
+# thousand nodes costs instead of the whole graph.
+
+
+def node_levels(hierarchy: ContractionHierarchy) -> np.ndarray:
+    # 0 for the nodes without down arcs, the top of the hierarchy
+    lists = hierarchy.lists()
+    offsets, sources = lists['down_offsets'], lists['down_sources']
+    levels = [0] * len(offsets[:-1])
+    # the sources of the down arcs of a node are contracted after it
+    for node in np.argsort(-np.asarray(hierarchy.rank), kind='stable').tolist():
+        start, end = offsets[node], offsets[node + 1]
+        if start != end:
+            levels[node] = max(levels[source] for source in sources[start:end]) + 1
+    return np.array(levels, dtype=np.int32)
+
+
+def upward_closure(hierarchy: ContractionHierarchy, nodes: Iterable[int]) -> np.ndarray:
+    # the nodes and all those above them through the down arcs, the part of the sweep they need
+    lists = hierarchy.lists()
+    offsets, sources = lists['down_offsets'], lists['down_sources']
+    seen = np.zeros(len(offsets) - 1, dtype=bool)
+    stack = list(nodes)
+    seen[stack] = True
+    while stack:
+        node = stack.pop()
+        for source in sources[offsets[node]:offsets[node + 1]]:
+            if not seen[source]:
+                seen[source] = True
+                stack.append(source)
+    return seen
+
+
+@dataclass
+class DownwardSweep(object):
+    """
+    The down arcs sources[i] -> targets[i] sorted by level, then target. Level l covers [start, end) of the arcs,
+    its targets are unique_targets, the first arc of each at reduce_starts (relative to start).
+    """
+    sources: np.ndarray
+    targets: np.ndarray
+    weights: np.ndarray
+    levels: List[Tuple[int, int, np.ndarray, np.ndarray]]
+
+    @classmethod
+    def build(cls, hierarchy: ContractionHierarchy, levels: np.ndarray,
+              restricted_to: Optional[np.ndarray] = None) -> 'DownwardSweep':
+        """
+        restricted_to is a node mask, only the arcs going down to its nodes are kept (RPHAST)
+        """
+        down_offsets = np.asarray(hierarchy.down_offsets)
+        targets = np.repeat(np.arange(len(down_offsets) - 1, dtype=np.int32), np.diff(down_offsets))
+        sources, weights = np.asarray(hierarchy.down_sources), np.asarray(hierarchy.down_weights)
+        if restricted_to is not None:
+            kept = restricted_to[targets]
+            sources, targets, weights = sources[kept], targets[kept], weights[kept]
+
+        arc_levels = levels[targets]
+        order = np.lexsort((targets, arc_levels))
+        sources, targets, weights, arc_levels = sources[order], targets[order], weights[order], arc_levels[order]
+
+        bounds = np.concatenate(([0], np.flatnonzero(np.diff(arc_levels)) + 1, [len(targets)])).tolist()
+        by_level = []
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            level_targets = targets[start:end]
+            reduce_starts = np.flatnonzero(np.concatenate(([True], level_targets[1:] != level_targets[:-1])))
+            by_level.append((start, end, level_targets[reduce_starts], reduce_starts))
+        return cls(sources, targets, weights, by_level)
+
+    def run(self, dist: np.ndarray):
+        for start, end, unique_targets, reduce_starts in self.levels:
+            costs = np.minimum.reduceat(dist[self.sources[start:end]] + self.weights[start:end], reduce_starts)
+            dist[unique_targets] = np.minimum(dist[unique_targets], costs)
+
+
+class PhastIsochrone(object):
+    """
+    One to all (or to many) distances on a contraction hierarchy, for accessibility over many origins
+
+        phast = PhastIsochrone()
+        for orig in origins:
+            res = phast.get_isochrone(graph, orig, stations, limit=900)
+
+    The sweep of a target set is built on its first query and kept for the next origins.
+    """
+
+    def __init__(self, speed=1.4, hierarchy: Optional[ContractionHierarchy] = None):
+        self._speed = speed
+        self._hierarchy = hierarchy
+        self._levels: Optional[np.ndarray] = None
+        # target set (None for all the nodes) -> sweep
+        self._sweeps: Dict[Optional[FrozenSet[int]], DownwardSweep] = {}
+        self._dist: Optional[np.ndarray] = None
+
+    def _get_sweep(self, g: CompiledGraph, targets: Optional[FrozenSet[int]]) -> DownwardSweep:
+        if self._hierarchy is None:
+            self._hierarchy = get_hierarchy(g)
+        sweep = self._sweeps.get(targets)
+        if sweep is None:
+            if self._levels is None:
+                self._levels = node_levels(self._hierarchy)
+            restricted_to = upward_closure(self._hierarchy, targets) if targets is not None else None
+            sweep = self._sweeps[targets] = DownwardSweep.build(self._hierarchy, self._levels, restricted_to)
+        return sweep
+
+    def _costs(self, g: CompiledGraph, orig: int, targets: Optional[FrozenSet[int]], limit: float) -> np.ndarray:
+        sweep = self._get_sweep(g, targets)
+        if self._dist is None or len(self._dist) != g.node_count:
+            self._dist = np.empty(g.node_count)
+        dist = self._dist
+        dist.fill(np.inf)
+        # the sweep corrects the distances of the stalled nodes
+        upward = upward_search(self._hierarchy, orig, max_cost=limit * self._speed)
+        dist[list(upward)] = list(upward.values())
+        sweep.run(dist)
+        return dist
+
+    def get_seconds(self, g: Union[nx.MultiDiGraph, CompiledGraph], orig: NodeId,
+                    targets: Optional[List[NodeId]] = None, limit: float = float('inf')) -> np.ndarray:
+        """
+        The seconds from orig to targets, in their order, or to every node in the order of the compiled graph
+        when targets is None. inf for the nodes beyond limit or unreachable.
+        """
+        graph = as_compiled(g)
+        target_indices = graph.node_indices(targets) if targets is not None else None
+        dist = self._costs(graph, graph.node_index(orig),
+                           frozenset(target_indices) if targets is not None else None, limit)
+        secs = (dist[target_indices] if targets is not None else dist) / self._speed
+        secs[secs > limit] = np.inf
+        return secs
+
+    def get_isochrone(self, g: Union[nx.MultiDiGraph, CompiledGraph], orig: NodeId, dest_nodes: Iterable[NodeId],
+                      limit: float = 900) -> Dict[NodeId, Cost]:
+        """
+        The Cost of the nodes of dest_nodes reachable within limit seconds, like Isocrhone.get_isochrone
+        """
+        graph = as_compiled(g)
+        dest_nodes = list(dest_nodes)
+        indices = graph.node_indices(dest_nodes)
+        costs = self._costs(graph, graph.node_index(orig), frozenset(indices), limit)[indices].tolist()
+        return {node: Cost(cost, cost / self._speed) for node, cost in zip(dest_nodes, costs)
+                if cost / self._speed <= limit}
@@ -0,0 +1,153 @@
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+from algorithms.geo import DistanceTable
+from algorithms.graph import CompiledGraph
+from algorithms.inner_types import NodeId, EdgeLabelIdx, EdgeLocation
+from algorithms.label_store import EdgeLabelStore, EdgeStatusStore
+from algorithms.landmarks import Landmarks
+
+# The edge relaxation shared by AStar, Isocrhone and DoubleAstar.
+#
+# It works on the scalar columns of the labels: a relaxation reads floats and writes them back in place,
+# the only thing it allocates is the label of an edge reached for the first time.
+
+Heuristic = Callable[[NodeId], float]
+
+# where a search starts or ends: an osm node id, or a point of an edge (geo.snap_to_edges)
+Point = Union[NodeId, EdgeLocation]
+
+
+def search_point(g: CompiledGraph, point: Point) -> Union[int, EdgeLocation]:
+    # the dense index of a node, an EdgeLocation is already in dense indices
+    return point if isinstance(point, EdgeLocation) else g.node_index(point)
+
+
+def reverse_point(point: Union[int, EdgeLocation]) -> Union[int, EdgeLocation]:
+    # the point a backward search sees, on the reversed graph
+    return point.reverse() if isinstance(point, EdgeLocation) else point
+
+
+def seed_edges(g: CompiledGraph, point: Union[int, EdgeLocation]) -> List[Tuple[int, int, float, int]]:
+    """
+    (start, end node, length, edge) of the first labels of a search from point: the out edges of a node, or the
+    rest of the edge of an EdgeLocation to its target, and to its source when the edge goes both ways
+    """
+    if not isinstance(point, EdgeLocation):
+        return [(point, end_node, length, edge) for end_node, length, edge in g.adjacent(point)]
+    seeds = [(point.source, point.target, (1 - point.fraction) * point.length, point.edge)]
+    if point.reversible:
+        seeds.append((point.target, point.source, point.fraction * point.length, point.edge))
+    return seeds
+
+
+def direct_cost(orig: Union[int, EdgeLocation], dest: Union[int, EdgeLocation]) -> Optional[float]:
+    """
+    The length from orig to dest along their edge when both are on the same one and it goes that way, None
+    otherwise. No path leaving the edge is shorter.
+    """
+    if not isinstance(orig, EdgeLocation) or not isinstance(dest, EdgeLocation) or orig.edge != dest.edge:
+        return None
+    fraction = dest.fraction if dest.source == orig.source else 1 - dest.fraction
+    if fraction < orig.fraction and not orig.reversible:
+        return None
+    return abs(fraction - orig.fraction) * orig.length
+
+
+def point_heuristic(make: Callable[[NodeId], Optional[Heuristic]],
+                    target: Union[int, EdgeLocation, None]) -> Optional[Heuristic]:
+    """
+    make(node) for a node target. For an EdgeLocation, the heuristic to the target of its edge minus the rest of
+    the edge: the point is at most that far from it, the estimate stays below the distance to the point.
+    """
+    if not isinstance(target, EdgeLocation):
+        return make(target)
+    heuristic = make(target.target)
+    if heuristic is None:
+        return None
+    margin = (1 - target.fraction) * target.length
+    return lambda node: max(heuristic(node) - margin, 0.)
+
+
+def great_circle_heuristic(g: CompiledGraph, target: NodeId, cost_factor: float) -> Optional[Heuristic]:
+    """
+    node -> cost_factor * great circle distance from node to target, None when there is no estimate
+    """
+    if cost_factor == 0 or target is None:
+        return None
+    return DistanceTable(g, target, cost_factor)
+
+
+def landmark_heuristic(landmarks: Landmarks, target: NodeId, factor: float = 1.) -> Optional[Heuristic]:
+    """
+    node -> factor * ALT lower bound of the distance from node to target, None when there is no target
+
+    Admissible for factor <= 1, the search stays exact.
+    """
+    if target is None:
+        return None
+    return landmarks.potential(target, factor)
+
+
+def relax(g: CompiledGraph,
+          node: NodeId,
+          pred_idx: EdgeLabelIdx,
+          labels: EdgeLabelStore,
+          edges_status: EdgeStatusStore,
+          queue,
+          speed: float,
+          heuristic: Optional[Heuristic] = None,
+          destinations: Optional[Dict[int, float]] = None,
+          on_destination: Optional[Callable] = None):
+    """
+    Relax the out edges of node, reached by the label pred_idx
+
+    An edge touching one of destinations (edge id -> length) is reported before its relaxation with
+    on_destination(edge, new_cost, new_secs, init_cost, init_secs).
+    """
+    pred_cost, pred_secs = labels.cost[pred_idx], labels.secs[pred_idx]
+    init_cost, init_secs = labels.init_cost[pred_idx], labels.init_secs[pred_idx]
+    end_nodes, costs = labels.end_node, labels.cost
+    label_index = edges_status.label_index
+
+    for end_node, length, edge in g.adjacent(node):
+        if edges_status.is_permanent(edge):
+            continue
+
+        new_cost = pred_cost + length
+        new_secs = pred_secs + length / speed
+
+        if destinations and edge in destinations:
+            on_destination(edge, new_cost, new_secs, init_cost, init_secs)
+
+        sort_cost = new_cost + heuristic(end_node) if heuristic is not None else new_cost
+
+        # the edge has been visited
+        if edges_status.is_temporary(edge):
+            lab_idx = label_index[edge]
+            #   Edge:
+            #             4242   -------------  4141
+            #              start       ->        end
+            #                         or
+            #               end        <-       start
+
+            # the edge may have been visited either from its start or end,
+            # let's find out in this case which one is "cheaper"
+
+            # OK, we are visiting the edge at the same direction of last visit, nothing
+            # to be done
+            if end_nodes[lab_idx] == end_node:
+                if new_cost < costs[lab_idx]:
+                    queue.insert(new_key=sort_cost, item=lab_idx)
+                    labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
+
+            # Hmmm, we are visiting the edge in the opposing direction of last visit
+            elif end_nodes[lab_idx] == node:
+                if new_cost < (costs[lab_idx] - length):
+                    queue.insert(new_key=sort_cost, item=lab_idx)
+                    labels.update(lab_idx, new_cost, new_secs, init_cost, init_secs, node, end_node, pred_idx)
+
+            continue
+
+        idx = labels.append(new_cost, new_secs, sort_cost, node, end_node, edge, pred_idx, init_cost, init_secs)
+        edges_status.set_temporary(edge, idx)
+        queue.insert(sort_cost, idx)
@@ -0,0 +1,49 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, Optional, Set
+
+from algorithms.inner_types import NodeId
+
+# Dominance pruning of the stations a multimodal search seeds its bike search with.
+#
+# A bike rides every arc a pedestrian walks, ratio = walking speed / bike speed of the walking seconds. A station s
+# reached in a_s walking seconds is dominated by a station s' when riding from s' to s is no later than walking to s:
+#     a_s' + bike(s', s) <= a_s
+# any bike leg from s is then no faster than the same leg from s' riding through s, s isn't seeded. bike(s', s) is
+# bounded from above, the pruning doesn't lose any trip:
+#   - when the walking path to s goes through s': (a_s - a_s') * ratio, s is always dominated
+#   - on a symmetric graph, back to the origin and on to s: (a_s' + a_s) * ratio, s is dominated by the nearest
+#     station when it's far enough
+# The same holds for the stations of the last walk, their seconds being the walk to the destination. A trip riding
+# back to the station dominating its start is lost, walking through that station is faster anyway.
+
+
+@dataclass
+class SeedStats(object):
+    # the stations reached by the walking searches of a query and the ones not seeded
+    seeds: int = 0
+    pruned: int = 0
+
+
+def is_dominated(secs: float, nearest_secs: Optional[float], ratio: float) -> bool:
+    # by the station nearest to the origin (destination) through the origin (destination), symmetric graphs only
+    return nearest_secs is not None and nearest_secs + (nearest_secs + secs) * ratio <= secs
+
+
+def prune_seeds(stations: Dict[NodeId, float], path: Callable[[NodeId], Iterable[NodeId]], ratio: float,
+                symmetric: bool, stats: Optional[SeedStats] = None) -> Set[NodeId]:
+    """
+    The stations (-> walking seconds) not dominated, path gives the nodes of the walking path of a station
+    between the origin and it, both excluded
+    """
+    nearest = min(stations, key=stations.get) if stations else None
+    kept = set()
+    for station, secs in stations.items():
+        if station != nearest and symmetric and is_dominated(secs, stations[nearest], ratio):
+            continue
+        if any(node in stations for node in path(station)):
+            continue
+        kept.add(station)
+    if stats is not None:
+        stats.seeds += len(stations)
+        stats.pruned += len(stations) - len(kept)
+    return kept
@@ -0,0 +1,140 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional
+import heapq
+
+import numpy as np
+
+from algorithms.geo import BlockTable, haversine
+from algorithms.graph import CompiledGraph
+from algorithms.inner_types import NodeId
+from algorithms.landmarks import reverse_arcs
+from algorithms.station_table import station_columns
+
+# A lower bound of the cost left to the target of a multimodal search that knows about the stations. The costs are
+# walking metres, a metre by bike costs ratio = walking speed / bike speed. A trip walks w metres and rides b:
+#     w + ratio * b = (1 - ratio) * w + ratio * (w + b)
+# w + b is at least the great circle distance d to the target, and a trip riding a bike walks at least to a station
+# and from one: W(v) from v to its nearest station, computed once for all the nodes by a Dijkstra from all the
+# stations, and L, the great circle distance from the target to its nearest station. Walking at v:
+#     min(d, (1 - ratio) * (W(v) + L) + ratio * d)
+# and riding: (1 - ratio) * L + ratio * d. L is geographic, not the shortest walk from a station, for the bounds to
+# stay consistent when the mode changes at a station.
+#
+# The great circle distances are scaled by length_factor, the smallest ratio of the length of an arc to the great
+# circle distance between its ends: the bounds hold on the graphs whose lengths aren't to scale too.
+
+ARTEFACT_NAME_PREFIX = 'bss_bounds_'
+ARTEFACT_NAMES = ('stations', 'to_station', 'length_factor')
+
+
+def nearest_station(offsets: List[int], targets: List[int], lengths: List[float], stations: Iterable[int]) -> np.ndarray:
+    """
+    The length of the shortest path from the nearest station to every node, inf when there is none: one Dijkstra
+    from all the stations. Over the reversed arcs, the path from every node to its nearest station.
+    """
+    inf = float('inf')
+    dist = [inf] * (len(offsets) - 1)
+    heap = [(0., station) for station in stations]
+    for _, station in heap:
+        dist[station] = 0.
+    heapq.heapify(heap)
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > dist[node]:
+            continue
+        for i in range(offsets[node], offsets[node + 1]):
+            end_node = targets[i]
+            new_cost = cost + lengths[i]
+            if new_cost < dist[end_node]:
+                dist[end_node] = new_cost
+                heapq.heappush(heap, (new_cost, end_node))
+    return np.array(dist)
+
+
+def length_factor(g: CompiledGraph) -> float:
+    # the smallest length of an arc over the great circle distance between its ends, at most 1
+    sources = np.repeat(np.arange(g.node_count), np.diff(g.offsets))
+    metres = haversine(g.lats[sources], g.lons[sources], g.lats[g.targets], g.lons[g.targets])
+    positive = metres > 0
+    if not positive.any():
+        return 1.
+    return float(min(1., (np.asarray(g.lengths)[positive] / metres[positive]).min()))
+
+
+@dataclass
+class StationBounds(object):
+    """
+    to_station[v] is the length of the shortest path from v to the nearest of the stations (dense node indices,
+    sorted), inf when there is none. The great circle distances times length_factor[0] are at most the lengths
+    of the paths.
+    """
+    stations: np.ndarray
+    to_station: np.ndarray
+    length_factor: np.ndarray
+
+    def covers(self, nodes: Iterable[int]) -> bool:
+        # the bounds hold for any subset of the stations
+        nodes = sorted(nodes)
+        return not nodes or station_columns(self.stations, nodes) is not None
+
+    def potential(self, g: CompiledGraph, target: NodeId, ratio: float, walking: bool) -> 'StationPotential':
+        """
+        The bound of the cost from every node to target, walking or riding
+        """
+        factor = float(self.length_factor[0])
+        lat, lon = float(g.lats[target]), float(g.lons[target])
+        last = haversine(np.asarray(g.lats)[self.stations], np.asarray(g.lons)[self.stations], lat, lon).min() * \
+            factor if len(self.stations) else float('inf')
+        return StationPotential(g, target, factor, ratio, last, self.to_station if walking else None)
+
+    def to_artefacts(self) -> Dict[str, np.ndarray]:
+        return {ARTEFACT_NAME_PREFIX + name: getattr(self, name) for name in ARTEFACT_NAMES}
+
+    @classmethod
+    def from_graph(cls, g: CompiledGraph) -> Optional['StationBounds']:
+        """
+        The bounds stored in the artefacts of g, None when it has none
+        """
+        if ARTEFACT_NAME_PREFIX + ARTEFACT_NAMES[0] not in g.artefacts:
+            return None
+        return cls(**{name: g.artefacts[ARTEFACT_NAME_PREFIX + name] for name in ARTEFACT_NAMES})
+
+
+class StationPotential(BlockTable):
+    """
+    node -> lower bound of the cost from node to target, walking when walk_metres (the metres between every node
+    and its nearest station) is given, else riding
+    """
+    __slots__ = ('target', '_lats', '_lons', '_lat', '_lon', '_factor', '_ratio', '_last', '_walk_metres')
+
+    def __init__(self, g: CompiledGraph, target: NodeId, factor: float, ratio: float, last_metres: float,
+                 walk_metres: Optional[np.ndarray] = None):
+        super().__init__()
+        self.target = target
+        self._lats, self._lons = g.lats, g.lons
+        self._lat, self._lon = float(g.lats[target]), float(g.lons[target])
+        self._factor = factor
+        # a bike slower than walking is never worth it, the bound is the walk
+        self._ratio = min(1., ratio)
+        self._last = (1 - self._ratio) * last_metres if self._ratio < 1 else 0.
+        self._walk_metres = walk_metres if self._ratio < 1 else None
+
+    def _values(self, start: int, end: int) -> np.ndarray:
+        metres = haversine(self._lats[start:end], self._lons[start:end], self._lat, self._lon) * self._factor
+        riding = self._ratio * metres + self._last
+        if self._walk_metres is None:
+            return riding
+        return np.minimum(metres, riding + (1 - self._ratio) * self._walk_metres[start:end])
+
+
+def build_station_bounds(g: CompiledGraph, stations: Iterable[NodeId]) -> StationBounds:
+    """
+    The bounds of the stations (osm ids) of g
+    """
+    nodes = sorted(set(g.node_indices(stations)))
+    if g.is_symmetric():
+        arcs = g.offsets.tolist(), g.targets.tolist(), np.asarray(g.lengths).tolist()
+    else:
+        arcs = tuple(a.tolist() for a in reverse_arcs(g))
+    return StationBounds(np.array(nodes, dtype=np.int32), nearest_station(*arcs, nodes),
+                         np.array([length_factor(g)]))
@@ -0,0 +1,315 @@
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import heapq
+
+import numpy as np
+
+from algorithms.graph import CompiledGraph
+from algorithms.inner_types import NodeId
+
+# The bike legs between the bike share stations don't depend on the query: they're computed once, a Dijkstra per
+# station, and stored next to the graph (build_station_table.py). MultiModalAStart then picks the pair of stations
+# by adding the walking seconds to and from them to the table, and only the path of that pair is expanded.
+#
+# The paths are kept as one tree per station: the shortest path tree of its Dijkstra pruned to the branches leading
+# to the other stations. The paths of a station share their first nodes, the trees are much smaller than the paths.
+# Tree i is tree_nodes[tree_offsets[i]:tree_offsets[i + 1]], station i at position 0, every node has the position
+# of its parent in tree_parents (-1 for the root) and tree_leaves[i, j] is the position of station j (-1 when it
+# can't be reached).
+#
+# MultiModalIsochrone uses the reach of every station instead: the stations within a bike limit and the nodes
+# within a walking limit of it, as sparse rows (StationReach). A query then walks to the stations and merges the
+# rows of the ones it reaches with numpy, its bike and last walking stages don't search anymore. Without them, it
+# searches the rows of the stations it needs and merges them the same way.
+
+ARTEFACT_NAME_PREFIX = 'bss_'
+ARTEFACT_NAMES = ('stations', 'metres', 'tree_offsets', 'tree_nodes', 'tree_parents', 'tree_leaves')
+
+REACH_ARTEFACT_PREFIX = 'bss_reach_'
+REACH_ARTEFACT_NAMES = ('stations', 'max_metres', 'bike_offsets', 'bike_columns', 'bike_metres', 'walk_offsets',
+                        'walk_nodes', 'walk_metres')
+
+
+def station_tree(offsets: List[int], targets: List[int], lengths: List[float], source: int,
+                 stations: Dict[int, int]) -> Tuple[Dict[int, float], Dict[int, int]]:
+    """
+    Dijkstra from source until all the stations (node -> column) are settled, the distances of the settled nodes
+    and the parents of the reached ones
+    """
+    remaining = len(stations)
+    inf = float('inf')
+    dist = {source: 0.}
+    parent = {}
+    settled = {}
+    heap = [(0., source)]
+    while heap and remaining:
+        cost, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        settled[node] = cost
+        if node in stations:
+            remaining -= 1
+        for i in range(offsets[node], offsets[node + 1]):
+            end_node = targets[i]
+            new_cost = cost + lengths[i]
+            if new_cost < dist.get(end_node, inf):
+                dist[end_node] = new_cost
+                parent[end_node] = node
+                heapq.heappush(heap, (new_cost, end_node))
+    return settled, parent
+
+
+def bounded_search(offsets: List[int], targets: List[int], lengths: List[float], source: int, max_cost: float,
+                   stations: Optional[Dict[int, int]] = None) -> Dict[int, float]:
+    """
+    The distances of the nodes within max_cost of source, only the stations (node -> column) when given: the
+    Dijkstra stops once they're all settled
+    """
+    inf = float('inf')
+    dist = {source: 0.}
+    settled: Set[int] = set()
+    res = {}
+    heap = [(0., source)]
+    while heap and (stations is None or len(res) < len(stations)):
+        cost, node = heapq.heappop(heap)
+        if node in settled:
+            continue
+        if cost > max_cost:
+            break
+        settled.add(node)
+        if stations is None or node in stations:
+            res[node] = cost
+        for i in range(offsets[node], offsets[node + 1]):
+            end_node = targets[i]
+            new_cost = cost + lengths[i]
+            if new_cost < dist.get(end_node, inf):
+                dist[end_node] = new_cost
+                heapq.heappush(heap, (new_cost, end_node))
+    return res
+
+
+def station_columns(stations: np.ndarray, nodes: List[int]) -> Optional[np.ndarray]:
+    """
+    The positions of the nodes in stations (sorted), None when one of them isn't a station
+    """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    columns = np.minimum(np.searchsorted(stations, nodes), len(stations) - 1)
+    if not len(stations) or (stations[columns] != nodes).any():
+        return None
+    return columns
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # the positions in [starts[i], ends[i]) for every i, and the i of each
+    starts, ends = np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)
+    counts = ends - starts
+    owners = np.repeat(np.arange(len(starts)), counts)
+    positions = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + starts[owners]
+    return positions, owners
+
+
+def _rows(offsets: np.ndarray, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    # the positions of the items of the sparse rows, and the index in rows of each
+    return _ranges(offsets[rows], offsets[rows + 1])
+
+
+@dataclass
+class StationTable(object):
+    """
+    metres[i, j] is the length of the shortest path from stations[i] to stations[j] (dense node indices, sorted),
+    inf when there is none
+    """
+    stations: np.ndarray
+    metres: np.ndarray
+    tree_offsets: np.ndarray
+    tree_nodes: np.ndarray
+    tree_parents: np.ndarray
+    tree_leaves: np.ndarray
+
+    def __len__(self):
+        return len(self.stations)
+
+    def columns(self, nodes: List[int]) -> Optional[np.ndarray]:
+        # the rows/columns of the nodes in the table, None when one of them isn't a station of the table
+        return station_columns(self.stations, nodes)
+
+    def path(self, i: int, j: int) -> List[int]:
+        """
+        The nodes of the shortest path from stations[i] to stations[j], empty when there is none
+        """
+        start = int(self.tree_offsets[i])
+        pos = int(self.tree_leaves[i, j])
+        path = []
+        while pos >= 0:
+            path.append(int(self.tree_nodes[start + pos]))
+            pos = int(self.tree_parents[start + pos])
+        return path[::-1]
+
+    def to_artefacts(self) -> Dict[str, np.ndarray]:
+        return {ARTEFACT_NAME_PREFIX + name: getattr(self, name) for name in ARTEFACT_NAMES}
+
+    @classmethod
+    def from_graph(cls, g: CompiledGraph) -> Optional['StationTable']:
+        """
+        The table stored in the artefacts of g, None when it has none
+        """
+        if ARTEFACT_NAME_PREFIX + ARTEFACT_NAMES[0] not in g.artefacts:
+            return None
+        return cls(**{name: g.artefacts[ARTEFACT_NAME_PREFIX + name] for name in ARTEFACT_NAMES})
+
+
+def build_station_table(g: CompiledGraph, stations: Iterable[NodeId]) -> StationTable:
+    """
+    The table between the stations (osm ids) of g
+    """
+    nodes = sorted(set(g.node_indices(stations)))
+    columns = {node: j for j, node in enumerate(nodes)}
+    offsets, targets, lengths = g.offsets.tolist(), g.targets.tolist(), np.asarray(g.lengths).tolist()
+
+    metres = np.full((len(nodes), len(nodes)), np.inf)
+    tree_leaves = np.full((len(nodes), len(nodes)), -1, dtype=np.int32)
+    tree_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    tree_nodes: List[int] = []
+    tree_parents: List[int] = []
+    for i, source in enumerate(nodes):
+        settled, parent = station_tree(offsets, targets, lengths, source, columns)
+        # the branches of the shortest path tree leading to the stations, a node before its children
+        position = {source: 0}
+        tree = [source]
+        parents = [-1]
+        for j, station in enumerate(nodes):
+            if station not in settled:
+                continue
+            branch = []
+            node = station
+            while node not in position:
+                branch.append(node)
+                node = parent[node]
+            for node in reversed(branch):
+                position[node] = len(tree)
+                tree.append(node)
+                parents.append(position[parent[node]])
+            metres[i, j] = settled[station]
+            tree_leaves[i, j] = position[station]
+        tree_nodes.extend(tree)
+        tree_parents.extend(parents)
+        tree_offsets[i + 1] = len(tree_nodes)
+
+    return StationTable(np.array(nodes, dtype=np.int32), metres, tree_offsets,
+                        np.array(tree_nodes, dtype=np.int32), np.array(tree_parents, dtype=np.int32), tree_leaves)
+
+
+@dataclass
+class StationReach(object):
+    """
+    For station i of stations (dense node indices, sorted): the stations columns bike_columns[j] at bike_metres[j]
+    for j in [bike_offsets[i], bike_offsets[i + 1]) and the nodes walk_nodes[j] at walk_metres[j] for j in
+    [walk_offsets[i], walk_offsets[i + 1]). Only the ones within max_metres = [walking, bike] are kept.
+    """
+    stations: np.ndarray
+    max_metres: np.ndarray
+    bike_offsets: np.ndarray
+    bike_columns: np.ndarray
+    bike_metres: np.ndarray
+    walk_offsets: np.ndarray
+    walk_nodes: np.ndarray
+    walk_metres: np.ndarray
+
+    def __len__(self):
+        return len(self.stations)
+
+    def columns(self, nodes: List[int]) -> Optional[np.ndarray]:
+        return station_columns(self.stations, nodes)
+
+    def covers(self, walking_metres: float, bike_metres: float) -> bool:
+        return walking_metres <= self.max_metres[0] and bike_metres <= self.max_metres[1]
+
+    def ride(self, seeds: np.ndarray, seed_secs: np.ndarray, allowed: np.ndarray, bike_speed: float,
+             bike_limit: float) -> np.ndarray:
+        """
+        From the walking seconds to the seed stations (columns), the seconds of every station (inf when not
+        reached) by a bike leg from a seed to another station. Only the stations allowed (a mask of the columns)
+        are used.
+        """
+        positions, owners = _rows(self.bike_offsets, seeds)
+        columns = self.bike_columns[positions]
+        secs = seed_secs[owners] + self.bike_metres[positions] / bike_speed
+        keep = (self.bike_metres[positions] <= bike_limit * bike_speed) & allowed[columns] & (columns != seeds[owners])
+        station_secs = np.full(len(self), float('inf'))
+        np.minimum.at(station_secs, columns[keep], secs[keep])
+        return station_secs
+
+    def walk(self, station_secs: np.ndarray, targets: np.ndarray, target_metres: np.ndarray, walking_speed: float,
+             walking_limit: float) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        From the seconds of the stations (columns, inf when not reached), the seconds of every target (inf when
+        not reached) by a walk from a station to the target node then target_metres more, and the seconds when
+        leaving the station of its best walk
+        """
+        inf = float('inf')
+        stations = np.flatnonzero(np.isfinite(station_secs))
+        positions, owners = _rows(self.walk_offsets, stations)
+        nodes = self.walk_nodes[positions]
+        # the items of the rows ending at each target
+        order = np.argsort(nodes, kind='stable')
+        items, target_owners = _ranges(np.searchsorted(nodes, targets, 'left', sorter=order),
+                                       np.searchsorted(nodes, targets, 'right', sorter=order))
+        items = order[items]
+        metres = self.walk_metres[positions[items]] + target_metres[target_owners]
+        keep = metres <= walking_limit * walking_speed
+        items, target_owners, metres = items[keep], target_owners[keep], metres[keep]
+        leave = station_secs[stations[owners[items]]]
+        secs = leave + metres / walking_speed
+        target_secs = np.full(len(targets), inf)
+        np.minimum.at(target_secs, target_owners, secs)
+        # the station leaving times of the best walks, the earliest one for the ties
+        best = secs == target_secs[target_owners]
+        init_secs = np.full(len(targets), inf)
+        np.minimum.at(init_secs, target_owners[best], leave[best])
+        return target_secs, init_secs
+
+    def to_artefacts(self) -> Dict[str, np.ndarray]:
+        return {REACH_ARTEFACT_PREFIX + name: getattr(self, name) for name in REACH_ARTEFACT_NAMES}
+
+    @classmethod
+    def from_graph(cls, g: CompiledGraph) -> Optional['StationReach']:
+        """
+        The reach stored in the artefacts of g, None when it has none
+        """
+        if REACH_ARTEFACT_PREFIX + REACH_ARTEFACT_NAMES[0] not in g.artefacts:
+            return None
+        return cls(**{name: g.artefacts[REACH_ARTEFACT_PREFIX + name] for name in REACH_ARTEFACT_NAMES})
+
+
+def build_station_reach(g: CompiledGraph, stations: Iterable[NodeId], walking_metres: float, bike_metres: float,
+                        bike_sources: Optional[Iterable[NodeId]] = None,
+                        walk_sources: Optional[Iterable[NodeId]] = None) -> StationReach:
+    """
+    The reach of the stations (osm ids) of g, walking_metres and bike_metres from each of them. When bike_sources
+    (walk_sources) is given, only the bike (walking) rows of these stations are searched, the others are empty.
+    """
+    nodes = sorted(set(g.node_indices(stations)))
+    columns = {node: j for j, node in enumerate(nodes)}
+    offsets, targets, lengths = g.offsets.tolist(), g.targets.tolist(), np.asarray(g.lengths).tolist()
+    bike_sources = None if bike_sources is None else set(g.node_indices(bike_sources))
+    walk_sources = None if walk_sources is None else set(g.node_indices(walk_sources))
+
+    bike_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    walk_offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    bike_columns, bike_distances, walk_nodes, walk_distances = [], [], [], []
+    for i, source in enumerate(nodes):
+        if bike_sources is None or source in bike_sources:
+            reached = bounded_search(offsets, targets, lengths, source, bike_metres, columns)
+            bike_columns.extend(columns[node] for node in reached)
+            bike_distances.extend(reached.values())
+        bike_offsets[i + 1] = len(bike_columns)
+
+        if walk_sources is None or source in walk_sources:
+            reached = bounded_search(offsets, targets, lengths, source, walking_metres)
+            walk_nodes.extend(reached)
+            walk_distances.extend(reached.values())
+        walk_offsets[i + 1] = len(walk_nodes)
+
+    return StationReach(np.array(nodes, dtype=np.int32), np.array([walking_metres, bike_metres]), bike_offsets,
+                        np.array(bike_columns, dtype=np.int32), np.array(bike_distances), walk_offsets,
+                        np.array(walk_nodes, dtype=np.int32), np.array(walk_distances))
@@ -1,11 +1,14 @@
 import networkx as nx
 from algorithms.inner_types import NodeId, PointLL
+from algorithms.graph import as_compiled
+from algorithms.geo import nearest_nodes
 from typing import List, Tuple
 
 
 def project_nodes(g: nx.MultiDiGraph, locations: List[Tuple[float, float]]):
-    import osmnx
-    return set([osmnx.get_nearest_node(g, location) for location in locations])
+    # the nearest node of every (lat, lon) location, like osmnx.get_nearest_node without building a GeoDataFrame
+    graph = as_compiled(g)
+    return set([graph.to_osm(node) for node in nearest_nodes(graph, locations)])
 
 
 def osm_to_pointll(g: nx.MultiDiGraph, node_id: NodeId) -> PointLL:
@@ -0,0 +1,100 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import threading
+
+from priority_queue import make_priority_queue
+from algorithms.label_store import EdgeLabelStore, EdgeStatusStore
+
+
+@dataclass
+class SearchWorkspace(object):
+    """
+    The buffers of a search, kept from one query to the next
+
+    A search asks for its labels, edge statuses and queues by name at the beginning of every query and gets
+    them back empty: the label columns and the queue containers are refilled in place and the edge statuses
+    are reset by a generation bump, so nothing proportional to the graph is allocated after the first query.
+
+    A workspace serves one query at a time, WorkspacePool hands them out to concurrent callers.
+    """
+    _labels: Dict[str, EdgeLabelStore] = field(default_factory=dict)
+    _statuses: Dict[str, EdgeStatusStore] = field(default_factory=dict)
+    # name -> (backend, queue)
+    _queues: Dict[str, Tuple[object, object]] = field(default_factory=dict)
+    _children: Dict[str, 'SearchWorkspace'] = field(default_factory=dict)
+
+    def labels(self, name: str = '') -> EdgeLabelStore:
+        labels = self._labels.get(name)
+        if labels is None:
+            labels = self._labels[name] = EdgeLabelStore()
+        labels.clear()
+        return labels
+
+    def status(self, name: str, edge_count: int, layers: int = 1) -> EdgeStatusStore:
+        status = self._statuses.get(name)
+        # a store sized for another graph can't be reused
+        if status is None or status.edge_count != edge_count or len(status) != edge_count * layers:
+            status = self._statuses[name] = EdgeStatusStore(edge_count, layers)
+        else:
+            status.reset()
+        return status
+
+    def queue(self, name: str = '', backend='heap'):
+        """
+        backend is the one of make_priority_queue, a queue built by a callable backend must have clear()
+        """
+        cached = self._queues.get(name)
+        if cached is None or cached[0] != backend:
+            queue = make_priority_queue(backend)
+            self._queues[name] = (backend, queue)
+            return queue
+        queue = cached[1]
+        queue.clear()
+        return queue
+
+    def child(self, name: str) -> 'SearchWorkspace':
+        # the workspace of a sub search, e.g. the walking legs of MultiModalAStart
+        child = self._children.get(name)
+        if child is None:
+            child = self._children[name] = SearchWorkspace()
+        return child
+
+
+class WorkspacePool(object):
+    """
+    Hands out a SearchWorkspace per query, thread safe
+
+        with pool.workspace() as workspace:
+            route, secs = AStar(workspace=workspace).get_best_path(g, orig, dest)
+
+    At most max_idle released workspaces are kept, the others are dropped.
+    """
+
+    def __init__(self, max_idle: int = 16):
+        self._max_idle = max_idle
+        self._idle: List[SearchWorkspace] = []
+        self._lock = threading.Lock()
+
+    def acquire(self) -> SearchWorkspace:
+        with self._lock:
+            if self._idle:
+                # the last released one, its buffers are the most likely to be in cache
+                return self._idle.pop()
+        return SearchWorkspace()
+
+    def release(self, workspace: SearchWorkspace):
+        with self._lock:
+            if len(self._idle) < self._max_idle:
+                self._idle.append(workspace)
+
+    @contextmanager
+    def workspace(self):
+        workspace = self.acquire()
+        try:
+            yield workspace
+        finally:
+            self.release(workspace)
+
+    def __len__(self):
+        return len(self._idle)
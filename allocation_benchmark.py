@@ -0,0 +1,75 @@
+from collections import Counter
+import random
+import sys
+
+from algorithms.graph_file import load_or_convert
+from algorithms.astar import AStar
+from algorithms.double_astar import DoubleAstar
+from algorithms.isochrone import Isocrhone
+
+# Counts, per settled edge, the objects of python classes the searches build and the function calls they make.
+# The profile hook sees every python and builtin call, an object built shows up as the call of its __init__ and
+# a settled edge as a pop of the queue. Unlike timings, the counts don't depend on the machine.
+#
+# usage: python allocation_benchmark.py [data/network.graphml] [number of queries]
+
+SEARCHES = {
+    'astar': (lambda: AStar(),
+              lambda s, g, o, d: s.get_best_path(g, o, d)),
+    'double astar': (lambda: DoubleAstar(),
+                     lambda s, g, o, d: s.get_best_path(g, o, d)),
+    'isochrone': (lambda: Isocrhone(),
+                  lambda s, g, o, d: s.get_isochrone(g, o, {d}, limit=900)),
+}
+
+
+class CallCounter(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.settled = 0
+        self.objects = Counter()
+
+    def __call__(self, frame, event, arg):
+        if event == 'call':
+            self.calls += 1
+            code = frame.f_code
+            if code.co_name == '__init__':
+                self.objects[type(frame.f_locals.get('self')).__name__] += 1
+            elif code.co_name == 'pop' and code.co_filename.endswith('priority_queue.py'):
+                self.settled += 1
+        elif event == 'c_call':
+            self.calls += 1
+
+
+def count(g, queries, make, run) -> CallCounter:
+    counter = CallCounter()
+    for orig, dest in queries:
+        # the search objects are built outside of the count, only the queries are measured
+        search = make()
+        sys.setprofile(counter)
+        try:
+            run(search, g, orig, dest)
+        finally:
+            sys.setprofile(None)
+    return counter
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    queries = [(rnd.choice(osm_ids), rnd.choice(osm_ids)) for _ in range(query_count)]
+
+    print('{:>14} {:>10} {:>16} {:>16}  {}'.format('search', 'settled', 'objects/settled', 'calls/settled',
+                                                   'objects built'))
+    for name, (make, run) in SEARCHES.items():
+        counter = count(graph, queries, make, run)
+        settled = max(counter.settled, 1)
+        print('{:>14} {:>10} {:>16.2f} {:>16.1f}  {}'.format(name, counter.settled,
+                                                             sum(counter.objects.values()) / settled,
+                                                             counter.calls / settled,
+                                                             dict(counter.objects.most_common(4))))
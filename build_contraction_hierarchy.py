@@ -0,0 +1,24 @@
+import sys
+import time
+
+from algorithms.graph_file import load_or_convert, default_graph_path, save_artefact
+from algorithms.contraction import build_contraction_hierarchy
+
+# Contract the binary graph and store the hierarchy next to it, ContractionHierarchyQuery then loads it with
+# the graph. Run it again whenever the graph is converted again.
+#
+# usage: python build_contraction_hierarchy.py [data/network.graphml]
+
+source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+
+graph = load_or_convert(source)
+
+start = time.time()
+hierarchy = build_contraction_hierarchy(graph)
+print('contracted {} nodes in {:.2f}s, {} shortcuts for {} arcs, {:.2f} MB'.format(
+    graph.node_count, time.time() - start, hierarchy.shortcut_count, graph.edge_count, hierarchy.nbytes / 1e6))
+
+path = default_graph_path(source)
+for name, array in hierarchy.to_artefacts().items():
+    save_artefact(path, name, array)
+print('saved to {}'.format(path))
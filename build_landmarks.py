@@ -0,0 +1,27 @@
+import sys
+import time
+
+from algorithms.graph_file import load_or_convert, default_graph_path, save_artefact
+from algorithms.landmarks import build_landmarks
+
+# Pick the ALT landmarks of a graph and store their distance arrays next to the binary graph.
+# The searches then take landmarks=Landmarks.from_graph(graph) for an exact and much tighter heuristic than
+# the great circle distance, on a symmetric graph: they ignore them on the other ones. Run it again whenever the
+# graph is converted again.
+#
+# usage: python build_landmarks.py [data/network.graphml] [number of landmarks] [farthest|avoid]
+
+source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+count = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+strategy = sys.argv[3] if len(sys.argv) > 3 else 'avoid'
+
+graph = load_or_convert(source)
+
+start = time.time()
+landmarks = build_landmarks(graph, count, strategy)
+print('picked {} landmarks ({}) in {:.2f}s'.format(len(landmarks), strategy, time.time() - start))
+
+path = default_graph_path(source)
+for name, array in landmarks.to_artefacts().items():
+    save_artefact(path, name, array)
+print('saved {} to {}'.format(sorted(landmarks.to_artefacts()), path))
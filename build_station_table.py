@@ -0,0 +1,55 @@
+import sys
+import time
+
+import numpy as np
+
+from algorithms.graph_file import load_or_convert, default_graph_path, save_artefact
+from algorithms.station_bounds import build_station_bounds
+from algorithms.station_table import build_station_table, build_station_reach
+from algorithms.multimodal_isochrone import WALKING_SPEED, BIKE_SPEED
+from algorithms.utils import project_nodes
+from bss_locations_example import bss_locations
+
+# The bike legs between every pair of stations of bss_locations_example.py, stored next to the binary graph.
+# MultiModalAStart then takes them from the table instead of running a bike search per query, as long as all the
+# stations it reaches are in it. Run it again whenever the graph is converted again or the stations change.
+#
+# The reach of every station is stored too, the other stations within the bike limit and the nodes within the
+# walking limit: MultiModalIsochrone merges them instead of its bike and last walking searches, for limits up to
+# these ones. And the walk from every node to its nearest station, the lower bound of the multimodal double
+# expansion searches.
+#
+# usage: python build_station_table.py [data/network.graphml] [walking limit (s)] [bike limit (s)]
+
+source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+walking_limit = float(sys.argv[2]) if len(sys.argv) > 2 else 900
+bike_limit = float(sys.argv[3]) if len(sys.argv) > 3 else 1800
+
+graph = load_or_convert(source)
+stations = project_nodes(graph, bss_locations)
+
+start = time.time()
+table = build_station_table(graph, stations)
+reached = np.isfinite(table.metres)
+# the nodes of all the paths if they were stored one by one
+path_nodes = sum(len(table.path(i, j)) for i, j in zip(*np.nonzero(reached)))
+print('{} stations, {} pairs in {:.2f}s, {} tree nodes for {} path nodes, {:.2f} MB'.format(
+    len(table), int(reached.sum()), time.time() - start, len(table.tree_nodes), path_nodes,
+    sum(array.nbytes for array in table.to_artefacts().values()) / 1e6))
+
+start = time.time()
+reach = build_station_reach(graph, stations, walking_limit * WALKING_SPEED, bike_limit * BIKE_SPEED)
+print('reach of {} stations in {:.2f}s, {} stations by bike and {} nodes walking, {:.2f} MB'.format(
+    len(reach), time.time() - start, len(reach.bike_columns), len(reach.walk_nodes),
+    sum(array.nbytes for array in reach.to_artefacts().values()) / 1e6))
+
+start = time.time()
+bounds = build_station_bounds(graph, stations)
+print('walks to the nearest station in {:.2f}s, {:.0f} m at most, length factor {:.3f}'.format(
+    time.time() - start, bounds.to_station[np.isfinite(bounds.to_station)].max(), bounds.length_factor[0]))
+
+path = default_graph_path(source)
+artefacts = dict(table.to_artefacts(), **reach.to_artefacts(), **bounds.to_artefacts())
+for name, array in artefacts.items():
+    save_artefact(path, name, array)
+print('saved to {}'.format(path))
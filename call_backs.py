@@ -1,17 +1,24 @@
 import osmnx
 
+from algorithms.graph import as_compiled
+from algorithms.label_store import PERMANENT, TEMPORARY
+
+# The searches work on the dense node indices of algorithms.graph.CompiledGraph, i.e. the position of the node
+# in g.nodes(), the call backs map them back to the networkx graph for drawing.
+# The edge labels are algorithms.label_store.EdgeLabelStore, read column by column, and the edge status
+# algorithms.label_store.EdgeStatusStore, which lists the labels of the reached edges.
+
 
 def astar_call_back(g, origin, dest, edge_status, edge_labels, i):
     perm_nodes = set()
     temp_nodes = set()
-    for _, status in edge_status.items():
-        if status.is_permanent():
-            perm_nodes.add(edge_labels[status.edge_label_index].end_node)
-        elif status.is_temporary():
-            temp_nodes.add(edge_labels[status.edge_label_index].end_node)
+    for idx in edge_status.labels(PERMANENT):
+        perm_nodes.add(edge_labels.end_node[idx])
+    for idx in edge_status.labels(TEMPORARY):
+        temp_nodes.add(edge_labels.end_node[idx])
 
     nc = []
-    for node in g.nodes():
+    for node in range(len(g)):
         if node in (origin, dest):
             nc.append('#c942ff')
         elif node in perm_nodes:
@@ -22,7 +29,7 @@ def astar_call_back(g, origin, dest, edge_status, edge_labels, i):
             nc.append('#f4fbff')
 
     ns = []
-    for node in g.nodes():
+    for node in range(len(g)):
         if node in (origin, dest):
             ns.append(20)
         elif node in perm_nodes or node in temp_nodes:
@@ -39,20 +46,18 @@ def double_astar_call_back(g, origin, dest, edge_status_f, edge_labels_f, edge_s
     perm_nodes = set()
     temp_nodes = set()
 
-    for _, status in edge_status_f.items():
-        if status.is_permanent():
-            perm_nodes.add(edge_labels_f[status.edge_label_index].end_node)
-        elif status.is_temporary():
-            temp_nodes.add(edge_labels_f[status.edge_label_index].end_node)
+    for idx in edge_status_f.labels(PERMANENT):
+        perm_nodes.add(edge_labels_f.end_node[idx])
+    for idx in edge_status_f.labels(TEMPORARY):
+        temp_nodes.add(edge_labels_f.end_node[idx])
 
-    for _, status in edge_status_b.items():
-        if status.is_permanent():
-            perm_nodes.add(edge_labels_b[status.edge_label_index].end_node)
-        elif status.is_temporary():
-            temp_nodes.add(edge_labels_b[status.edge_label_index].end_node)
+    for idx in edge_status_b.labels(PERMANENT):
+        perm_nodes.add(edge_labels_b.end_node[idx])
+    for idx in edge_status_b.labels(TEMPORARY):
+        temp_nodes.add(edge_labels_b.end_node[idx])
 
     nc = []
-    for node in g.nodes():
+    for node in range(len(g)):
         if node in (origin, dest):
             nc.append('#c942ff')
         elif node in perm_nodes:
@@ -63,7 +68,7 @@ def double_astar_call_back(g, origin, dest, edge_status_f, edge_labels_f, edge_s
             nc.append('#f4fbff')
 
     ns = []
-    for node in g.nodes():
+    for node in range(len(g)):
         if node in (origin, dest):
             ns.append(20)
         elif node in perm_nodes or node in temp_nodes:
@@ -86,9 +91,10 @@ def double_expansion_call_back(g, origin, dest, bss,
                                edge_labels_b_b,
                                i,
                                prefix='double_expansion'):
+    graph = as_compiled(g)
     # bbox = [north, south, east, west]
-    o_lat, o_lon = g.nodes[origin]['y'], g.nodes[origin]['x']
-    d_lat, d_lon = g.nodes[dest]['y'], g.nodes[dest]['x']
+    o_lat, o_lon = graph.lats[origin], graph.lons[origin]
+    d_lat, d_lon = graph.lats[dest], graph.lons[dest]
     lat_diff = abs(o_lat - d_lat)
     lon_diff = abs(o_lon - d_lon)
 
@@ -116,36 +122,36 @@ def double_expansion_call_back(g, origin, dest, bss,
                c='#c942ff', alpha=1, edgecolor='none', zorder=6)
 
     w_nodes = set()
-    for _, status in edge_status_w_f.items():
-        node = edge_labels_w_f[status.edge_label_index].end_node
+    for idx in edge_status_w_f.reached_labels():
+        node = edge_labels_w_f.end_node[idx]
         w_nodes.add(node)
-    for _, status in edge_status_w_b.items():
-        node = edge_labels_w_b[status.edge_label_index].end_node
+    for idx in edge_status_w_b.reached_labels():
+        node = edge_labels_w_b.end_node[idx]
         w_nodes.add(node)
 
     w_lats = []
     w_lons = []
 
     for node in w_nodes:
-        w_lats.append(g.nodes[node]['y'])
-        w_lons.append(g.nodes[node]['x'])
+        w_lats.append(graph.lats[node])
+        w_lons.append(graph.lons[node])
 
     ax.scatter(w_lons, w_lats, s=7, c='#ff1b00', alpha=0.5, edgecolor='none', zorder=3)
 
     b_nodes = set()
-    for _, status in edge_status_b_f.items():
-        node = edge_labels_b_f[status.edge_label_index].end_node
+    for idx in edge_status_b_f.reached_labels():
+        node = edge_labels_b_f.end_node[idx]
         b_nodes.add(node)
-    for _, status in edge_status_b_b.items():
-        node = edge_labels_b_b[status.edge_label_index].end_node
+    for idx in edge_status_b_b.reached_labels():
+        node = edge_labels_b_b.end_node[idx]
         b_nodes.add(node)
 
     b_lats = []
     b_lons = []
 
     for node in b_nodes:
-        b_lats.append(g.nodes[node]['y'])
-        b_lons.append(g.nodes[node]['x'])
+        b_lats.append(graph.lats[node])
+        b_lons.append(graph.lons[node])
 
     ax.scatter(b_lons, b_lats, s=5, c='#42ff00', alpha=0.5, edgecolor='none', zorder=4)
 
@@ -153,8 +159,8 @@ def double_expansion_call_back(g, origin, dest, bss,
     bss_lons = []
 
     for node in bss:
-        bss_lats.append(g.nodes[node]['y'])
-        bss_lons.append(g.nodes[node]['x'])
+        bss_lats.append(graph.lats[node])
+        bss_lons.append(graph.lons[node])
 
     ax.scatter(bss_lons, bss_lats, s=10, c='#0046ff', alpha=1, edgecolor='none', zorder=5)
 
@@ -172,8 +178,9 @@ def double_expansion_isochrone_callback(g, origin, dest_nodes, bss,
                                         edges_status_walking, edge_labels_walking,
                                         edges_status_bike, edge_labels_bike,
                                         i, prefix="double_expansion_isochrone"):
+    graph = as_compiled(g)
 
-    o_lat, o_lon = g.nodes[origin]['y'], g.nodes[origin]['x']
+    o_lat, o_lon = graph.lats[origin], graph.lons[origin]
 
     # bbox = [north, south, east, west]
     bbox = (o_lat + 0.042, o_lat - 0.042, o_lon + 0.06, o_lon - 0.06)
@@ -189,41 +196,41 @@ def double_expansion_isochrone_callback(g, origin, dest_nodes, bss,
 
     ax.scatter((o_lon), (o_lat), s=50, c='#c942ff', alpha=1, edgecolor='none', zorder=6)
 
-    walking_first_nodes = set([edge_labels_walking[status.edge_label_index].end_node
-                               for _, status in edges_status_walking.items()
-                               if edge_labels_walking[status.edge_label_index].can_change_mode])
+    walking_first_nodes = set([edge_labels_walking.end_node[idx]
+                               for idx in edges_status_walking.reached_labels()
+                               if edge_labels_walking.can_change_mode(idx)])
 
     walking_first_lats = []
     walking_first_lons = []
 
     for node in walking_first_nodes:
-        walking_first_lats.append(g.nodes[node]['y'])
-        walking_first_lons.append(g.nodes[node]['x'])
+        walking_first_lats.append(graph.lats[node])
+        walking_first_lons.append(graph.lons[node])
 
     ax.scatter(walking_first_lons, walking_first_lats, s=7, c='#ff1b00', alpha=0.3, edgecolor='none', zorder=3)
 
-    walking_second_nodes = set([edge_labels_walking[status.edge_label_index].end_node
-                               for _, status in edges_status_walking.items()
-                               if not edge_labels_walking[status.edge_label_index].can_change_mode])
+    walking_second_nodes = set([edge_labels_walking.end_node[idx]
+                               for idx in edges_status_walking.reached_labels()
+                               if not edge_labels_walking.can_change_mode(idx)])
 
     walking_second_lats = []
     walking_second_lons = []
 
     for node in walking_second_nodes:
-        walking_second_lats.append(g.nodes[node]['y'])
-        walking_second_lons.append(g.nodes[node]['x'])
+        walking_second_lats.append(graph.lats[node])
+        walking_second_lons.append(graph.lons[node])
 
     ax.scatter(walking_second_lons, walking_second_lats, s=5, c='#22ff36', alpha=0.7, edgecolor='none', zorder=5)
 
-    bike_nodes = set([edge_labels_bike[status.edge_label_index].end_node
-                      for _, status in edges_status_bike.items()])
+    bike_nodes = set([edge_labels_bike.end_node[idx]
+                      for idx in edges_status_bike.reached_labels()])
 
     bike_lats = []
     bike_lons = []
 
     for node in bike_nodes:
-        bike_lats.append(g.nodes[node]['y'])
-        bike_lons.append(g.nodes[node]['x'])
+        bike_lats.append(graph.lats[node])
+        bike_lons.append(graph.lons[node])
 
     ax.scatter(bike_lons, bike_lats, s=6, c='#cb6aff', alpha=0.2, edgecolor='none', zorder=4)
 
@@ -231,8 +238,8 @@ def double_expansion_isochrone_callback(g, origin, dest_nodes, bss,
     bss_lons = []
 
     for node in bss:
-        bss_lats.append(g.nodes[node]['y'])
-        bss_lons.append(g.nodes[node]['x'])
+        bss_lats.append(graph.lats[node])
+        bss_lons.append(graph.lons[node])
 
     ax.scatter(bss_lons, bss_lats, s=8, c='#0046ff', alpha=1, edgecolor='none', zorder=6)
 
@@ -249,9 +256,10 @@ def double_expansion_one_queue_callback(g,
                                         origin, dest, bss,
                                         edge_status, edge_labels,
                                         i, prefix="double_expansion_one_queue"):
+    graph = as_compiled(g)
     # bbox = [north, south, east, west]
-    o_lat, o_lon = g.nodes[origin]['y'], g.nodes[origin]['x']
-    d_lat, d_lon = g.nodes[dest]['y'], g.nodes[dest]['x']
+    o_lat, o_lon = graph.lats[origin], graph.lons[origin]
+    d_lat, d_lon = graph.lats[dest], graph.lons[dest]
     lat_diff = abs(o_lat - d_lat)
     lon_diff = abs(o_lon - d_lon)
 
@@ -281,34 +289,34 @@ def double_expansion_one_queue_callback(g,
     bss_lons = []
 
     for node in bss:
-        bss_lats.append(g.nodes[node]['y'])
-        bss_lons.append(g.nodes[node]['x'])
+        bss_lats.append(graph.lats[node])
+        bss_lons.append(graph.lons[node])
 
     ax.scatter(bss_lons, bss_lats, s=8, c='#0046ff', alpha=1, edgecolor='none', zorder=6)
 
-    walking_nodes = set([edge_labels[status.edge_label_index].end_node
-                         for _, status in edge_status.items()
-                         if edge_labels[status.edge_label_index].edge_id.mode.value == 0])
+    walking_nodes = set([edge_labels.end_node[idx]
+                         for idx in edge_status.reached_labels()
+                         if edge_labels.mode[idx] == 0])
 
     walking_lats = []
     walking_lons = []
 
     for node in walking_nodes:
-        walking_lats.append(g.nodes[node]['y'])
-        walking_lons.append(g.nodes[node]['x'])
+        walking_lats.append(graph.lats[node])
+        walking_lons.append(graph.lons[node])
 
     ax.scatter(walking_lons, walking_lats, s=7, c='#ff1b00', alpha=0.4, edgecolor='none', zorder=3)
 
-    bike_nodes = set([edge_labels[status.edge_label_index].end_node
-                      for _, status in edge_status.items()
-                      if edge_labels[status.edge_label_index].edge_id.mode.value == 1])
+    bike_nodes = set([edge_labels.end_node[idx]
+                      for idx in edge_status.reached_labels()
+                      if edge_labels.mode[idx] == 1])
 
     bike_lats = []
     bike_lons = []
 
     for node in bike_nodes:
-        bike_lats.append(g.nodes[node]['y'])
-        bike_lons.append(g.nodes[node]['x'])
+        bike_lats.append(graph.lats[node])
+        bike_lons.append(graph.lons[node])
 
     ax.scatter(bike_lons, bike_lats, s=6, c='#22ff36', alpha=0.4, edgecolor='none', zorder=4)
 
@@ -316,8 +324,8 @@ def double_expansion_one_queue_callback(g,
     bss_lons = []
 
     for node in bss:
-        bss_lats.append(g.nodes[node]['y'])
-        bss_lons.append(g.nodes[node]['x'])
+        bss_lats.append(graph.lats[node])
+        bss_lons.append(graph.lons[node])
 
     ax.scatter(bss_lons, bss_lats, s=8, c='#0046ff', alpha=1, edgecolor='none', zorder=6)
 
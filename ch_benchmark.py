@@ -0,0 +1,67 @@
+import random
+import sys
+import time
+
+from algorithms.graph_file import load_or_convert
+from algorithms.contraction import ContractionHierarchy, build_contraction_hierarchy
+from algorithms.ch_query import ContractionHierarchyQuery
+from algorithms.double_astar import DoubleAstar
+from algorithms.isochrone import Isocrhone
+from algorithms.phast import PhastIsochrone
+
+# The contraction hierarchy against DoubleAstar: what the preprocessing costs (time and artefact size, next to
+# the size of the graph itself) and what it buys on the query latency of random queries.
+# Then the isochrones of the same origins to 1000 random targets, by Isocrhone and by the PHAST sweeps, without
+# and with a limit.
+# The hierarchy stored with the graph by build_contraction_hierarchy.py is used when there is one, its build
+# time is then not measured.
+#
+# usage: python ch_benchmark.py [data/network.graphml] [number of queries]
+
+
+def latency(g, queries, run) -> float:
+    start = time.perf_counter()
+    for orig, dest in queries:
+        run(g, orig, dest)
+    return (time.perf_counter() - start) / len(queries)
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+
+    graph = load_or_convert(source)
+    graph_bytes = sum(a.nbytes for a in (graph.offsets, graph.targets, graph.lengths, graph.arc_edges,
+                                         graph.lats, graph.lons, graph.osm_ids))
+
+    hierarchy = ContractionHierarchy.from_graph(graph)
+    if hierarchy is None:
+        start = time.time()
+        hierarchy = build_contraction_hierarchy(graph)
+        print('preprocessing: {:.2f}s'.format(time.time() - start))
+    print('artefact: {} shortcuts for {} arcs, {:.2f} MB for a graph of {:.2f} MB'.format(
+        hierarchy.shortcut_count, graph.edge_count, hierarchy.nbytes / 1e6, graph_bytes / 1e6))
+
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    queries = [(rnd.choice(osm_ids), rnd.choice(osm_ids)) for _ in range(query_count)]
+
+    print('{:>14} {:>16}'.format('search', 'ms/query'))
+    for name, search in (('double astar', DoubleAstar()),
+                         ('ch', ContractionHierarchyQuery(hierarchy=hierarchy))):
+        print('{:>14} {:>16.3f}'.format(name, latency(graph, queries, search.get_best_path) * 1e3))
+
+    targets = rnd.sample(osm_ids, min(1000, len(osm_ids)))
+    target_set = set(targets)
+    phast = PhastIsochrone(hierarchy=hierarchy)
+    # the sweeps are built by the first query, they're kept for the next origins
+    phast.get_seconds(graph, queries[0][0])
+    phast.get_seconds(graph, queries[0][0], targets)
+
+    print('{:>14} {:>16}'.format('isochrone', 'ms/origin'))
+    for name, run in (('dijkstra', lambda g, o, d: Isocrhone().get_isochrone(g, o, target_set, limit=float('inf'))),
+                      ('phast', lambda g, o, d: phast.get_seconds(g, o)),
+                      ('rphast', lambda g, o, d: phast.get_seconds(g, o, targets)),
+                      ('dijkstra 900s', lambda g, o, d: Isocrhone().get_isochrone(g, o, target_set, limit=900)),
+                      ('rphast 900s', lambda g, o, d: phast.get_isochrone(g, o, target_set, limit=900))):
+        print('{:>14} {:>16.3f}'.format(name, latency(graph, queries, run) * 1e3))
@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+import random
+import sys
+import threading
+
+from algorithms.graph_file import load_or_convert
+from algorithms.astar import AStar
+from algorithms.double_astar import DoubleAstar
+from algorithms.isochrone import Isocrhone
+from algorithms.multimodal_astar import MultiModalAStart
+from algorithms.multimodal_isochrone import MultiModalIsochrone
+from algorithms.multimodal_double_expansion_astart import MultiModalDoubleExpansionAStar
+from algorithms.multimodal_double_expansion_astart_one_queue import MultiModalDoubleExpansionAStarOneQueue
+from algorithms.multimodal_double_expansions_isochrone import MultiModalDoubleExpansionIsochrone
+from algorithms.contraction import ContractionHierarchy
+from algorithms.ch_query import ContractionHierarchyQuery
+from algorithms.phast import PhastIsochrone
+
+# Runs the same queries serially, with a new search object per query, then from a thread pool where every thread
+# reuses its own search objects, and checks that the results are the same. A search keeping state on its class, or
+# from one query to the next, gives different results. A query raising is an error, serial or not: the exceptions
+# aren't compared.
+#
+# usage: python concurrency_stress.py [data/network.graphml] [number of queries] [number of threads]
+
+SEARCHES = {
+    'astar': (lambda bss: AStar(),
+              lambda s, g, o, d, bss: s.get_best_path(g, o, d)),
+    'double astar': (lambda bss: DoubleAstar(),
+                     lambda s, g, o, d, bss: s.get_best_path(g, o, d)),
+    'isochrone': (lambda bss: Isocrhone(),
+                  lambda s, g, o, d, bss: s.get_isochrone(g, o, bss | {d}, limit=900)),
+    'multimodal astar': (lambda bss: MultiModalAStart(),
+                         lambda s, g, o, d, bss: s.get_best_path(g, o, d, bss)),
+    'multimodal isochrone': (lambda bss: MultiModalIsochrone(bss),
+                             lambda s, g, o, d, bss: s.get_isochrone(g, o, {d})),
+    'double expansion': (lambda bss: MultiModalDoubleExpansionAStar(),
+                         lambda s, g, o, d, bss: s.get_best_path(g, o, d, bss)),
+    'double expansion one queue': (lambda bss: MultiModalDoubleExpansionAStarOneQueue(),
+                                   lambda s, g, o, d, bss: s.get_best_path(g, o, d, bss)),
+    'double expansion isochrone': (lambda bss: MultiModalDoubleExpansionIsochrone(),
+                                   lambda s, g, o, d, bss: s.get_isochrone(g, o, {d}, bss)),
+}
+
+CH_SEARCHES = {
+    'ch': (lambda bss: ContractionHierarchyQuery(),
+           lambda s, g, o, d, bss: s.get_best_path(g, o, d)),
+    'phast': (lambda bss: PhastIsochrone(),
+              lambda s, g, o, d, bss: s.get_isochrone(g, o, bss | {d}, limit=900)),
+}
+
+
+def run_query(search, run, g, orig, dest, bss_nodes):
+    try:
+        return run(search, g, orig, dest, bss_nodes)
+    except Exception as e:
+        return e
+
+
+def serial(g, queries, bss_nodes, make, run) -> list:
+    return [run_query(make(bss_nodes), run, g, orig, dest, bss_nodes) for orig, dest in queries]
+
+
+def concurrent(g, queries, bss_nodes, make, run, thread_count: int) -> list:
+    local = threading.local()
+
+    def query(orig_dest):
+        # one search object per thread, reused by all its queries
+        if not hasattr(local, 'search'):
+            local.search = make(bss_nodes)
+        return run_query(local.search, run, g, *orig_dest, bss_nodes)
+
+    with ThreadPoolExecutor(max_workers=thread_count) as executor:
+        return list(executor.map(query, queries))
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    thread_count = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+
+    # switch threads often, the searches interleave at many more points
+    sys.setswitchinterval(1e-5)
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    queries = [(rnd.choice(osm_ids), rnd.choice(osm_ids)) for _ in range(query_count)]
+    bss_nodes = set(rnd.sample(osm_ids, min(len(osm_ids), 20)))
+
+    searches = dict(SEARCHES)
+    # the hierarchy is built beforehand, build_contraction_hierarchy.py
+    if ContractionHierarchy.from_graph(graph) is not None:
+        searches.update(CH_SEARCHES)
+
+    failed = False
+    print('{:>28} {:>10} {:>10} {:>10}'.format('search', 'queries', 'mismatches', 'errors'))
+    for name, (make, run) in searches.items():
+        expected = serial(graph, queries, bss_nodes, make, run)
+        got = concurrent(graph, queries, bss_nodes, make, run, thread_count)
+        errors = sum(isinstance(a, Exception) or isinstance(b, Exception) for a, b in zip(expected, got))
+        mismatches = sum(not isinstance(a, Exception) and not isinstance(b, Exception) and a != b
+                         for a, b in zip(expected, got))
+        failed |= mismatches > 0 or errors > 0
+        print('{:>28} {:>10} {:>10} {:>10}'.format(name, len(queries), mismatches, errors))
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,21 @@
+import sys
+import time
+
+from algorithms.graph_file import convert_graphml, load_graph
+
+# Convert the graphml downloaded by osmnx_quick_start.py into the binary graph format.
+# The algorithms can then run on algorithms.graph_file.load_or_convert('data/network.graphml'), which
+# memory maps the arrays and rebuilds them whenever the graphml changes.
+#
+# usage: python convert_graphml.py [data/network.graphml] [output directory]
+
+source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+path = sys.argv[2] if len(sys.argv) > 2 else None
+
+start = time.time()
+path = convert_graphml(source, path)
+print('converted {} to {} in {:.2f}s'.format(source, path, time.time() - start))
+
+start = time.time()
+graph = load_graph(path)
+print('loaded {} nodes and {} edges in {:.4f}s'.format(graph.node_count, graph.edge_count, time.time() - start))
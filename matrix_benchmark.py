@@ -0,0 +1,44 @@
+import random
+import sys
+import time
+
+from algorithms.graph_file import load_or_convert
+from algorithms.astar import AStar
+from algorithms.contraction import ContractionHierarchy
+from algorithms.matrix import dijkstra_matrix, bucket_matrix
+
+# A sources x targets duration matrix by one AStar per pair, by one Dijkstra per source and, when
+# build_contraction_hierarchy.py has been run on the graph, by the buckets of the hierarchy.
+# The pairs are timed on a sample, the AStar would take too long on the whole matrix.
+#
+# usage: python matrix_benchmark.py [data/network.graphml] [number of sources] [number of targets]
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    source_count = int(sys.argv[2]) if len(sys.argv) > 2 else 100
+    target_count = int(sys.argv[3]) if len(sys.argv) > 3 else 100
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    sources = rnd.sample(osm_ids, source_count)
+    targets = rnd.sample(osm_ids, target_count)
+
+    pairs = [(orig, dest) for orig in sources[:5] for dest in targets[:20] if orig != dest]
+    search = AStar()
+    start = time.perf_counter()
+    for orig, dest in pairs:
+        search.get_best_path(graph, orig, dest)
+    per_pair = (time.perf_counter() - start) / len(pairs)
+    print('{:>12} {:>10.2f}s (estimated from {} pairs)'.format('astar', per_pair * source_count * target_count,
+                                                             len(pairs)))
+
+    source_indices, target_indices = graph.node_indices(sources), graph.node_indices(targets)
+    hierarchy = ContractionHierarchy.from_graph(graph)
+    runs = [('dijkstra', lambda: dijkstra_matrix(graph, source_indices, target_indices, float('inf')))]
+    if hierarchy is not None:
+        runs.append(('buckets', lambda: bucket_matrix(hierarchy, source_indices, target_indices, float('inf'))))
+    for name, run in runs:
+        start = time.perf_counter()
+        run()
+        print('{:>12} {:>10.2f}s'.format(name, time.perf_counter() - start))
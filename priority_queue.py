@@ -1,5 +1,5 @@
 from dataclasses import dataclass, field
-from typing import List, Dict
+from typing import List, Dict, Set
 import bisect
 import numpy as np
 
@@ -11,10 +11,16 @@ class _Element(object):
 
 
 @dataclass
-class PriorityQueue(object):
+class SortedArrayPriorityQueue(object):
+    """
+    The original queue: a sorted, preallocated numpy array of _Element.
+
+    Every insert and pop shifts up to _data_size elements, kept only as a reference for
+    priority_queue_benchmark.py
+    """
     QUEUE_MAX_SIZE = 10000
 
-    _data: List = field(default_factory=lambda: np.array([_Element(np.iinfo(np.int32).max, None)] * PriorityQueue.QUEUE_MAX_SIZE, dtype=object))
+    _data: List = field(default_factory=lambda: np.array([_Element(np.iinfo(np.int32).max, None)] * SortedArrayPriorityQueue.QUEUE_MAX_SIZE, dtype=object))
     _items_key: Dict = field(default_factory=dict)
     _data_size: int = 0
 
@@ -72,6 +78,10 @@ class PriorityQueue(object):
             self._items_key[item] = new_key
             self._data_size += 1
 
+    def clear(self):
+        self._items_key.clear()
+        self._data_size = 0
+
     def __repr__(self):
         return str(self._data[0:self._data_size])
 
@@ -88,6 +98,240 @@ class PriorityQueue(object):
         return bool(len(self))
 
 
+
+@dataclass
+class PriorityQueue(object):
+    """
+    Indexed d-ary min-heap
+
+    _positions maps every item to its slot in the heap, so that inserting an item which is already
+    in the queue (decrease-key, or increase-key) only sifts it in O(log n) instead of shifting the whole array.
+    """
+    ARITY = 4
+
+    _keys: List[float] = field(default_factory=list)
+    _items: List = field(default_factory=list)
+    _positions: Dict = field(default_factory=dict)
+
+    def pop(self):
+        keys = self._keys
+        if not keys:
+            return None, None
+
+        items = self._items
+        key, item = keys[0], items[0]
+        del self._positions[item]
+
+        last_key = keys.pop()
+        last_item = items.pop()
+        if keys:
+            self._sift_down(0, last_key, last_item)
+        return key, item
+
+    def peak(self):
+        if self._keys:
+            return self._keys[0], self._items[0]
+        return None, None
+
+    def insert(self, new_key, item):
+        pos = self._positions.get(item)
+
+        if pos is None:
+            self._keys.append(new_key)
+            self._items.append(item)
+            self._sift_up(len(self._keys) - 1, new_key, item)
+            return
+
+        old_key = self._keys[pos]
+        if new_key < old_key:
+            self._sift_up(pos, new_key, item)
+        elif new_key > old_key:
+            self._sift_down(pos, new_key, item)
+
+    def _sift_up(self, pos, key, item):
+        keys, items, positions = self._keys, self._items, self._positions
+        arity = self.ARITY
+        while pos > 0:
+            parent = (pos - 1) // arity
+            parent_key = keys[parent]
+            if parent_key <= key:
+                break
+            keys[pos] = parent_key
+            items[pos] = items[parent]
+            positions[items[pos]] = pos
+            pos = parent
+        keys[pos] = key
+        items[pos] = item
+        positions[item] = pos
+
+    def _sift_down(self, pos, key, item):
+        keys, items, positions = self._keys, self._items, self._positions
+        arity = self.ARITY
+        size = len(keys)
+        while True:
+            first = pos * arity + 1
+            if first >= size:
+                break
+            # find the smallest child
+            child = first
+            child_key = keys[first]
+            for c in range(first + 1, min(first + arity, size)):
+                if keys[c] < child_key:
+                    child = c
+                    child_key = keys[c]
+            if key <= child_key:
+                break
+            keys[pos] = child_key
+            items[pos] = items[child]
+            positions[items[pos]] = pos
+            pos = child
+        keys[pos] = key
+        items[pos] = item
+        positions[item] = pos
+
+    def clear(self):
+        self._keys.clear()
+        self._items.clear()
+        self._positions.clear()
+
+    def __repr__(self):
+        return str(sorted(zip(self._keys, self._items), key=lambda e: e[0]))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __bool__(self):
+        return bool(self._keys)
+
+
+
+@dataclass
+class DoubleBucketQueue(object):
+    """
+    Monotone double-bucket queue, heavily inspired by valhalla's DoubleBucketQueue
+
+    Keys are scaled to integers with `resolution` (e.g. 0.1 metre) and every low level bucket holds exactly
+    one scaled key, so that items come out in the exact order of their scaled keys. Keys beyond the low level
+    range are kept in an overflow bucket, which is used to rebase the low level once it's drained.
+
+    As the costs of a search only grow, a key lower than the current bucket is put in the current bucket.
+    """
+    resolution: float = 0.1
+    bucket_count: int = 10000
+
+    _buckets: List[List] = field(default=None)
+    _overflow: Set = field(default_factory=set)
+    _keys: Dict = field(default_factory=dict)
+    _base: int = 0
+    _current: int = 0
+
+    def __post_init__(self):
+        if self._buckets is None:
+            self._buckets = [[] for _ in range(self.bucket_count)]
+
+    def _scale(self, key):
+        return int(key / self.resolution)
+
+    def _bucket(self, item):
+        scaled = self._scale(self._keys[item]) - self._base
+        return max(scaled, self._current)
+
+    def pop(self):
+        if not self._keys:
+            return None, None
+        bucket = self._buckets[self._find_current()]
+        item = bucket.pop()
+        return self._keys.pop(item), item
+
+    def peak(self):
+        if not self._keys:
+            return None, None
+        # peak must not move the low level: a key between the last popped one and the next one can still come
+        for bucket in range(self._current, self.bucket_count):
+            if self._buckets[bucket]:
+                item = self._buckets[bucket][-1]
+                return self._keys[item], item
+        item = min(self._overflow, key=self._keys.get)
+        return self._keys[item], item
+
+    def insert(self, new_key, item):
+        old_key = self._keys.get(item)
+
+        if old_key is not None:
+            if self._scale(old_key) == self._scale(new_key):
+                self._keys[item] = new_key
+                return
+            # remove the item from where it was
+            bucket = self._bucket(item)
+            if bucket < self.bucket_count:
+                self._buckets[bucket].remove(item)
+            else:
+                self._overflow.remove(item)
+
+        self._keys[item] = new_key
+        bucket = self._bucket(item)
+        if bucket < self.bucket_count:
+            self._buckets[bucket].append(item)
+        else:
+            self._overflow.add(item)
+
+    def _find_current(self):
+        buckets = self._buckets
+        current = self._current
+        while True:
+            while current < self.bucket_count and not buckets[current]:
+                current += 1
+            if current < self.bucket_count:
+                self._current = current
+                return current
+            self._rebase()
+            current = 0
+
+    def _rebase(self):
+        # Move the lowest keys of the overflow into the low level buckets
+        self._base = min(self._scale(self._keys[item]) for item in self._overflow)
+        self._current = 0
+        for item in [item for item in self._overflow if self._bucket(item) < self.bucket_count]:
+            self._overflow.remove(item)
+            self._buckets[self._bucket(item)].append(item)
+
+    def clear(self):
+        # only the buckets still holding items need to be emptied, the bucket lists are kept
+        for item in self._keys:
+            bucket = self._bucket(item)
+            if bucket < self.bucket_count:
+                self._buckets[bucket].clear()
+        self._overflow.clear()
+        self._keys.clear()
+        self._base = 0
+        self._current = 0
+
+    def __repr__(self):
+        return str(sorted(((key, item) for item, key in self._keys.items()), key=lambda e: e[0]))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __bool__(self):
+        return bool(self._keys)
+
+
+QUEUE_BACKENDS = {
+    'heap': PriorityQueue,
+    'bucket': DoubleBucketQueue,
+}
+
+
+def make_priority_queue(backend='heap'):
+    """
+    backend is either a name of QUEUE_BACKENDS or a callable returning a queue,
+    e.g. functools.partial(DoubleBucketQueue, resolution=1)
+    """
+    if callable(backend):
+        return backend()
+    return QUEUE_BACKENDS[backend]()
+
+
 if __name__ == '__main__':
     q = PriorityQueue()
     r = 10
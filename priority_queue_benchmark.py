@@ -0,0 +1,53 @@
+import random
+import time
+
+import numpy as np
+
+from priority_queue import PriorityQueue, DoubleBucketQueue, SortedArrayPriorityQueue, _Element
+
+# Micro-benchmark of the queues with a search-like workload: the queue is filled with `size` live items,
+# then every round pops the min, pushes a new item and decreases the key of a random live item.
+
+SIZES = (1000, 10000, 100000)
+ROUNDS = 2000
+
+
+def make_sorted_array_queue(size):
+    capacity = size + ROUNDS + 1
+    return SortedArrayPriorityQueue(np.array([_Element(np.iinfo(np.int32).max, None)] * capacity, dtype=object))
+
+
+def run(queue, size, seed=42):
+    rnd = random.Random(seed)
+    keys = {}
+    for item in range(size):
+        keys[item] = rnd.uniform(0, 1000)
+        queue.insert(keys[item], item)
+
+    start = time.time()
+    next_item = size
+    live = list(range(size))
+    for _ in range(ROUNDS):
+        key, item = queue.pop()
+        del keys[item]
+
+        keys[next_item] = key + rnd.uniform(0, 100)
+        queue.insert(keys[next_item], next_item)
+        live.append(next_item)
+        next_item += 1
+
+        decreased = live[rnd.randrange(len(live))]
+        while decreased not in keys:
+            decreased = live[rnd.randrange(len(live))]
+        keys[decreased] = max(key, keys[decreased] - rnd.uniform(0, 50))
+        queue.insert(keys[decreased], decreased)
+    return (time.time() - start) / ROUNDS
+
+
+if __name__ == '__main__':
+    print('{:>8} {:>18} {:>18} {:>18}'.format('size', 'sorted array (us)', 'indexed heap (us)', 'double bucket (us)'))
+    for size in SIZES:
+        old = run(make_sorted_array_queue(size), size) * 1e6
+        heap = run(PriorityQueue(), size) * 1e6
+        bucket = run(DoubleBucketQueue(), size) * 1e6
+        print('{:>8} {:>18.1f} {:>18.1f} {:>18.1f}'.format(size, old, heap, bucket))
@@ -0,0 +1,265 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import json
+import os
+import sys
+
+from algorithms.graph import CompiledGraph
+from algorithms.graph_file import load_or_convert
+from algorithms.utils import project_nodes
+from algorithms.astar import AStar
+from algorithms.double_astar import DoubleAstar
+from algorithms.isochrone import Isocrhone
+from algorithms.multimodal_astar import MultiModalAStart
+from algorithms.multimodal_isochrone import MultiModalIsochrone
+from bss_locations_example import bss_locations
+
+# A resident query server: the graph is loaded once and the queries are answered by a pool of worker processes.
+#
+# The protocol is JSON lines over TCP or a unix socket, one request per line and one response per line, the
+# responses come in the order they're ready and carry the id of their request:
+#
+#   {"id": 1, "type": "astar", "orig": 123, "dest": 456}
+#   {"id": 1, "route": [123, ..., 456], "secs": 812.3}
+#   {"id": 2, "type": "isochrone", "orig": 123, "dest_nodes": [456, 789], "limit": 900}
+#   {"id": 2, "isochrone": [[456, 812.3]]}
+#
+# type is astar, double_astar, isochrone, multimodal (a route of three legs, walking, bike, walking, and their
+# seconds) or multimodal_isochrone (limit and bike_limit). The multimodal queries use the stations of
+# bss_locations_example.py, or bss_nodes when the request has them. A failed query gets {"id": .., "error": ".."}.
+#
+# The workers memory map the binary graph, its pages are shared by all of them. The requests are read into a bounded
+# queue: when it's full, the server stops reading the sockets and the clients are slowed down by TCP. A dispatcher
+# takes the queued requests by micro batches and sends the ones with the same type and origin to a worker together:
+# the routes reuse the same search objects, the isochrones of an origin are a single search to all their nodes.
+#
+# usage: python query_server.py [data/network.graphml] [127.0.0.1:8765 | unix:/tmp/ttls.sock] [number of workers]
+
+REQUEST_TYPES = ('astar', 'double_astar', 'isochrone', 'multimodal', 'multimodal_isochrone')
+# type -> the fields a request of the type can't go without
+REQUIRED_FIELDS = {'astar': ('orig', 'dest'), 'double_astar': ('orig', 'dest'), 'isochrone': ('orig', 'dest_nodes'),
+                   'multimodal': ('orig', 'dest'), 'multimodal_isochrone': ('orig', 'dest_nodes')}
+QUEUE_SIZE = 1024
+# how long the dispatcher waits for the next requests of a batch, and how many it takes at most
+BATCH_WINDOW = 0.002
+MAX_BATCH = 64
+
+# the state of a worker process, set by _init_worker
+_graph: Optional[CompiledGraph] = None
+_bss_nodes: Optional[set] = None
+_searches: Dict[str, object] = {}
+
+
+def _init_worker(source: str):
+    global _graph, _bss_nodes
+    _graph = load_or_convert(source)
+    _bss_nodes = project_nodes(_graph, bss_locations)
+    _searches.update(astar=AStar(), double_astar=DoubleAstar(), isochrone=Isocrhone(),
+                     multimodal=MultiModalAStart())
+
+
+def _is_node(value) -> bool:
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def _request_error(request: dict) -> Optional[str]:
+    # why the request can't be answered, None when it can
+    if request.get('type') not in REQUEST_TYPES:
+        return 'unknown type {}'.format(request.get('type'))
+    missing = [field for field in REQUIRED_FIELDS[request['type']] if field not in request]
+    if missing:
+        return 'missing {}'.format(', '.join(missing))
+    for field in ('orig', 'dest'):
+        if field in request and not _is_node(request[field]):
+            return '{} is an osm id'.format(field)
+    for field in ('dest_nodes', 'bss_nodes'):
+        if field in request and (not isinstance(request[field], list) or not all(map(_is_node, request[field]))):
+            return '{} is a list of osm ids'.format(field)
+    for field in ('limit', 'bike_limit'):
+        if field in request and (not isinstance(request[field], (int, float)) or isinstance(request[field], bool)):
+            return '{} is a number of seconds'.format(field)
+    return None
+
+
+def _stations(request: dict) -> set:
+    return set(request['bss_nodes']) if 'bss_nodes' in request else _bss_nodes
+
+
+def _route(request: dict) -> dict:
+    search = _searches[request['type']]
+    if request['type'] == 'multimodal':
+        res = search.get_best_path(_graph, request['orig'], request['dest'], _stations(request))
+        if not res:
+            return {'error': 'no station reachable'}
+        legs, secs = res
+        return {'route': list(legs), 'secs': list(secs)}
+    route, secs = search.get_best_path(_graph, request['orig'], request['dest'])
+    return {'route': route, 'secs': secs}
+
+
+def _isochrones(requests: List[dict]) -> List[dict]:
+    # a malformed request gets its error, the others are merged without it
+    errors = [_request_error(request) for request in requests]
+    valid = [request for request, error in zip(requests, errors) if error is None]
+    responses = iter(_merged_isochrones(valid) if valid else ())
+    return [{'error': error} if error is not None else next(responses) for error in errors]
+
+
+def _merged_isochrones(requests: List[dict]) -> List[dict]:
+    # one search for all the requests of the origin, to the union of their nodes
+    first = requests[0]
+    dest_nodes = set(node for request in requests for node in request['dest_nodes'])
+    if first['type'] == 'multimodal_isochrone':
+        # the requests have the same limits, see _batch_key
+        res = MultiModalIsochrone(_stations(first)).get_isochrone(_graph, first['orig'], dest_nodes,
+                                                                  walking_time_limit=first.get('limit', 900),
+                                                                  bike_time_limit=first.get('bike_limit', 1800))
+        return [{'isochrone': [[node, res[node].secs] for node in request['dest_nodes'] if node in res]}
+                for request in requests]
+
+    # up to the largest limit, a node within it has the seconds of its shortest path whatever the other targets
+    res = _searches['isochrone'].get_isochrone(_graph, first['orig'], dest_nodes,
+                                               limit=max(request.get('limit', 900) for request in requests))
+    return [{'isochrone': [[node, res[node].secs] for node in request['dest_nodes']
+                           if node in res and res[node].secs <= request.get('limit', 900)]}
+            for request in requests]
+
+
+def _batch_key(request: dict) -> tuple:
+    # the limits of a multimodal isochrone bound its walking legs too, only the same ones are merged
+    if request['type'] == 'multimodal_isochrone':
+        return (request['type'], request['orig'], tuple(sorted(request.get('bss_nodes', ()))),
+                request.get('limit', 900), request.get('bike_limit', 1800))
+    return request['type'], request['orig']
+
+
+def run_batch(requests: List[dict]) -> List[dict]:
+    """
+    Answer requests of the same _batch_key, in a worker process
+    """
+    try:
+        if requests[0]['type'] in ('isochrone', 'multimodal_isochrone'):
+            return _isochrones(requests)
+    except Exception as e:
+        return [{'error': '{}: {}'.format(type(e).__name__, e)}] * len(requests)
+
+    responses = []
+    for request in requests:
+        try:
+            responses.append(_route(request))
+        except Exception as e:
+            responses.append({'error': '{}: {}'.format(type(e).__name__, e)})
+    return responses
+
+
+class QueryServer(object):
+
+    def __init__(self, source: str, workers: int = os.cpu_count()):
+        self._executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(source,))
+        self._workers = workers
+        # (request, future of its response)
+        self._queue: Optional[asyncio.Queue] = None
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        pending = set()
+
+        async def respond(request_id, future: asyncio.Future):
+            response = await future
+            response['id'] = request_id
+            async with lock:
+                writer.write((json.dumps(response) + '\n').encode())
+                await writer.drain()
+
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            loop = asyncio.get_event_loop()
+            future = loop.create_future()
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError('a request is a JSON object')
+            except ValueError as e:
+                request = {}
+                future.set_result({'error': str(e)})
+            else:
+                error = _request_error(request)
+                if error is not None:
+                    future.set_result({'error': error})
+                else:
+                    # blocks while the queue is full, the socket isn't read meanwhile
+                    await self._queue.put((request, future))
+            task = loop.create_task(respond(request.get('id'), future))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+
+        if pending:
+            await asyncio.wait(pending)
+        writer.close()
+
+    async def _run_group(self, group: List[Tuple[dict, asyncio.Future]], slots: asyncio.Semaphore):
+        try:
+            responses = await asyncio.get_event_loop().run_in_executor(self._executor, run_batch,
+                                                                       [request for request, _ in group])
+        except Exception as e:
+            responses = [{'error': '{}: {}'.format(type(e).__name__, e)}] * len(group)
+        finally:
+            slots.release()
+        for (_, future), response in zip(group, responses):
+            future.set_result(dict(response))
+
+    async def _dispatch(self):
+        loop = asyncio.get_event_loop()
+        # two batches per worker in flight: one running and one waiting in the pipe
+        slots = asyncio.Semaphore(2 * self._workers)
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + BATCH_WINDOW
+            while len(batch) < MAX_BATCH:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            groups: Dict[tuple, List[Tuple[dict, asyncio.Future]]] = {}
+            for request, future in batch:
+                # a request the connection let through mustn't stop the dispatcher, it gets its error
+                try:
+                    groups.setdefault(_batch_key(request), []).append((request, future))
+                except Exception as e:
+                    future.set_result({'error': '{}: {}'.format(type(e).__name__, e)})
+            for group in groups.values():
+                await slots.acquire()
+                loop.create_task(self._run_group(group, slots))
+
+    async def serve(self, address: str):
+        self._queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        if address.startswith('unix:'):
+            server = await asyncio.start_unix_server(self._handle_connection, path=address[len('unix:'):])
+        else:
+            host, port = address.rsplit(':', 1)
+            server = await asyncio.start_server(self._handle_connection, host, int(port))
+        dispatcher = asyncio.get_event_loop().create_task(self._dispatch())
+        print('listening on {} with {} workers'.format(address, self._workers))
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            dispatcher.cancel()
+            self._executor.shutdown()
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    address = sys.argv[2] if len(sys.argv) > 2 else '127.0.0.1:8765'
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else os.cpu_count()
+
+    # converted once here rather than by every worker at the same time
+    load_or_convert(source)
+    asyncio.run(QueryServer(source, workers).serve(address))
@@ -0,0 +1,71 @@
+import random
+import sys
+import time
+import tracemalloc
+
+from algorithms.graph_file import load_or_convert
+from algorithms.astar import AStar
+from algorithms.double_astar import DoubleAstar
+from algorithms.isochrone import Isocrhone
+from algorithms.landmarks import Landmarks
+
+# Labels per second and peak memory of the searches, on random queries of the binary graph.
+# The memory is measured in a second pass, tracemalloc slows the searches down too much to time them at once.
+#
+# The ALT searches are measured too when build_landmarks.py has been run on the graph.
+#
+# usage: python search_benchmark.py [data/network.graphml] [number of queries]
+
+SEARCHES = {
+    'astar': (lambda: AStar(),
+              lambda s, g, o, d: s.get_best_path(g, o, d),
+              lambda s: len(s._edge_labels)),
+    'double astar': (lambda: DoubleAstar(),
+                     lambda s, g, o, d: s.get_best_path(g, o, d),
+                     lambda s: len(s._edge_labels_forward) + len(s._edge_labels_backward)),
+    'isochrone': (lambda: Isocrhone(),
+                  lambda s, g, o, d: s.get_isochrone(g, o, {d}, limit=900),
+                  lambda s: len(s._edge_labels)),
+}
+
+
+def bench(g, queries, make, run, count):
+    labels = 0
+    elapsed = 0
+    for orig, dest in queries:
+        search = make()
+        start = time.perf_counter()
+        run(search, g, orig, dest)
+        elapsed += time.perf_counter() - start
+        labels += count(search)
+
+    peak = 0
+    for orig, dest in queries:
+        search = make()
+        tracemalloc.start()
+        run(search, g, orig, dest)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        del search
+
+    return labels / elapsed, peak, labels / len(queries)
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    queries = [(rnd.choice(osm_ids), rnd.choice(osm_ids)) for _ in range(query_count)]
+
+    landmarks = Landmarks.from_graph(graph)
+    if landmarks is not None:
+        SEARCHES['alt astar'] = (lambda: AStar(landmarks=landmarks), *SEARCHES['astar'][1:])
+        SEARCHES['alt double astar'] = (lambda: DoubleAstar(landmarks=landmarks), *SEARCHES['double astar'][1:])
+
+    print('{:>14} {:>14} {:>16} {:>16}'.format('search', 'labels/s', 'labels/query', 'peak memory (MB)'))
+    for name, (make, run, count) in SEARCHES.items():
+        rate, peak, per_query = bench(graph, queries, make, run, count)
+        print('{:>14} {:>14.0f} {:>16.0f} {:>16.2f}'.format(name, rate, per_query, peak / 1e6))
@@ -0,0 +1,77 @@
+import random
+import sys
+import time
+
+from algorithms.graph_file import load_or_convert
+from algorithms.label_store import PERMANENT
+from algorithms.multimodal_astar import MultiModalAStart
+from algorithms.multimodal_double_expansion_astart import MultiModalDoubleExpansionAStar
+
+# The stations reached by the walking searches of the multimodal queries, how many of them are dominated and not
+# seeded (seed_pruning.py), and the edges the bike searches settle with and without the pruning. The stations are
+# a random sample of the nodes, the denser they are the more of them are dominated.
+#
+# MultiModalAStart doesn't search the bike legs when build_station_table.py has been run on the graph, run it on a
+# graph without the table.
+#
+# usage: python seed_pruning_benchmark.py [data/network.graphml] [number of queries] [number of stations]
+
+SEARCHES = {
+    'multimodal astar': (lambda prune: MultiModalAStart(_prune_seeds=prune),
+                         lambda s: (s._double_astar._edges_status_forward, s._double_astar._edges_status_backward)),
+    'double expansion': (lambda prune: MultiModalDoubleExpansionAStar(_prune_seeds=prune),
+                         lambda s: (s._edges_status_bike_forward, s._edges_status_bike_backward)),
+}
+
+
+def total_secs(res) -> float:
+    if not res:
+        return float('inf')
+    secs = res[1]
+    return sum(secs) if isinstance(secs, tuple) else secs
+
+
+def bench(g, queries, bss_nodes, make, statuses, prune: bool):
+    seeds = pruned = settled = 0
+    elapsed = 0
+    results = []
+    for orig, dest in queries:
+        search = make(prune)
+        start = time.perf_counter()
+        try:
+            res = search.get_best_path(g, orig, dest, bss_nodes)
+        except Exception:
+            res = None
+        elapsed += time.perf_counter() - start
+        results.append(total_secs(res))
+        seeds += search._seed_stats.seeds
+        pruned += search._seed_stats.pruned
+        settled += sum(len(status.labels(PERMANENT)) for status in statuses(search) if status is not None)
+    n = len(queries)
+    return seeds / n, pruned / n, settled / n, elapsed / n, results
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    station_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    bss_nodes = set(rnd.sample(osm_ids, min(station_count, len(osm_ids))))
+    queries = [(rnd.choice(osm_ids), rnd.choice(osm_ids)) for _ in range(query_count)]
+
+    print('{:>18} {:>7} {:>12} {:>12} {:>16} {:>12} {:>16}'.format(
+        'search', 'pruning', 'seeds/query', 'pruned/query', 'settled/query', 's/query', 'faster/slower'))
+    for name, (make, statuses) in SEARCHES.items():
+        baseline = None
+        for prune in (False, True):
+            seeds, pruned, settled, elapsed, results = bench(graph, queries, bss_nodes, make, statuses, prune)
+            # the queries whose trip got faster or slower than without the pruning
+            changes = '' if baseline is None else '{}/{}'.format(
+                sum(a < b - 1e-6 for a, b in zip(results, baseline)),
+                sum(a > b + 1e-6 for a, b in zip(results, baseline)))
+            baseline = baseline or results
+            print('{:>18} {:>7} {:>12.1f} {:>12.1f} {:>16.0f} {:>12.3f} {:>16}'.format(
+                name, 'on' if prune else 'off', seeds, pruned, settled, elapsed, changes))
@@ -0,0 +1,76 @@
+import sys
+import time
+
+import numpy as np
+
+from algorithms.graph_file import load_or_convert
+from algorithms.geo import GridIndex, EdgeIndex, haversine, segment_distances
+from bss_locations_example import bss_locations
+
+# Snapping (lat, lon) locations to their nearest node: by a scan of all the nodes per location, and by the grid
+# index stored with the binary graph (convert_graphml.py builds it). The stations of bss_locations_example.py, then
+# random locations around the graph, with and without a radius. The nodes found have to be the same.
+# Then the same to the nearest edge, with the EdgeIndex.
+#
+# usage: python snap_benchmark.py [data/network.graphml] [number of random locations] [radius in metres]
+
+
+def scan(graph, lats, lons):
+    return np.array([np.argmin(haversine(graph.lats, graph.lons, lat, lon)) for lat, lon in zip(lats, lons)])
+
+
+def scan_edges(index: EdgeIndex, lats, lons):
+    arcs = np.unique(index.items)
+    sources, targets = index.sources[arcs], index.targets[arcs]
+    res = []
+    for lat, lon in zip(lats, lons):
+        metres, _ = segment_distances(np.full(len(arcs), lat), np.full(len(arcs), lon), index.lats[sources],
+                                      index.lons[sources], index.lats[targets], index.lons[targets])
+        res.append(arcs[np.argmin(metres)])
+    return np.array(res)
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    location_count = int(sys.argv[2]) if len(sys.argv) > 2 else 10000
+    radius = float(sys.argv[3]) if len(sys.argv) > 3 else 200.
+
+    graph = load_or_convert(source)
+    start = time.perf_counter()
+    index = GridIndex.build(graph)
+    edge_index = EdgeIndex.build(graph)
+    print('built the indexes of {} nodes and {} arcs in {:.4f}s'.format(graph.node_count, graph.edge_count,
+                                                                       time.perf_counter() - start))
+    index = GridIndex.from_graph(graph) or index
+    edge_index = EdgeIndex.from_graph(graph) or edge_index
+
+    rnd = np.random.RandomState(0)
+    stations = np.array(bss_locations)
+    random_lats = rnd.uniform(graph.lats.min(), graph.lats.max(), location_count)
+    random_lons = rnd.uniform(graph.lons.min(), graph.lons.max(), location_count)
+    runs = [('stations', stations[:, 0], stations[:, 1], index, lambda lats, lons: scan(graph, lats, lons)),
+            ('random', random_lats, random_lons, index, lambda lats, lons: scan(graph, lats, lons)),
+            ('edges', random_lats, random_lons, edge_index, lambda lats, lons: scan_edges(edge_index, lats, lons))]
+
+    failed = False
+    print('{:>10} {:>10} {:>10} {:>10} {:>12} {:>10}'.format('locations', 'count', 'scan (s)', 'grid (s)',
+                                                             'radius (s)', 'mismatches'))
+    for name, lats, lons, grid, run_scan in runs:
+        # the scan is timed on a sample, it would take too long on all the locations
+        sample = min(len(lats), 500)
+        start = time.perf_counter()
+        expected = run_scan(lats[:sample], lons[:sample])
+        scan_time = (time.perf_counter() - start) * len(lats) / sample
+
+        start = time.perf_counter()
+        items = grid.snap(lats, lons)[0]
+        grid_time = time.perf_counter() - start
+        start = time.perf_counter()
+        grid.snap(lats, lons, radius=radius)
+        radius_time = time.perf_counter() - start
+
+        mismatches = int((items[:sample] != expected).sum())
+        failed |= mismatches > 0
+        print('{:>10} {:>10} {:>10.3f} {:>10.3f} {:>12.3f} {:>10}'.format(name, len(lats), scan_time, grid_time,
+                                                                          radius_time, mismatches))
+    sys.exit(1 if failed else 0)
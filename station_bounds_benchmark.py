@@ -0,0 +1,81 @@
+import random
+import sys
+import time
+
+from algorithms.graph_file import load_or_convert
+from algorithms.label_store import PERMANENT
+from algorithms.multimodal_double_expansion_astart import MultiModalDoubleExpansionAStar
+from algorithms.multimodal_double_expansion_astart_one_queue import MultiModalDoubleExpansionAStarOneQueue
+from algorithms.station_bounds import ARTEFACT_NAME_PREFIX, build_station_bounds
+
+# The edges the multimodal double expansion searches settle with their great circle heuristic and with the lower
+# bound of the walk to the nearest station (station_bounds.py). The stations are a random sample of the nodes, the
+# bounds are built for them before the second run, like build_station_table.py stores them next to the graph.
+#
+# The one queue search doesn't have a heuristic by default, it's a Dijkstra without the bounds.
+#
+# usage: python station_bounds_benchmark.py [data/network.graphml] [number of queries] [number of stations]
+
+SEARCHES = {
+    'double expansion': (MultiModalDoubleExpansionAStar,
+                         lambda s: (s._edges_status_walking_forward, s._edges_status_walking_backward,
+                                    s._edges_status_bike_forward, s._edges_status_bike_backward)),
+    'one queue': (MultiModalDoubleExpansionAStarOneQueue, lambda s: (s._edges_status,)),
+}
+
+
+def total_secs(res) -> float:
+    return res[1] if res else float('inf')
+
+
+def bench(g, queries, bss_nodes, make, statuses):
+    settled = 0
+    elapsed = 0
+    results = []
+    for orig, dest in queries:
+        search = make()
+        start = time.perf_counter()
+        try:
+            res = search.get_best_path(g, orig, dest, bss_nodes)
+        except Exception:
+            res = None
+        elapsed += time.perf_counter() - start
+        results.append(total_secs(res))
+        settled += sum(len(status.labels(PERMANENT)) for status in statuses(search) if status is not None)
+    n = len(queries)
+    return settled / n, elapsed / n, results
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    station_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    bss_nodes = set(rnd.sample(osm_ids, min(station_count, len(osm_ids))))
+    queries = [(rnd.choice(osm_ids), rnd.choice(osm_ids)) for _ in range(query_count)]
+
+    # the bounds of the graph are replaced by the ones of the sample, and dropped for the first run
+    for name in [name for name in graph.artefacts if name.startswith(ARTEFACT_NAME_PREFIX)]:
+        del graph.artefacts[name]
+    start = time.time()
+    bounds = build_station_bounds(graph, bss_nodes)
+    print('bounds of {} stations in {:.2f}s, length factor {:.3f}'.format(
+        len(bounds.stations), time.time() - start, bounds.length_factor[0]))
+
+    print('{:>18} {:>7} {:>16} {:>12} {:>16}'.format('search', 'bounds', 'settled/query', 's/query',
+                                                     'faster/slower'))
+    results = {}
+    for with_bounds in (False, True):
+        if with_bounds:
+            graph.artefacts.update(bounds.to_artefacts())
+        for name, (make, statuses) in SEARCHES.items():
+            settled, elapsed, res = bench(graph, queries, bss_nodes, make, statuses)
+            # the queries whose trip got faster or slower than without the bounds
+            baseline = results.setdefault(name, res)
+            changes = '' if not with_bounds else '{}/{}'.format(
+                sum(a < b - 1e-6 for a, b in zip(res, baseline)), sum(a > b + 1e-6 for a, b in zip(res, baseline)))
+            print('{:>18} {:>7} {:>16.0f} {:>12.3f} {:>16}'.format(
+                name, 'on' if with_bounds else 'off', settled, elapsed, changes))
@@ -0,0 +1,52 @@
+import random
+import sys
+import time
+
+from algorithms.graph_file import load_or_convert
+from algorithms.multimodal_isochrone import MultiModalIsochrone, WALKING_SPEED, BIKE_SPEED
+from algorithms.station_table import build_station_reach, REACH_ARTEFACT_PREFIX
+
+# MultiModalIsochrone merges the reach of the stations stored with the graph, or searches the reach of the ones a
+# query needs when there is none. Runs the same queries both ways and checks that the results are the same dicts.
+# The stations are a random sample of the nodes, the reach is built for them in memory and the graph file is left
+# untouched.
+#
+# usage: python station_reach_check.py [data/network.graphml] [number of queries] [number of stations]
+#                                      [walking limit (s)] [bike limit (s)]
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    query_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    station_count = int(sys.argv[3]) if len(sys.argv) > 3 else 200
+    walking_limit = float(sys.argv[4]) if len(sys.argv) > 4 else 900
+    bike_limit = float(sys.argv[5]) if len(sys.argv) > 5 else 1800
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    bss_nodes = set(rnd.sample(osm_ids, min(station_count, len(osm_ids))))
+    origins = [rnd.choice(osm_ids) for _ in range(query_count)]
+    dest_nodes = set(osm_ids)
+
+    # a reach stored with the graph would be merged by both runs
+    for name in [name for name in graph.artefacts if name.startswith(REACH_ARTEFACT_PREFIX)]:
+        del graph.artefacts[name]
+    reach = build_station_reach(graph, bss_nodes, walking_limit * WALKING_SPEED, bike_limit * BIKE_SPEED)
+
+    def run(merged: bool):
+        if merged:
+            graph.artefacts.update(reach.to_artefacts())
+        start = time.perf_counter()
+        results = [MultiModalIsochrone(bss_nodes).get_isochrone(graph, orig, dest_nodes, walking_limit, bike_limit)
+                   for orig in origins]
+        elapsed = time.perf_counter() - start
+        for name in reach.to_artefacts():
+            graph.artefacts.pop(name, None)
+        return results, elapsed
+
+    searched, search_secs = run(merged=False)
+    merged, merge_secs = run(merged=True)
+    mismatches = sum(a != b for a, b in zip(searched, merged))
+    print('{} queries, {} nodes reached, {} mismatches, searched {:.3f}s/query, merged {:.3f}s/query'.format(
+        query_count, sum(map(len, merged)), mismatches, search_secs / query_count, merge_secs / query_count))
+    sys.exit(1 if mismatches else 0)
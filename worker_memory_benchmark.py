@@ -0,0 +1,106 @@
+import multiprocessing
+import os
+import random
+import sys
+
+import osmnx
+
+from algorithms.graph import as_compiled
+from algorithms.graph_file import load_or_convert, default_graph_path
+from algorithms.contraction import ContractionHierarchy
+from algorithms.ch_query import ContractionHierarchyQuery
+from algorithms.astar import AStar
+from algorithms.isochrone import Isocrhone
+
+# The memory of N worker processes answering queries on the same graph, the way query_server.py runs them:
+#
+#   none     the workers don't load anything, the floor of a forked python process
+#   graphml  every worker parses the graphml and searches on the networkx graph, what the scripts do
+#   fork     the networkx graph is parsed once and the workers are forked: the pages are shared until the reference
+#            counts of its python objects are written, i.e. as soon as a search reads them
+#   binary   every worker memory maps the binary graph, its pages and the ones of the artefacts are shared. When
+#            the graph has a contraction hierarchy, the workers run a ContractionHierarchyQuery too.
+#
+# Rss counts the shared pages in every worker, Pss divides them by the number of processes mapping them: the sum
+# of the Pss of the workers is what they use together. Linux only, the numbers come from /proc/self/smaps_rollup.
+#
+# usage: python worker_memory_benchmark.py [data/network.graphml] [max number of workers] [number of queries]
+
+MODES = ('none', 'graphml', 'fork', 'binary')
+
+# the graph of the fork mode, parsed before the workers are forked
+_parsed = None
+
+
+def memory() -> dict:
+    # kB -> MB
+    res = {}
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            fields = line.split()
+            if fields[0] in ('Rss:', 'Pss:'):
+                res[fields[0][:-1]] = int(fields[1]) / 1024
+    return res
+
+
+def parse(source: str):
+    folder, filename = os.path.split(os.path.abspath(source))
+    return osmnx.load_graphml(filename=filename, folder=folder)
+
+
+def worker(mode: str, source: str, queries, barrier, results):
+    if mode == 'graphml':
+        graph = parse(source)
+    elif mode == 'fork':
+        graph = _parsed
+    elif mode == 'binary':
+        graph = load_or_convert(source)
+
+    for orig, dest in queries if mode != 'none' else ():
+        AStar().get_best_path(graph, orig, dest)
+        Isocrhone().get_isochrone(graph, orig, [dest], limit=900)
+        if ContractionHierarchy.from_graph(as_compiled(graph)) is not None:
+            ContractionHierarchyQuery().get_best_path(graph, orig, dest)
+
+    # all the workers are alive when they're measured, the shared pages are divided between all of them
+    barrier.wait()
+    results.put(memory())
+    barrier.wait()
+
+
+def measure(mode: str, source: str, queries, worker_count: int):
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(worker_count)
+    results = context.Queue()
+    workers = [context.Process(target=worker, args=(mode, source, queries, barrier, results))
+               for _ in range(worker_count)]
+    for process in workers:
+        process.start()
+    res = [results.get() for _ in workers]
+    for process in workers:
+        process.join()
+    return res
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else 'data/network.graphml'
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    query_count = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+
+    graph = load_or_convert(source)
+    rnd = random.Random(0)
+    osm_ids = graph.osm_ids.tolist()
+    queries = [(rnd.choice(osm_ids), rnd.choice(osm_ids)) for _ in range(query_count)]
+    print('binary graph {}, {} nodes'.format(default_graph_path(source), graph.node_count))
+
+    print('{:>8} {:>8} {:>16} {:>16} {:>12}'.format('mode', 'workers', 'rss/worker (MB)', 'pss/worker (MB)',
+                                                     'total (MB)'))
+    for mode in MODES:
+        _parsed = parse(source) if mode == 'fork' else None
+        worker_count = 1
+        while worker_count <= max_workers:
+            res = measure(mode, source, queries, worker_count)
+            print('{:>8} {:>8} {:>16.1f} {:>16.1f} {:>12.1f}'.format(
+                mode, worker_count, sum(r['Rss'] for r in res) / worker_count,
+                sum(r['Pss'] for r in res) / worker_count, sum(r['Pss'] for r in res)))
+            worker_count *= 2